@@ -0,0 +1,114 @@
+import asyncio
+import json
+import re
+from typing import Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from langchain_core.documents import Document
+
+from api import logs
+from api.ai.generation import get_analysis_map_chain, get_analysis_generation_parameters
+from api.ai.unit_tests import generation_slots
+from api.data.response_cache import get_response_cache, response_key
+from api.data.types import DataType
+from api.data.vectorstore import get_all_chunks, get_vectorstore
+from api.env import ANALYSIS_MAX_CHUNKS, ANALYSIS_RELEVANT_CHUNKS
+
+logger = logs.get_logger(__name__)
+
+DEFAULT_ANALYSIS_REQUEST = "Find bad practices and security vulnerabilities in the source code in context."
+
+
+class InvalidFindings(ValueError):
+    pass
+
+
+def parse_findings(answer: str) -> Dict[str, str]:
+    """Parses the JSON dictionary of findings the model was asked for, tolerating fences and text around it."""
+    start, end = answer.find('{'), answer.rfind('}')
+    if start == -1 or end < start:
+        if not answer.replace('```', '').replace('json', '').strip():
+            return {}
+        raise InvalidFindings(f"No JSON object in answer: {answer[:200]!r}")
+    try:
+        findings = json.loads(answer[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise InvalidFindings(f"Invalid JSON in answer: {e}") from e
+    if not isinstance(findings, dict):
+        raise InvalidFindings(f"Expected a JSON object, got {type(findings).__name__}")
+    return {str(name).strip(): value if isinstance(value, str) else json.dumps(value)
+            for name, value in findings.items() if str(name).strip()}
+
+
+def finding_key(name: str) -> str:
+    """Findings from different chunks are the same if their names only differ in case, spacing or punctuation."""
+    return re.sub(r'[\W_]+', ' ', name).strip().casefold()
+
+
+def merge_findings(chunk_findings: List[Dict[str, str]]) -> Dict[str, str]:
+    """Merges per-chunk findings by vulnerability name, keeping each distinct description once."""
+    names: Dict[str, str] = {}
+    descriptions: Dict[str, List[str]] = {}
+    for findings in chunk_findings:
+        for name, description in findings.items():
+            key = finding_key(name)
+            names.setdefault(key, name)
+            known = descriptions.setdefault(key, [])
+            if description.strip() and description.strip() not in known:
+                known.append(description.strip())
+    return {names[key]: "\n".join(descriptions[key]) for key in names}
+
+
+async def select_chunks(request: Optional[str]) -> List[Document]:
+    """The chunks most relevant to `request`, or every source code chunk (up to ANALYSIS_MAX_CHUNKS)
+    if there is no request."""
+    if request is None:
+        return await run_in_threadpool(get_all_chunks, DataType.SOURCE_CODE, ANALYSIS_MAX_CHUNKS)
+    retriever = get_vectorstore(DataType.SOURCE_CODE).as_retriever(search_kwargs={"k": ANALYSIS_RELEVANT_CHUNKS})
+    return await run_in_threadpool(retriever.invoke, request)
+
+
+class ChunkAnalysis:
+    """Map-reduce analysis: every chunk is analyzed on its own, concurrently, then the findings are merged.
+
+    Findings are cached per chunk, keyed by the chunk's content hash, the request and the model, so
+    re-analyzing a repository only sends the chunks of changed files to the LLM.
+    """
+
+    def __init__(self, request: Optional[str]):
+        self.request = request or DEFAULT_ANALYSIS_REQUEST
+        self.stats = {"chunks": 0, "cached": 0, "analyzed": 0, "failed": 0}
+
+    async def _analyze(self, chunk: Document) -> Dict[str, str]:
+        chain_input = {"input": self.request, "chat_history": []}
+        cache = get_response_cache()
+        # Keyed and stored by content only, without the file_id: an unchanged chunk of a re-uploaded
+        # file is still a hit, and replacing or deleting a file does not drop its chunks' findings
+        content = [Document(page_content=chunk.page_content)]
+        key = response_key({**chain_input, **get_analysis_generation_parameters(), "task": "analysis"}, content)
+        cached = await run_in_threadpool(cache.get, key) if cache is not None else None
+        if cached is not None:
+            self.stats["cached"] += 1
+            return json.loads(cached)
+
+        try:
+            async with generation_slots():
+                answer = await get_analysis_map_chain().ainvoke({**chain_input, "context": chunk.page_content})
+            findings = parse_findings(answer)
+        except Exception as e:
+            # One bad chunk should not fail the whole analysis; it is retried on the next run
+            logger.warning(f"Analysis of a chunk of file_id {chunk.metadata.get('file_id')} failed: {e}")
+            self.stats["failed"] += 1
+            return {}
+
+        self.stats["analyzed"] += 1
+        if cache is not None:
+            await run_in_threadpool(cache.put, key, json.dumps(findings), content)
+        return findings
+
+    async def run(self, chunks: List[Document]) -> Dict[str, str]:
+        self.stats["chunks"] = len(chunks)
+        chunk_findings = await asyncio.gather(*(self._analyze(chunk) for chunk in chunks))
+        summary = merge_findings(chunk_findings)
+        self.stats["findings"] = len(summary)
+        return summary
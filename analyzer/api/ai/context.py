@@ -0,0 +1,182 @@
+import math
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
+from langchain_core.outputs import LLMResult
+
+from api.data.embedding_cache import chunk_hash
+from api.env import CONTEXT_TOKEN_BUDGET, CONTEXT_CHARS_PER_TOKEN
+
+# The text splitter overlaps chunks by up to 250 characters; look a bit further to be safe
+MAX_OVERLAP = 300
+MIN_OVERLAP = 20
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count. Ollama does not expose its tokenizer, and the exact count is reported after the call."""
+    return math.ceil(len(text) / CONTEXT_CHARS_PER_TOKEN)
+
+
+def _text_overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of `first` that is a prefix of `second`, if it looks like splitter overlap."""
+    for length in range(min(len(first), len(second), MAX_OVERLAP), MIN_OVERLAP - 1, -1):
+        if first.endswith(second[:length]):
+            return length
+    return 0
+
+
+@dataclass
+class _Block:
+    """Adjacent chunks of one file, merged. `rank` is the best retrieval rank of its chunks."""
+    file_id: Any
+    text: str
+    rank: int
+    start: Optional[int]
+    metadata: dict
+    chunks: int = 1
+
+    @property
+    def end(self) -> Optional[int]:
+        return self.start + len(self.text) if self.start is not None else None
+
+
+@dataclass
+class ContextStats:
+    retrieved_chunks: int = 0
+    duplicate_chunks: int = 0
+    merged_chunks: int = 0
+    packed_blocks: int = 0
+    dropped_blocks: int = 0
+    context_tokens: int = 0
+    budget_tokens: int = 0
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+class ContextAssembler:
+    """Builds the `{context}` of a prompt from retrieved chunks within a token budget.
+
+    Exact duplicates are dropped, and chunks of the same file that overlap or touch are merged,
+    by `start_index` where the splitter recorded it and by their overlapping text otherwise.
+    The resulting blocks are packed in retrieval order (most relevant first) as long as they fit
+    into `budget` tokens; a block that does not fit is skipped in favour of smaller ones after it.
+    """
+
+    def __init__(self, budget: int = CONTEXT_TOKEN_BUDGET, count_tokens: Callable[[str], int] = estimate_tokens):
+        self.budget = budget
+        self.count_tokens = count_tokens
+
+    def assemble(self, documents: List[Document]) -> Tuple[List[Document], ContextStats]:
+        stats = ContextStats(retrieved_chunks=len(documents), budget_tokens=self.budget)
+
+        seen = set()
+        blocks: List[_Block] = []
+        for rank, doc in enumerate(documents):
+            hash_ = chunk_hash(doc.page_content)
+            if hash_ in seen:
+                stats.duplicate_chunks += 1
+                continue
+            seen.add(hash_)
+            blocks.append(_Block(doc.metadata.get('file_id'), doc.page_content, rank,
+                                 doc.metadata.get('start_index'), dict(doc.metadata)))
+
+        blocks = self._merge(blocks, stats)
+
+        packed, used = [], 0
+        for block in sorted(blocks, key=lambda b: b.rank):
+            tokens = self.count_tokens(block.text)
+            if used + tokens > self.budget:
+                stats.dropped_blocks += 1
+                continue
+            packed.append(block)
+            used += tokens
+        stats.packed_blocks = len(packed)
+        stats.context_tokens = used
+
+        return [Document(page_content=block.text, metadata=dict(block.metadata, merged_chunks=block.chunks))
+                for block in packed], stats
+
+    def _merge(self, blocks: List[_Block], stats: ContextStats) -> List[_Block]:
+        by_file: Dict[Any, List[_Block]] = {}
+        for block in blocks:
+            by_file.setdefault(block.file_id, []).append(block)
+
+        merged = []
+        for file_id, file_blocks in by_file.items():
+            if file_id is None:
+                merged.extend(file_blocks)
+                continue
+            positioned = sorted((b for b in file_blocks if b.start is not None), key=lambda b: b.start)
+            merged.extend(self._merge_positioned(positioned, stats))
+            merged.extend(self._merge_by_text([b for b in file_blocks if b.start is None], stats))
+        return merged
+
+    @staticmethod
+    def _absorb(target: _Block, other: _Block, text: str):
+        target.text = text
+        target.rank = min(target.rank, other.rank)
+        target.chunks += other.chunks
+
+    def _merge_positioned(self, blocks: List[_Block], stats: ContextStats) -> List[_Block]:
+        result: List[_Block] = []
+        for block in blocks:
+            last = result[-1] if result else None
+            if last is not None and block.start <= last.end:
+                self._absorb(last, block, last.text + block.text[last.end - block.start:])
+                stats.merged_chunks += 1
+            else:
+                result.append(block)
+        return result
+
+    def _merge_by_text(self, blocks: List[_Block], stats: ContextStats) -> List[_Block]:
+        result = list(blocks)
+        merged_any = True
+        while merged_any:
+            merged_any = False
+            for first in result:
+                for second in result:
+                    if first is second:
+                        continue
+                    overlap = _text_overlap(first.text, second.text)
+                    if overlap:
+                        self._absorb(first, second, first.text + second.text[overlap:])
+                        result.remove(second)
+                        stats.merged_chunks += 1
+                        merged_any = True
+                        break
+                if merged_any:
+                    break
+        return result
+
+
+class PromptStatsCallback(BaseCallbackHandler):
+    """Collects prompt size and prefill time that Ollama reports with every answer."""
+
+    def __init__(self):
+        self.stats: Dict[str, Any] = {}
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, 'message', None)
+                info = (getattr(message, 'response_metadata', None) or generation.generation_info or {})
+                if 'prompt_eval_count' in info or 'prompt_eval_duration' in info:
+                    self.stats = {
+                        "prompt_tokens": info.get('prompt_eval_count'),
+                        "prefill_seconds": round(info.get('prompt_eval_duration', 0) / 1e9, 3),
+                        "output_tokens": info.get('eval_count'),
+                        "generation_seconds": round(info.get('eval_duration', 0) / 1e9, 3),
+                    }
+
+
+@dataclass
+class PromptReport:
+    """What went into one prompt: the context assembly and, after the call, what Ollama reported."""
+    context: ContextStats
+    callback: PromptStatsCallback = field(default_factory=PromptStatsCallback)
+
+    def to_dict(self) -> dict:
+        return {**self.context.to_dict(), **self.callback.stats}
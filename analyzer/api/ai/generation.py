@@ -1,40 +1,54 @@
+import threading
+import time
+from typing import Any, Callable
+
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains.history_aware_retriever import create_history_aware_retriever
 from langchain.chains.retrieval import create_retrieval_chain
 from langchain.retrievers import EnsembleRetriever
 from langchain_core.language_models import BaseChatModel
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.retrievers import BaseRetriever
 from langchain_core.runnables import Runnable
 from langchain_core.vectorstores import VectorStoreRetriever
 from langchain_ollama import ChatOllama
 
+from api import logs
+from api.ai.retrieval import HybridRetriever
 from api.data.types import DataType
-from api.data.vectorstore import get_vectorstore
+from api.data.lexical_index import get_lexical_index
+from api.data.retrieval_cache import get_retrieval_cache
+from api.data.vectorstore import get_vectorstore, get_embeddings, get_collection_name, sync_lexical_index
 from api.env import *
 
 
-def __get_retriever(dtype: DataType, num_docs: int) -> VectorStoreRetriever:
-    return get_vectorstore(dtype).as_retriever(search_kwargs={"k": num_docs})
+logger = logs.get_logger(__name__)
 
+# Chains, retrievers and LLM clients by configuration, built on first use and shared by all requests
+__registry: dict[tuple, Any] = {}
+__registry_lock = threading.RLock()
 
-# To allow us to change llm provider later
-def __get_llm(**kwargs) -> BaseChatModel:
-    return ChatOllama(model=LLM_MODEL, num_predict=LLM_OUTPUT_TOKEN_LIMIT, **kwargs)
 
+def __registered(key: tuple, build: Callable[[], Any]) -> Any:
+    # Reentrant, since builders get their parts from the registry as well
+    with __registry_lock:
+        if key not in __registry:
+            __registry[key] = build()
+        return __registry[key]
 
-contextualize_q_system_prompt = (
-    "Given a chat history and the latest user question "
-    "which might reference context in the chat history, "
-    "formulate a standalone question which can be understood "
-    "without the chat history. Do NOT answer the question, "
-    "just reformulate it if needed and otherwise return it as is."
-)
 
-contextualize_q_prompt = ChatPromptTemplate.from_messages([
-    ("system", contextualize_q_system_prompt),
-    MessagesPlaceholder("chat_history"),
-    ("human", "{input}"),
-])
+def __get_retriever(dtype: DataType, num_docs: int) -> VectorStoreRetriever:
+    return __registered(("retriever", dtype, num_docs),
+                        lambda: get_vectorstore(dtype).as_retriever(search_kwargs={"k": num_docs}))
+
+
+# To allow us to change llm provider later
+# One client per configuration, so requests share its pool of HTTP connections to Ollama
+def __get_llm(temperature: float) -> BaseChatModel:
+    return __registered(("llm", LLM_MODEL, LLM_OUTPUT_TOKEN_LIMIT, temperature),
+                        lambda: ChatOllama(model=LLM_MODEL, num_predict=LLM_OUTPUT_TOKEN_LIMIT,
+                                           temperature=temperature))
+
 
 analysis_prompt = ChatPromptTemplate.from_messages([
     ("system", "You are assistant that analyzes given code for bad practices and security vulnerabilities. "
@@ -59,27 +73,97 @@ unit_test_writing_prompt = ChatPromptTemplate.from_messages([
 ])
 
 
-def get_analysis_rag_chain() -> Runnable:
-    llm = __get_llm(temperature=0.15)
+ANALYSIS_TEMPERATURE = 0.15
+UNIT_TESTS_TEMPERATURE = 0.05
+UNIT_TESTS_NUM_DOCS = 10
 
-    code_retriever = __get_retriever(DataType.SOURCE_CODE, 20)
 
-    history_aware_retriever = create_history_aware_retriever(llm, code_retriever, contextualize_q_prompt)
-    question_answer_chain = create_stuff_documents_chain(llm, analysis_prompt)
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)    
-    return rag_chain
+# Analyzes the single chunk passed as "context"; answers with a JSON dictionary of findings
+def build_analysis_map_chain(llm: BaseChatModel) -> Runnable:
+    return analysis_prompt | llm | StrOutputParser()
 
 
-def get_unit_tests_rag_chain() -> Runnable:
-    llm = __get_llm(temperature=0.05)
+def build_unit_tests_retriever(num_docs: int) -> BaseRetriever:
+    lexical_index = get_lexical_index()
+    if lexical_index is not None:
+        dtypes = [DataType.SOURCE_CODE, DataType.REQUIREMENTS]
+        for dtype in dtypes:
+            sync_lexical_index(dtype)
+        return HybridRetriever(
+            vectorstores={get_collection_name(dtype): get_vectorstore(dtype) for dtype in dtypes},
+            weights={get_collection_name(dtype): 0.5 for dtype in dtypes},
+            lexical_index=lexical_index, embeddings=get_embeddings(), k=num_docs,
+            rrf_k=HYBRID_RRF_K, lexical_margin=HYBRID_LEXICAL_MARGIN, cache=get_retrieval_cache())
 
-    code_retriever = __get_retriever(DataType.SOURCE_CODE, 10)
-    requirements_retriever = __get_retriever(DataType.REQUIREMENTS, 10)
+    code_retriever = __get_retriever(DataType.SOURCE_CODE, num_docs)
+    requirements_retriever = __get_retriever(DataType.REQUIREMENTS, num_docs)
 
-    ensemble_retriever = EnsembleRetriever(
+    return EnsembleRetriever(
         retrievers=[code_retriever, requirements_retriever], weights=[0.5, 0.5]
     )
 
-    question_answer_chain = create_stuff_documents_chain(llm, unit_test_writing_prompt)
-    rag_chain = create_retrieval_chain(ensemble_retriever, question_answer_chain)
-    return rag_chain
\ No newline at end of file
+
+# Takes the retrieved documents as "context" and returns the answer as a string
+def build_unit_tests_answer_chain(llm: BaseChatModel) -> Runnable:
+    return create_stuff_documents_chain(llm, unit_test_writing_prompt)
+
+
+def get_analysis_map_chain() -> Runnable:
+    return __registered(("analysis_map", LLM_MODEL, ANALYSIS_TEMPERATURE),
+                        lambda: build_analysis_map_chain(__get_llm(ANALYSIS_TEMPERATURE)))
+
+
+# Everything that changes the findings for the same chunk
+def get_analysis_generation_parameters() -> dict:
+    return {
+        "model": LLM_MODEL,
+        "output_token_limit": LLM_OUTPUT_TOKEN_LIMIT,
+        "temperature": ANALYSIS_TEMPERATURE,
+        "prompt": analysis_prompt.pretty_repr(),
+    }
+
+
+def get_unit_tests_retriever() -> BaseRetriever:
+    return __registered(("unit_tests_retriever", UNIT_TESTS_NUM_DOCS),
+                        lambda: build_unit_tests_retriever(UNIT_TESTS_NUM_DOCS))
+
+
+def get_unit_tests_answer_chain() -> Runnable:
+    return __registered(("unit_tests_answer", LLM_MODEL, UNIT_TESTS_TEMPERATURE),
+                        lambda: build_unit_tests_answer_chain(__get_llm(UNIT_TESTS_TEMPERATURE)))
+
+
+def get_unit_tests_rag_chain() -> Runnable:
+    return __registered(("unit_tests", LLM_MODEL, UNIT_TESTS_TEMPERATURE, UNIT_TESTS_NUM_DOCS),
+                        lambda: create_retrieval_chain(get_unit_tests_retriever(), get_unit_tests_answer_chain()))
+
+
+# Everything that changes the answer for the same request and context
+def get_unit_tests_generation_parameters() -> dict:
+    return {
+        "model": LLM_MODEL,
+        "output_token_limit": LLM_OUTPUT_TOKEN_LIMIT,
+        "temperature": UNIT_TESTS_TEMPERATURE,
+        "prompt": unit_test_writing_prompt.pretty_repr(),
+    }
+
+
+def warm_up_models():
+    """Builds all chains and has Ollama load the LLM and the embedding model.
+
+    Meant to run once at startup, so the first request neither builds chains nor waits for a model
+    to be loaded into memory.
+    """
+    try:
+        started = time.perf_counter()
+        get_analysis_map_chain()
+        get_unit_tests_rag_chain()
+        logger.info(f"Built RAG chains in {time.perf_counter() - started:.3f}s")
+
+        started = time.perf_counter()
+        get_embeddings().embed_query("warm-up")
+        # A one-token answer is enough to get the model loaded
+        ChatOllama(model=LLM_MODEL, num_predict=1).invoke("Hi")
+        logger.info(f"Warmed up {LLM_MODEL} in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        logger.warning(f"Model warm-up failed, the first request will load the models: {e}")
@@ -0,0 +1,116 @@
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+
+from api import logs
+from api.data.embedding_cache import chunk_hash
+from api.data.lexical_index import LexicalIndex, searchable_text
+from api.data.retrieval_cache import RetrievalCache
+
+logger = logs.get_logger(__name__)
+
+# Names in a query that can only be code: `quoted`, dotted, camelCase, PascalCase with a second capital, snake_case
+SYMBOL = re.compile(r'`([^`\s]+)`|(?<![\w.])([A-Za-z_]\w*(?:\.[A-Za-z_]\w*)+|[a-z]+[A-Z]\w*|[A-Z]+[a-z0-9]+[A-Z]\w*'
+                    r'|[A-Za-z]\w*_\w+)(?![\w.])')
+SYMBOL_PART = re.compile(r'[A-Za-z_]\w*')
+
+
+def query_symbols(query: str) -> List[str]:
+    """The identifiers a query names, with qualified names broken into their parts
+    (`OrderService.refund` gives `OrderService` and `refund`)."""
+    parts = []
+    for match in SYMBOL.finditer(query):
+        parts.extend(SYMBOL_PART.findall(match.group(1) or match.group(2)))
+    return list(dict.fromkeys(parts))
+
+
+def _key(document: Document):
+    # Chroma ids are shared by both indexes; the content identifies chunks from elsewhere
+    return document.id or (document.metadata.get('file_id'), chunk_hash(document.page_content))
+
+
+def reciprocal_rank_fusion(rankings: List[Tuple[List[Document], float]], rrf_k: int) -> List[Document]:
+    """Merges ranked lists of (documents, weight) by weighted reciprocal rank: a document scores
+    weight / (rrf_k + rank) in every list it appears in."""
+    scores: Dict[object, float] = {}
+    documents: Dict[object, Document] = {}
+    for ranking, weight in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = _key(document)
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank)
+            documents.setdefault(key, document)
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class HybridRetriever(BaseRetriever):
+    """Searches the BM25 index and the vector store of every collection and fuses the rankings.
+
+    The query is embedded once for all collections. A query that names code symbols
+    (`OrderService.refund`, `parse_header`) is answered from the lexical index alone when its
+    result is decisive: the best hit of a collection contains every symbol as a whole word and
+    scores at least `lexical_margin` times the best hit that does not (with the default of 1, the
+    chunks naming all symbols simply rank first). Like the EnsembleRetriever it replaces,
+    it returns up to `k` chunks per collection.
+
+    With a `cache`, the query embedding and the lexical and vector results of every collection
+    are looked up there first, so a repeated request neither embeds nor searches.
+    """
+
+    vectorstores: Dict[str, VectorStore]
+    weights: Dict[str, float]
+    lexical_index: LexicalIndex
+    embeddings: Embeddings
+    k: int = 10
+    rrf_k: int = 60
+    lexical_margin: float = 1.0
+    cache: Optional[RetrievalCache] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        lexical = {name: self._search(name, 'lexical', query,
+                                      lambda name=name: self.lexical_index.search(name, query, self.k))
+                   for name in self.vectorstores}
+        rankings = [([document for document, _ in lexical[name]], self.weights[name]) for name in self.vectorstores]
+
+        symbols = query_symbols(query)
+        decisive = [name for name, results in lexical.items() if self._is_decisive(results, symbols)]
+        if decisive:
+            logger.debug(f"Lexical hit for {symbols} in {decisive} is decisive, skipping the query embedding")
+        else:
+            # Embedded for the first vector search that is not cached, and only once
+            embedding: List[List[float]] = []
+
+            def similar(vectorstore: VectorStore) -> List[Document]:
+                if not embedding:
+                    embedding.append(self._embed(query))
+                return vectorstore.similarity_search_by_vector(embedding[0], k=self.k)
+
+            rankings += [(self._search(name, 'vector', query, lambda vectorstore=vectorstore: similar(vectorstore)),
+                          self.weights[name]) for name, vectorstore in self.vectorstores.items()]
+
+        return reciprocal_rank_fusion(rankings, self.rrf_k)[:self.k * len(self.vectorstores)]
+
+    def _search(self, collection: str, kind: str, query: str, search: Callable[[], list]) -> list:
+        if self.cache is None:
+            return search()
+        return self.cache.results(collection, kind, self.k, query, search)
+
+    def _embed(self, query: str) -> List[float]:
+        if self.cache is None:
+            return self.embeddings.embed_query(query)
+        return self.cache.embedding(query, self.embeddings.embed_query)
+
+    def _is_decisive(self, results: List[Tuple[Document, float]], symbols: List[str]) -> bool:
+        def names_all(document: Document) -> bool:
+            text = searchable_text(document)
+            return all(re.search(rf'\b{re.escape(symbol)}\b', text) for symbol in symbols)
+
+        if not symbols or not results or not names_all(results[0][0]):
+            return False
+        # The chunks naming every symbol must clearly beat the best one that does not
+        other = next((score for document, score in results if not names_all(document)), None)
+        return other is None or results[0][1] >= self.lexical_margin * other
@@ -0,0 +1,31 @@
+import json
+
+FENCE = '```'
+
+
+class FenceStripper:
+    """Removes markdown code fences from text that arrives in pieces, e.g. streamed tokens.
+
+    Same result as `str.replace(text, '```', '')` on the whole text: backticks at the end of a
+    piece are held back until the next piece shows whether they start a fence.
+    """
+
+    def __init__(self):
+        self._pending = ''
+
+    def feed(self, piece: str) -> str:
+        text = (self._pending + piece).replace(FENCE, '')
+        held = len(text) - len(text.rstrip('`'))
+        # Fewer than three trailing backticks may still become a fence
+        held = min(held, len(FENCE) - 1)
+        self._pending = text[len(text) - held:] if held else ''
+        return text[:len(text) - held]
+
+    def flush(self) -> str:
+        text, self._pending = self._pending, ''
+        return text
+
+
+def sse_event(event: str, data) -> str:
+    """Formats one server-sent event; `data` is sent as JSON, so newlines in tokens survive."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,206 @@
+import asyncio
+import time
+import uuid
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from langchain_core.documents import Document
+
+from api import logs
+from api.ai.context import ContextAssembler, PromptReport
+from api.ai.generation import get_unit_tests_retriever, get_unit_tests_answer_chain, \
+    get_unit_tests_generation_parameters
+from api.data import async_db
+from api.data.code_graph import graph_violations_for
+from api.data.response_cache import get_response_cache, response_key, CACHE_HIT, CACHE_MISS, CACHE_BYPASS
+from api.dto import UnitTestRequest
+from api.env import GENERATION_CONCURRENCY, CONTEXT_MAX_VIOLATIONS
+
+logger = logs.get_logger(__name__)
+
+BATCH_SUCCEEDED = 'succeeded'
+BATCH_FAILED = 'failed'
+BATCH_CANCELLED = 'cancelled'
+
+# Bounds the generations running against the LLM backend, over all endpoints and requests
+__generation_slots: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+
+
+__context_assembler = ContextAssembler()
+
+
+def generation_slots() -> asyncio.Semaphore:
+    # A semaphore belongs to one event loop; normally there is only one
+    loop = asyncio.get_running_loop()
+    if loop not in __generation_slots:
+        __generation_slots.clear()
+        __generation_slots[loop] = asyncio.Semaphore(GENERATION_CONCURRENCY)
+    return __generation_slots[loop]
+
+
+def unit_tests_input(request: UnitTestRequest) -> dict:
+    return {
+        "input": f"strictly follow system instructions and write unit tests for {'all source code in context' if request.request is None else request.request}",
+        "language": request.language,
+        "framework": request.framework,
+    }
+
+
+def _retrieve_context(query: str) -> List[Document]:
+    chunks = get_unit_tests_retriever().invoke(query)
+    # Static analysis findings for exactly the retrieved code, from the code graph index
+    return chunks + graph_violations_for(chunks, CONTEXT_MAX_VIOLATIONS)
+
+
+async def retrieve_context(query: str) -> List[Document]:
+    return await run_in_threadpool(_retrieve_context, query)
+
+
+async def lookup_answer(chain_input: dict, context: List[Document], cache_control: Optional[str]):
+    """Looks for a cached answer. Returns (cache key, answer or None, cache status)."""
+    cache = get_response_cache()
+    key = response_key({**chain_input, **get_unit_tests_generation_parameters()}, context)
+    use_cache = cache is not None and 'no-cache' not in (cache_control or '')
+    answer = await run_in_threadpool(cache.get, key) if use_cache else None
+    cache_status = CACHE_HIT if answer is not None else CACHE_MISS if use_cache else CACHE_BYPASS
+    return key, answer, cache_status
+
+
+async def cache_answer(key: str, answer: str, context: List[Document]):
+    cache = get_response_cache()
+    if cache is not None:
+        await run_in_threadpool(cache.put, key, answer, context)
+
+
+def assemble_context(context: List[Document]) -> Tuple[List[Document], PromptReport]:
+    """Dedupes, merges and packs the retrieved chunks into the context token budget."""
+    packed, stats = __context_assembler.assemble(context)
+    return packed, PromptReport(stats)
+
+
+async def generate(chain_input: dict, context: List[Document]) -> Tuple[str, dict]:
+    """Returns the answer and the prompt report (context assembly, prompt tokens and prefill time)."""
+    packed, report = assemble_context(context)
+    async with generation_slots():
+        answer = await get_unit_tests_answer_chain().ainvoke({**chain_input, "context": packed},
+                                                             config={"callbacks": [report.callback]})
+
+    # markdown stuff
+    return str.replace(answer, '```', ''), report.to_dict()
+
+
+class UnitTestBatch:
+    """Generates unit tests for many requests at once and yields each result as soon as it is done.
+
+    Requests with the same text share one retrieval, and requests that come down to the same
+    cache key share one generation. Generations still queue for the global generation slots.
+    Whatever is unfinished when the deadline passes or `cancel` is called is cancelled.
+    """
+
+    def __init__(self, requests: List[UnitTestRequest], deadline: float, cache_control: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.requests = requests
+        self.deadline = deadline
+        self.cache_control = cache_control
+        self.started_at = time.monotonic()
+        self.counts = {BATCH_SUCCEEDED: 0, BATCH_FAILED: 0, BATCH_CANCELLED: 0}
+        self._tasks: List[asyncio.Future] = []
+        self._retrievals: Dict[str, asyncio.Future] = {}
+        self._generations: Dict[str, asyncio.Future] = {}
+
+    def _shared(self, futures: Dict[str, asyncio.Future], key: str, make: Callable[[], Awaitable]) -> asyncio.Future:
+        if key not in futures:
+            futures[key] = asyncio.ensure_future(make())
+            self._tasks.append(futures[key])
+        return futures[key]
+
+    async def _generate_and_cache(self, chain_input: dict, context: List[Document], key: str) -> Tuple[str, dict]:
+        answer, prompt_stats = await generate(chain_input, context)
+        await cache_answer(key, answer, context)
+        return answer, prompt_stats
+
+    async def _run(self, request: UnitTestRequest) -> dict:
+        session_id = request.session_id or str(uuid.uuid4())
+        chain_input = unit_tests_input(request)
+        context = await self._shared(self._retrievals, chain_input["input"],
+                                     lambda: retrieve_context(chain_input["input"]))
+        key, answer, cache_status = await lookup_answer(chain_input, context, self.cache_control)
+        prompt_stats = None
+        if answer is None:
+            answer, prompt_stats = await self._shared(self._generations, key,
+                                                      lambda: self._generate_and_cache(chain_input, context, key))
+        await async_db.insert_application_logs(session_id, 'unit_tests_request', answer)
+        return {"session_id": session_id, "source_code": answer, "cache": cache_status, "prompt_stats": prompt_stats}
+
+    async def results(self) -> AsyncIterator[dict]:
+        items = {asyncio.ensure_future(self._run(request)): index for index, request in enumerate(self.requests)}
+        self._tasks.extend(items)
+        pending = set(items)
+        try:
+            while pending:
+                remaining = self.deadline - self.elapsed
+                done, pending = await asyncio.wait(pending, timeout=max(remaining, 0),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.warning(f"Batch {self.id}: deadline of {self.deadline:.0f}s passed, "
+                                   f"cancelling {len(pending)} unfinished requests")
+                    self.cancel()
+                    done, pending = await asyncio.wait(pending)
+                for task in done:
+                    yield self._result(items[task], task)
+        finally:
+            # Also reached when the client disconnects and the response stream is closed
+            self.cancel()
+
+    def _result(self, index: int, task: asyncio.Future) -> dict:
+        result = {"index": index, "seconds": round(self.elapsed, 3)}
+        if task.cancelled():
+            status = BATCH_CANCELLED
+            result["error"] = "cancelled"
+        elif task.exception() is not None:
+            status = BATCH_FAILED
+            result["error"] = str(task.exception())
+            logger.error(f"Batch {self.id}: request {index} failed: {task.exception()}")
+        else:
+            status = BATCH_SUCCEEDED
+            result.update(task.result())
+        self.counts[status] += 1
+        result["status"] = status
+        return result
+
+    def cancel(self):
+        for task in self._tasks:
+            task.cancel()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def summary(self) -> dict:
+        elapsed = self.elapsed
+        return {
+            "batch_id": self.id,
+            "total": len(self.requests),
+            **self.counts,
+            "retrievals": len(self._retrievals),
+            "generations": len(self._generations),
+            "elapsed": round(elapsed, 3),
+            "requests_per_minute": round(self.counts[BATCH_SUCCEEDED] / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        }
+
+
+__batches: Dict[str, UnitTestBatch] = {}
+
+
+def start_batch(requests: List[UnitTestRequest], deadline: float, cache_control: Optional[str] = None) -> UnitTestBatch:
+    batch = UnitTestBatch(requests, deadline, cache_control)
+    __batches[batch.id] = batch
+    return batch
+
+
+def finish_batch(batch: UnitTestBatch):
+    __batches.pop(batch.id, None)
+
+
+def get_batch(batch_id: str) -> Optional[UnitTestBatch]:
+    return __batches.get(batch_id)
@@ -0,0 +1,62 @@
+"""Per-request setup cost of the RAG chains: building them on every request vs. the chain registry.
+
+Run from the analyzer directory:
+
+    python -m api.bench.chains --requests 200
+
+Only construction is measured; no request is sent to Ollama.
+"""
+import argparse
+import statistics
+import time
+
+from api.ai import generation
+
+
+def measure(label: str, setup, requests: int):
+    timings = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        setup()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    p50, p95 = timings[len(timings) // 2], timings[int(len(timings) * 0.95) - 1]
+    print(f"  {label:<34}{p50 * 1000:>10.3f}{p95 * 1000:>10.3f}{statistics.fmean(timings) * 1000:>10.3f}")
+
+
+def build_unit_tests_per_request():
+    # What /generation/unit-tests did before the registry: a new client, retrievers and chain graph
+    llm = generation.ChatOllama(model=generation.LLM_MODEL, num_predict=generation.LLM_OUTPUT_TOKEN_LIMIT,
+                                temperature=generation.UNIT_TESTS_TEMPERATURE)
+    generation.create_retrieval_chain(
+        generation.EnsembleRetriever(retrievers=[
+            generation.get_vectorstore(generation.DataType.SOURCE_CODE).as_retriever(search_kwargs={"k": 10}),
+            generation.get_vectorstore(generation.DataType.REQUIREMENTS).as_retriever(search_kwargs={"k": 10}),
+        ], weights=[0.5, 0.5]),
+        generation.build_unit_tests_answer_chain(llm))
+
+
+def build_analysis_per_request():
+    llm = generation.ChatOllama(model=generation.LLM_MODEL, num_predict=generation.LLM_OUTPUT_TOKEN_LIMIT,
+                                temperature=generation.ANALYSIS_TEMPERATURE)
+    generation.build_analysis_map_chain(llm)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    # Vector stores were already cached per process; keep their one-time setup out of the numbers
+    build_unit_tests_per_request()
+    build_analysis_per_request()
+
+    print(f"  {'setup per request':<34}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    measure("unit tests, built per request", build_unit_tests_per_request, args.requests)
+    measure("unit tests, registry", generation.get_unit_tests_rag_chain, args.requests)
+    measure("analysis, built per request", build_analysis_per_request, args.requests)
+    measure("analysis, registry", generation.get_analysis_map_chain, args.requests)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Chunking of source files: the generic Unstructured path vs. the code-aware splitter.
+
+Run from the analyzer directory:
+
+    python -m api.bench.chunking --source path/to/repo
+    python -m api.bench.chunking --files 200
+
+Without `--source`, `--files` synthetic Java classes are generated. For both paths the benchmark
+reports chunks, characters sent to the embedding model (overlap included), time per file, and how
+many chunk boundaries fall inside a method. If Unstructured cannot be loaded, the generic path is
+measured with its text splitter alone, which is a lower bound of its cost.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from api.data.code_splitter import LANGUAGES, BRACE_LANGUAGES, CodeSplitter, _BraceParser, language_for
+
+STATEMENTS = [
+    'int total = 0;',
+    'for (int i = 0; i < items.size(); i++) { total += items.get(i).length(); }',
+    'if (total > limit) { throw new IllegalStateException("limit of " + limit + " exceeded"); }',
+    'String name = String.format("%s-%d", prefix, total);',
+    'log.debug("processed {} items", items.size());',
+    'result.put(name, items.stream().filter(s -> !s.isEmpty()).count());',
+]
+
+
+def generate_java(directory: str, files: int, seed: int = 1):
+    rng = random.Random(seed)
+    for index in range(files):
+        methods = []
+        for method in range(rng.randint(3, 25)):
+            # Blank lines between groups of statements, as in most hand-written methods
+            body = "\n".join(f"        {rng.choice(STATEMENTS)}" + ("\n" if rng.random() < 0.2 else "")
+                             for _ in range(rng.randint(2, 40)))
+            methods.append(f"    /**\n     * Step {method} of the workflow.\n     */\n"
+                           f"    public long step{method}(List<String> items, int limit) {{\n{body}\n"
+                           f"        return total;\n    }}\n")
+        with open(os.path.join(directory, f"Service{index}.java"), "w", encoding="utf-8") as f:
+            f.write(f"package com.example.service;\n\nimport java.util.*;\n\n"
+                    f"public class Service{index} {{\n    private final Map<String, Long> result = new HashMap<>();\n\n"
+                    + "\n".join(methods) + "}\n")
+
+
+def source_files(directory: str):
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in LANGUAGES:
+                yield os.path.join(root, name)
+
+
+def generic_path():
+    """The former source code path, with the time to import Unstructured."""
+    started = time.perf_counter()
+    try:
+        from langchain_unstructured import UnstructuredLoader
+        import unstructured.partition.auto  # noqa: F401 (loaded lazily by the loader otherwise)
+    except ImportError as e:
+        print(f"Unstructured is not available ({e}); measuring the generic text splitter alone")
+        UnstructuredLoader = None
+    import_seconds = time.perf_counter() - started
+    splitter = RecursiveCharacterTextSplitter(chunk_size=3000, chunk_overlap=250, length_function=len,
+                                              add_start_index=True)
+
+    def split(file_path: str):
+        if UnstructuredLoader is not None:
+            return splitter.split_documents(UnstructuredLoader(file_path).load())
+        with open(file_path, encoding="utf-8") as f:
+            return splitter.create_documents([f.read()])
+
+    return split, import_seconds
+
+
+def code_path():
+    splitter = CodeSplitter()
+
+    def split(file_path: str):
+        with open(file_path, encoding="utf-8") as f:
+            return splitter.split_text(f.read(), language_for(file_path))
+
+    return split
+
+
+def cut_methods(text: str, file_path: str, chunks) -> int:
+    """Chunk starts that fall strictly inside a method body."""
+    language = language_for(file_path)
+    if language not in BRACE_LANGUAGES:
+        return 0
+    spans, nodes = [], _BraceParser(text, language).parse()
+    while nodes:
+        node = nodes.pop()
+        if node.kind == 'method':
+            spans.append((text.index('{', node.start), node.end))
+        nodes.extend(node.children)
+    starts = [chunk.metadata.get('start_index', 0) for chunk in chunks[1:]]
+    return sum(1 for start in starts for body_start, end in spans if body_start < start < end - 1)
+
+
+def run(label: str, split, files, import_seconds: float = 0.0):
+    timings, chunks, characters, cuts, source_characters = [], 0, 0, 0, 0
+    for file_path in files:
+        started = time.perf_counter()
+        documents = split(file_path)
+        timings.append(time.perf_counter() - started)
+        with open(file_path, encoding="utf-8") as f:
+            text = f.read()
+        chunks += len(documents)
+        characters += sum(len(document.page_content) for document in documents)
+        source_characters += len(text)
+        cuts += cut_methods(text, file_path, documents)
+    timings.sort()
+    print(f"  {label:<28}{chunks:>8}{characters / source_characters:>10.3f}{cuts:>8}"
+          f"{timings[len(timings) // 2] * 1000:>10.3f}{statistics.fmean(timings) * 1000:>10.3f}"
+          f"{import_seconds:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", help="Directory of source files; synthetic Java classes if omitted")
+    parser.add_argument("--files", type=int, default=200, help="Synthetic files to generate")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.source is None:
+            generate_java(directory, args.files)
+        files = list(source_files(args.source or directory))
+        generic, import_seconds = generic_path()
+
+        print(f"\n{len(files)} source files")
+        print(f"  {'path':<28}{'chunks':>8}{'embedded':>10}{'cuts':>8}{'p50 ms':>10}{'mean ms':>10}{'import s':>10}")
+        run("generic (overlap 250)", generic, files, import_seconds)
+        run("code-aware", code_path(), files)
+        print("  embedded: characters sent to the embedding model per source character; "
+              "cuts: chunks starting inside a method")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Per-call latency of the hot db.py functions under concurrent load, pooled vs. connect-per-call.
+
+Run from the analyzer directory:
+
+    python -m api.bench.db --threads 16 --calls 500
+
+Every thread mimics a chat request: it reads a session's history, logs the new exchange and
+lists the documents. The benchmark uses a temporary database seeded with `--sessions` sessions
+of `--history` exchanges each and `--documents` documents per type.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from api.data import db
+from api.data.types import DataType
+
+
+def seed(sessions: int, history: int, documents: int):
+    with db.connection() as conn:
+        conn.executemany('INSERT INTO application_logs (session_id, user_query, gpt_response) VALUES (?, ?, ?)',
+                         [(f"session-{s}", f"question {i}", f"answer {i}" * 20)
+                          for s in range(sessions) for i in range(history)])
+        conn.executemany('INSERT INTO documents (data_type, filename) VALUES (?, ?)',
+                         [(data_type.name, f"file-{i}.txt") for data_type in DataType for i in range(documents)])
+
+
+def worker(calls: int, sessions: int, timings: dict, lock: threading.Lock, start: threading.Event):
+    local = defaultdict(list)
+    start.wait()
+    for _ in range(calls):
+        session_id = f"session-{random.randrange(sessions)}"
+        for name, call in (
+                ("get_chat_history", lambda: db.get_chat_history(session_id)),
+                ("insert_application_logs", lambda: db.insert_application_logs(session_id, "question", "answer")),
+                ("get_all_documents", lambda: db.get_all_documents()),
+        ):
+            started = time.perf_counter()
+            call()
+            local[name].append(time.perf_counter() - started)
+    with lock:
+        for name, values in local.items():
+            timings[name].extend(values)
+
+
+def run(label: str, pool_size: int, args) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        db.init_db(os.path.join(directory, "bench.db"), pool_size)
+        seed(args.sessions, args.history, args.documents)
+
+        timings = defaultdict(list)
+        lock = threading.Lock()
+        start = threading.Event()
+        threads = [threading.Thread(target=worker, args=(args.calls, args.sessions, timings, lock, start))
+                   for _ in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        started = time.perf_counter()
+        start.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        total_calls = sum(len(values) for values in timings.values())
+        print(f"\n{label}: {total_calls} calls on {args.threads} threads in {elapsed:.2f}s "
+              f"({total_calls / elapsed:.0f} calls/s)")
+        print(f"  {'function':<26}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+        for name, values in timings.items():
+            values.sort()
+            p95 = values[int(len(values) * 0.95) - 1]
+            print(f"  {name:<26}{values[len(values) // 2] * 1000:>10.3f}{p95 * 1000:>10.3f}"
+                  f"{statistics.fmean(values) * 1000:>10.3f}")
+        db.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--calls", type=int, default=300, help="Simulated requests per thread")
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--history", type=int, default=20, help="Exchanges per seeded session")
+    parser.add_argument("--documents", type=int, default=200, help="Seeded documents per type")
+    parser.add_argument("--pool-size", type=int, default=8)
+    args = parser.parse_args()
+
+    run("connect per call", 0, args)
+    run(f"pool of {args.pool_size}", args.pool_size, args)
+
+
+if __name__ == "__main__":
+    main()
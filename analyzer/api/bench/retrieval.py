@@ -0,0 +1,170 @@
+"""Unit test retrieval: the vector-only ensemble vs. hybrid BM25 + vector retrieval.
+
+Run from the analyzer directory:
+
+    python -m api.bench.retrieval --files 200 --queries 200
+    python -m api.bench.retrieval --embeddings ollama --model nomic-embed-text
+
+A corpus of `--files` synthetic Java classes (see bench.chunking) and one requirements document
+per class is indexed into a temporary Chroma directory and lexical index. Every query asks for
+the tests of one method, either by its qualified name (`Service12.step3`) or in words ("step3
+in Service12"), wrapped like a /generation/unit-tests request. A query is a hit if a chunk with
+that method is retrieved. The benchmark reports recall, mean reciprocal rank among the code
+chunks, latency and query embeddings per query. The retrieval cache is measured on a first
+pass over the queries and on a repeat of the same requests.
+
+The fake embeddings are random, so their vector recall is meaningless; they measure the cost of
+retrieval alone. `--query-latency-ms` adds a delay per query embedding to stand in for the round
+trip to an embedding model. Use `--embeddings ollama` for recall with a real model.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from langchain.retrievers import EnsembleRetriever
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from api.ai.retrieval import HybridRetriever
+from api.bench.chunking import generate_java
+from api.data.code_splitter import split_source_file
+from api.data.lexical_index import LexicalIndex
+from api.data.retrieval_cache import RetrievalCache
+
+CODE = "SOURCE_CODE"
+REQUIREMENTS = "REQUIREMENTS"
+
+
+class CountingEmbeddings(Embeddings):
+    """Counts query embeddings and delays each by `latency` seconds."""
+
+    def __init__(self, embeddings: Embeddings, latency: float):
+        self.embeddings = embeddings
+        self.latency = latency
+        self.queries = 0
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.queries += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.embeddings.embed_query(text)
+
+
+def index_corpus(directory: str, files: int, embeddings: Embeddings):
+    generate_java(directory, files)
+    vectorstores = {name: Chroma(collection_name=name, persist_directory=os.path.join(directory, "chroma"),
+                                 embedding_function=embeddings) for name in (CODE, REQUIREMENTS)}
+    lexical_index = LexicalIndex(os.path.join(directory, "lexical.db"))
+
+    methods = {}
+    chunks = {CODE: [], REQUIREMENTS: []}
+    for file_id in range(files):
+        for chunk in split_source_file(os.path.join(directory, f"Service{file_id}.java")):
+            chunk.metadata['file_id'] = file_id
+            chunks[CODE].append(chunk)
+        methods[file_id] = sorted({method for chunk in chunks[CODE] if chunk.metadata['file_id'] == file_id
+                                   for method in chunk.metadata.get('method', '').split(', ') if method})
+        chunks[REQUIREMENTS].append(Document(
+            page_content=f"Service {file_id} processes the items of a workflow in steps. Each step counts the "
+                         f"items, fails once the limit is exceeded and records the result under a new name.",
+            metadata={'file_id': files + file_id}))
+
+    for name, documents in chunks.items():
+        for start in range(0, len(documents), 1000):
+            batch = documents[start:start + 1000]
+            ids = vectorstores[name].add_documents(batch)
+            lexical_index.add(name, ids, batch)
+    return vectorstores, lexical_index, methods, len(chunks[CODE])
+
+
+def make_queries(methods: dict, count: int, seed: int = 7):
+    rng = random.Random(seed)
+    queries = []
+    for index in range(count):
+        file_id = rng.choice(sorted(methods))
+        method = rng.choice(methods[file_id])
+        request = f"Service{file_id}.{method}" if index % 2 == 0 else f"{method} in Service{file_id}"
+        queries.append(("qualified" if index % 2 == 0 else "words",
+                        f"strictly follow system instructions and write unit tests for {request}", file_id, method))
+    return queries
+
+
+def is_hit(document: Document, file_id: int, method: str) -> bool:
+    return document.metadata.get('file_id') == file_id and method in document.metadata.get('method', '').split(', ')
+
+
+def run(label: str, retriever, embeddings: CountingEmbeddings, queries):
+    for kind in ("qualified", "words"):
+        selected = [query for query in queries if query[0] == kind]
+        timings, hits, reciprocal_ranks = [], 0, []
+        embedded = embeddings.queries
+        for _, query, file_id, method in selected:
+            started = time.perf_counter()
+            documents = retriever.invoke(query)
+            timings.append(time.perf_counter() - started)
+            # Ranked among the code chunks; the requirements interleave with them by weight
+            code = [document for document in documents if 'language' in document.metadata]
+            ranks = [rank for rank, document in enumerate(code, start=1) if is_hit(document, file_id, method)]
+            hits += bool(ranks)
+            reciprocal_ranks.append(1 / ranks[0] if ranks else 0.0)
+        timings.sort()
+        print(f"  {label:<26}{kind:<11}{hits / len(selected):>8.3f}{statistics.fmean(reciprocal_ranks):>8.3f}"
+              f"{timings[len(timings) // 2] * 1000:>10.2f}{timings[int(len(timings) * 0.95) - 1] * 1000:>10.2f}"
+              f"{(embeddings.queries - embedded) / len(selected):>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=200, help="Synthetic Java classes to index")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10, help="Chunks retrieved per collection")
+    parser.add_argument("--embeddings", choices=("fake", "ollama"), default="fake")
+    parser.add_argument("--model", help="Ollama embedding model")
+    parser.add_argument("--query-latency-ms", type=float, default=0.0,
+                        help="Added to every query embedding, e.g. a measured round trip to Ollama")
+    args = parser.parse_args()
+
+    if args.embeddings == "ollama":
+        from langchain_ollama import OllamaEmbeddings
+        base = OllamaEmbeddings(model=args.model)
+    else:
+        base = DeterministicFakeEmbedding(size=768)
+    embeddings = CountingEmbeddings(base, args.query_latency_ms / 1000)
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        vectorstores, lexical_index, methods, chunks = index_corpus(directory, args.files, embeddings)
+        print(f"\nIndexed {chunks} code chunks of {args.files} files and {args.files} requirements "
+              f"in {time.perf_counter() - started:.1f}s")
+        queries = make_queries(methods, args.queries)
+
+        ensemble = EnsembleRetriever(retrievers=[
+            vectorstores[CODE].as_retriever(search_kwargs={"k": args.k}),
+            vectorstores[REQUIREMENTS].as_retriever(search_kwargs={"k": args.k}),
+        ], weights=[0.5, 0.5])
+
+        def hybrid(lexical_margin: float, cache: RetrievalCache = None) -> HybridRetriever:
+            return HybridRetriever(vectorstores=vectorstores, weights={CODE: 0.5, REQUIREMENTS: 0.5},
+                                   lexical_index=lexical_index, embeddings=embeddings, k=args.k,
+                                   lexical_margin=lexical_margin, cache=cache)
+
+        print(f"  {'retriever':<26}{'queries':<11}{'recall':>8}{'MRR':>8}{'p50 ms':>10}{'p95 ms':>10}"
+              f"{'embeds':>10}")
+        run("vector ensemble", ensemble, embeddings, queries)
+        run("hybrid RRF", hybrid(float('inf')), embeddings, queries)
+        run("hybrid RRF, lexical skip", hybrid(1.0), embeddings, queries)
+        cached = hybrid(1.0, RetrievalCache())
+        run("+ retrieval cache, cold", cached, embeddings, queries)
+        run("+ retrieval cache, repeat", cached, embeddings, queries)
+        print("  embeds: query embeddings per query")
+
+
+if __name__ == "__main__":
+    main()
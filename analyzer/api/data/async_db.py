@@ -0,0 +1,141 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from api import logs
+from api.data import db
+from api.data.types import DataType
+from api.env import DB_POOL_SIZE, DB_WRITE_BATCH_SIZE, DB_WRITE_BATCH_DELAY
+
+logger = logs.get_logger(__name__)
+
+
+class AsyncDatabase:
+    """Runs the functions of `api.data.db` off the event loop, on threads that serve nothing else.
+
+    Reads go to a pool of reader threads sized like the connection pool, so they are not stuck
+    behind generations or uploads in Starlette's shared threadpool. Writes go through one writer
+    thread, since SQLite only has one writer at a time anyway. The writer collects chat logs that
+    arrive within `batch_delay` seconds and inserts them in a single transaction (group commit).
+    """
+
+    def __init__(self, readers: int, batch_size: int = 64, batch_delay: float = 0.005):
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-read")
+        self._writes: queue.Queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="db-write", daemon=True)
+        self._writer.start()
+
+    async def read(self, func, *args):
+        return await asyncio.wrap_future(self._readers.submit(func, *args))
+
+    async def write(self, func, *args):
+        future = Future()
+        self._writes.put((func, args, future))
+        return await asyncio.wrap_future(future)
+
+    def _write_loop(self):
+        while True:
+            func, args, future = self._writes.get()
+            if func is not db.insert_application_logs:
+                self._run(func, args, future)
+                continue
+
+            batch = [(args, future)]
+            deadline = time.monotonic() + self.batch_delay
+            pending = None
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._writes.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item[0] is not db.insert_application_logs:
+                    # Keep the order of writes: flush the batch before anything else
+                    pending = item
+                    break
+                batch.append((item[1], item[2]))
+            self._run(db.insert_application_logs_many, ([args for args, _ in batch],), *[f for _, f in batch])
+            if pending is not None:
+                self._run(*pending)
+
+    @staticmethod
+    def _run(func, args, *futures: Future):
+        try:
+            result = func(*args)
+        except Exception as e:
+            logger.error(f"Database write {func.__name__} failed: {e}", exc_info=True)
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future in futures:
+            future.set_result(result)
+
+
+__async_db: Optional[AsyncDatabase] = None
+
+
+def get_async_db() -> AsyncDatabase:
+    global __async_db
+    if __async_db is None:
+        __async_db = AsyncDatabase(DB_POOL_SIZE, batch_size=DB_WRITE_BATCH_SIZE, batch_delay=DB_WRITE_BATCH_DELAY)
+    return __async_db
+
+
+# Async counterparts of api.data.db, with the same names and arguments
+
+async def insert_application_logs(session_id, user_query, gpt_response):
+    await get_async_db().write(db.insert_application_logs, session_id, user_query, gpt_response)
+
+
+async def get_chat_history(session_id):
+    return await get_async_db().read(db.get_chat_history, session_id)
+
+
+async def insert_document_record(filename, data_type: DataType, content_hash=None, size=None,
+                                 status=db.DOCUMENT_INDEXED, source_path=None):
+    return await get_async_db().write(db.insert_document_record, filename, data_type, content_hash, size, status,
+                                      source_path)
+
+
+async def update_document_status(file_id, status, chunk_count=None):
+    await get_async_db().write(db.update_document_status, file_id, status, chunk_count)
+
+
+async def delete_document_record(file_id, data_type: DataType):
+    return await get_async_db().write(db.delete_document_record, file_id, data_type)
+
+
+async def get_document(file_id):
+    return await get_async_db().read(db.get_document, file_id)
+
+
+async def get_documents_page(data_type: DataType = None, status=db.DOCUMENT_INDEXED, limit=100, cursor=None):
+    return await get_async_db().read(db.get_documents_page, data_type, status, limit, cursor)
+
+
+async def get_all_documents(data_type: DataType = None):
+    return await get_async_db().read(db.get_all_documents, data_type)
+
+
+async def get_documents_by_type(data_type: DataType):
+    return await get_async_db().read(db.get_documents_by_type, data_type)
+
+
+async def get_ingestion_job(job_id):
+    return await get_async_db().read(db.get_ingestion_job, job_id)
+
+
+async def get_ingestion_jobs(status=None, limit=100):
+    return await get_async_db().read(db.get_ingestion_jobs, status, limit)
+
+
+async def get_graph_violations(path, start_line=None, end_line=None, limit=100):
+    return await get_async_db().read(db.get_graph_violations, path, start_line, end_line, limit)
+
+
+async def get_graph_methods(path, line=None):
+    return await get_async_db().read(db.get_graph_methods, path, line)
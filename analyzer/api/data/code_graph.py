@@ -0,0 +1,165 @@
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+import zstandard
+from langchain_core.documents import Document
+
+from api import logs
+from api.data.db import insert_code_graph_rows, get_graph_violations, get_graph_file_paths, get_document
+from api.data.report_splitter import iter_graph_vertices, vertex_property, unwrap_graphson_value, \
+    violation_document, UnknownReportFormat
+
+logger = logs.get_logger(__name__)
+
+CONTENT_ENCODINGS = ('gzip', 'zstd', 'identity')
+# Rows collected before they are written to the graph tables
+GRAPH_BATCH_ROWS = 5000
+NOT_A_FILE = ('<empty>', '<unknown>', '<includes>')
+
+
+class UnsupportedEncoding(ValueError):
+    pass
+
+
+class ZstdFrames:
+    """Decompresses a stream of concatenated zstd frames, as the exporter may write one frame per
+    block. Unlike `decompressobj(read_across_frames=True)`, it can tell whether the last frame ended."""
+
+    def __init__(self):
+        self._frame = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data: bytes) -> bytes:
+        chunks = []
+        while data:
+            if self._frame.eof:
+                self._frame = zstandard.ZstdDecompressor().decompressobj()
+            chunks.append(self._frame.decompress(data))
+            data = self._frame.unused_data if self._frame.eof else b''
+        return b''.join(chunks)
+
+    def complete(self) -> bool:
+        return self._frame.eof
+
+
+def decompressor(content_encoding: str) -> Tuple[Callable[[bytes], bytes], Callable[[], bytes], Callable[[], bool]]:
+    """(decompress, flush, complete) for a request body sent with `content_encoding`, as the exporter
+    uploads it. `complete` tells whether the compressed stream ended; a truncated body decompresses
+    without an error."""
+    if content_encoding == 'gzip':
+        decompress = zlib.decompressobj(31)
+        return decompress.decompress, decompress.flush, lambda: decompress.eof
+    if content_encoding == 'zstd':
+        decompress = ZstdFrames()
+        return decompress.decompress, (lambda: b''), decompress.complete
+    if content_encoding == 'identity':
+        return (lambda data: data), (lambda: b''), (lambda: True)
+    raise UnsupportedEncoding(f"Unsupported content encoding: {content_encoding}")
+
+
+def _path(value) -> Optional[str]:
+    if not isinstance(value, str) or not value or value in NOT_A_FILE:
+        return None
+    return value.replace('\\', '/')
+
+
+def _file_name(path: str) -> str:
+    return path.rsplit('/', 1)[-1]
+
+
+def index_code_graph(file_path: str, graph_id: int) -> Optional[Dict[str, int]]:
+    """Stores the FILE and METHOD vertices of a (merged) GraphSON graph and the PMD violations the
+    merge tool attached to its files, under the graph's document id.
+
+    The vertices are streamed, and rows are written GRAPH_BATCH_ROWS at a time.
+    Returns the number of stored rows per kind, or None if the file is not a GraphSON graph.
+    """
+    files, methods, violations = [], [], []
+    counts = {"files": 0, "methods": 0, "violations": 0}
+
+    def flush():
+        insert_code_graph_rows(graph_id, files, methods, violations)
+        counts["files"] += len(files)
+        counts["methods"] += len(methods)
+        counts["violations"] += len(violations)
+        files.clear()
+        methods.clear()
+        violations.clear()
+
+    try:
+        for vertex in iter_graph_vertices(file_path):
+            label = vertex.get('label')
+            properties = vertex.get('properties')
+            if label not in ('FILE', 'METHOD') or not isinstance(properties, dict):
+                continue
+
+            if label == 'FILE':
+                path = _path(vertex_property(properties, 'NAME'))
+                if path is None:
+                    continue
+                file_violations = [v for v in unwrap_graphson_value(properties.get('pmd_violations')) or []
+                                   if isinstance(v, dict)]
+                files.append((path, _file_name(path), str(unwrap_graphson_value(vertex.get('id'))),
+                              len(file_violations)))
+                violations.extend((path, _file_name(path), v.get('beginline'), v.get('endline'), v.get('rule'),
+                                   v.get('ruleset'), v.get('priority'), v.get('description'))
+                                  for v in file_violations)
+            else:
+                path = _path(vertex_property(properties, 'FILENAME'))
+                if path is None or vertex_property(properties, 'IS_EXTERNAL') is True:
+                    continue
+                methods.append((path, _file_name(path), vertex_property(properties, 'NAME'),
+                                vertex_property(properties, 'FULL_NAME'), vertex_property(properties, 'SIGNATURE'),
+                                vertex_property(properties, 'LINE_NUMBER'),
+                                vertex_property(properties, 'LINE_NUMBER_END')))
+
+            if len(files) + len(methods) + len(violations) >= GRAPH_BATCH_ROWS:
+                flush()
+    except UnknownReportFormat:
+        return None
+
+    flush()
+    logger.info(f"Indexed code graph {graph_id}: {counts['files']} files, {counts['methods']} methods, "
+                f"{counts['violations']} PMD violations")
+    return counts
+
+
+def graph_path(document: Optional[dict]) -> Optional[str]:
+    """The path in the code graphs of a document's file, found by its repository path if it was
+    synced from a repository (see api.data.reindex), else by its file name. None if no graph file
+    matches, or several do, e.g. two `Utils.java` in different packages for an uploaded `Utils.java`."""
+    if document is None:
+        return None
+    path = document['source_path'].split(':', 1)[-1] if document.get('source_path') else document['filename']
+    paths = get_graph_file_paths(path)
+    if len(paths) > 1:
+        logger.debug(f"{path} matches {len(paths)} files of the code graphs, not adding their violations")
+    return paths[0] if len(paths) == 1 else None
+
+
+def graph_violations_for(chunks: List[Document], limit: int) -> List[Document]:
+    """The PMD violations inside the lines of the retrieved source code `chunks`, looked up in the
+    code graph index by file path and line range instead of by a vector search."""
+    paths: Dict[int, Optional[str]] = {}
+    seen = set()
+    documents = []
+    for chunk in chunks:
+        file_id, start_line = chunk.metadata.get('file_id'), chunk.metadata.get('start_line')
+        if file_id is None or start_line is None:
+            continue
+        if file_id not in paths:
+            paths[file_id] = graph_path(get_document(file_id))
+        if paths[file_id] is None:
+            continue
+
+        for row in get_graph_violations(paths[file_id], start_line, chunk.metadata.get('end_line', start_line),
+                                        limit=limit):
+            key = (row['graph_id'], row['path'], row['start_line'], row['rule'])
+            if key in seen:
+                continue
+            seen.add(key)
+            violation = {"beginline": row['start_line'], "endline": row['end_line'], "rule": row['rule'],
+                         "ruleset": row['ruleset'], "priority": row['priority'], "description": row['description']}
+            documents.append(violation_document(violation, row['path'], file_id=row['graph_id']))
+            if len(documents) >= limit:
+                return documents
+    return documents
@@ -0,0 +1,261 @@
+import ast
+import bisect
+import os
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from langchain_core.documents import Document
+from langchain_text_splitters import Language, RecursiveCharacterTextSplitter
+
+CHUNK_SIZE = 3000
+
+LANGUAGES = {
+    '.java': Language.JAVA, '.kt': Language.KOTLIN, '.kts': Language.KOTLIN, '.scala': Language.SCALA,
+    '.cs': Language.CSHARP, '.c': Language.C, '.h': Language.C, '.cpp': Language.CPP, '.cc': Language.CPP,
+    '.hpp': Language.CPP, '.go': Language.GO, '.rs': Language.RUST, '.swift': Language.SWIFT,
+    '.js': Language.JS, '.jsx': Language.JS, '.mjs': Language.JS, '.ts': Language.TS, '.tsx': Language.TS,
+    '.php': Language.PHP, '.py': Language.PYTHON, '.rb': Language.RUBY, '.lua': Language.LUA,
+    '.pl': Language.PERL, '.hs': Language.HASKELL, '.ex': Language.ELIXIR, '.exs': Language.ELIXIR,
+    '.ps1': Language.POWERSHELL, '.sol': Language.SOL, '.proto': Language.PROTO, '.md': Language.MARKDOWN,
+    '.rst': Language.RST, '.html': Language.HTML, '.tex': Language.LATEX, '.cbl': Language.COBOL,
+}
+
+# Languages whose classes and methods are delimited by braces, split by `_BraceParser`
+BRACE_LANGUAGES = {Language.JAVA, Language.KOTLIN, Language.SCALA, Language.CSHARP, Language.C, Language.CPP,
+                   Language.GO, Language.RUST, Language.SWIFT, Language.JS, Language.TS, Language.PHP}
+
+TYPE_DECLARATION = re.compile(r'\b(?:class|interface|enum|record|struct|trait|impl|object|namespace)\s+(\w+)')
+CALLABLE_NAME = re.compile(r'(?<![@\w])(\w+)\s*(?:<[^<>]*>)?\s*\(')
+NOT_A_NAME = {'func', 'function', 'fn', 'fun', 'def', 'if', 'for', 'while', 'switch', 'catch', 'return', 'new',
+              'synchronized', 'using', 'lock', 'foreach', 'when'}
+COMMENTS = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+ANNOTATIONS = re.compile(r'@[\w.]+(?:\([^()]*\))?')
+
+
+def language_for(file_path: str) -> Optional[Language]:
+    return LANGUAGES.get(os.path.splitext(file_path)[1].lower())
+
+
+@dataclass
+class _Node:
+    """A class or method: its span in the text, from its leading comments to its closing brace."""
+    kind: str
+    name: Optional[str]
+    start: int
+    end: int
+    children: List['_Node'] = field(default_factory=list)
+
+
+@dataclass
+class _Piece:
+    start: int
+    end: int
+    class_name: Optional[str]
+    methods: List[str]
+
+
+class _BraceParser:
+    """Finds the classes and methods of a C-like source file by matching braces.
+
+    Strings and comments are skipped. Every block opened at the top level or directly inside a class
+    is classified by its header (the text since the previous `;`, `{` or `}`); blocks inside methods
+    (lambdas, anonymous classes, control flow) stay part of their method.
+    """
+
+    def __init__(self, text: str, language: Language):
+        self.text = text
+        self.quotes = '"\'`' if language in (Language.JS, Language.TS, Language.GO) else '"\''
+        self.tokens = re.compile('//|/\\*|[{};' + self.quotes + ']')
+
+    def parse(self) -> List[_Node]:
+        text, n = self.text, len(self.text)
+        roots: List[_Node] = []
+        # One entry per open brace: its node if it is recorded, and the list it is recorded in
+        stack = []
+        statement_start = 0
+        i = 0
+        while True:
+            match = self.tokens.search(text, i)
+            if match is None:
+                break
+            token, i = match.group(), match.start()
+            if token == '//':
+                i = text.find('\n', i)
+                i = n if i < 0 else i
+                continue
+            if token == '/*':
+                i = text.find('*/', i + 2)
+                i = n if i < 0 else i + 2
+                continue
+            if token in self.quotes:
+                i = self._skip_string(i, token)
+                continue
+            if token == '{':
+                parent = stack[-1][0] if stack else None
+                if not stack or (parent is not None and parent.kind == 'class'):
+                    stack.append((self._classify(statement_start, i), parent.children if parent else roots))
+                else:
+                    stack.append((None, None))
+                statement_start = i + 1
+            elif token == '}':
+                if stack:
+                    node, siblings = stack.pop()
+                    if node is not None:
+                        node.end = i + 1
+                        siblings.append(node)
+                statement_start = i + 1
+            else:
+                statement_start = i + 1
+            i += 1
+        return roots
+
+    def _skip_string(self, i: int, quote: str) -> int:
+        text, n = self.text, len(self.text)
+        i += 1
+        while i < n:
+            if text[i] == '\\':
+                i += 2
+                continue
+            if text[i] == quote or (text[i] == '\n' and quote != '`'):
+                return i + 1
+            i += 1
+        return n
+
+    def _classify(self, start: int, brace: int) -> _Node:
+        header = ANNOTATIONS.sub(' ', COMMENTS.sub(' ', self.text[start:brace]))
+        # The span starts at the first line after the previous statement, keeping leading comments
+        while start < brace and self.text[start] in ' \t':
+            start += 1
+        if self.text[start:start + 1] == '\n':
+            start += 1
+        declaration = TYPE_DECLARATION.search(header)
+        if declaration and '(' not in header[:declaration.start()]:
+            return _Node('class', declaration.group(1), start, brace)
+        names = [name for name in CALLABLE_NAME.findall(header) if name not in NOT_A_NAME]
+        if names and '=' not in header.split('(')[0]:
+            return _Node('method', names[0], start, brace)
+        return _Node('block', None, start, brace)
+
+
+def _python_nodes(text: str, line_starts: List[int]) -> List[_Node]:
+    def offset(line: int) -> int:
+        return line_starts[line - 1] if line - 1 < len(line_starts) else len(text)
+
+    def convert(statements) -> List[_Node]:
+        nodes = []
+        for statement in statements:
+            if not isinstance(statement, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            first_line = min([statement.lineno] + [d.lineno for d in statement.decorator_list])
+            node = _Node('class' if isinstance(statement, ast.ClassDef) else 'method', statement.name,
+                         offset(first_line), offset(statement.end_lineno + 1))
+            if node.kind == 'class':
+                node.children = convert(statement.body)
+            nodes.append(node)
+        return nodes
+
+    return convert(ast.parse(text).body)
+
+
+class CodeSplitter:
+    """Splits source code into chunks along class and method boundaries.
+
+    Chunks do not overlap. Text between declarations (imports, fields, comments) goes with the
+    declaration after it. Neighbouring small declarations of the same class are packed into one
+    chunk of up to `chunk_size` characters, a class that is too large is split into its members,
+    and only a single method that is too large is cut by the language's separators. Every chunk
+    records its `language`, `class`, `method` (comma separated if several), `start_line`,
+    `end_line` and `start_index`.
+    """
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    def split_text(self, text: str, language: Optional[Language]) -> List[Document]:
+        line_starts = [0] + [match.end() for match in re.finditer('\n', text)]
+        nodes = None
+        if language == Language.PYTHON:
+            try:
+                nodes = _python_nodes(text, line_starts)
+            except SyntaxError:
+                pass
+        elif language in BRACE_LANGUAGES:
+            nodes = _BraceParser(text, language).parse()
+
+        documents = []
+        for piece in self._pack(self._pieces(text, nodes or [], 0, len(text), None)):
+            for start, content in self._cut(text, piece, language):
+                if not content.strip():
+                    continue
+                metadata = {
+                    "language": language.value if language else "text",
+                    "start_index": start,
+                    "start_line": bisect.bisect_right(line_starts, start + len(content) - len(content.lstrip())),
+                    "end_line": bisect.bisect_right(line_starts, start + len(content.rstrip()) - 1),
+                }
+                if piece.class_name:
+                    metadata["class"] = piece.class_name
+                if piece.methods:
+                    metadata["method"] = ", ".join(piece.methods)
+                documents.append(Document(page_content=content, metadata=metadata))
+        return documents
+
+    def _pieces(self, text: str, nodes: List[_Node], start: int, end: int, class_name: Optional[str]) -> List[_Piece]:
+        """Covers text[start:end] with one piece per node; a piece that is too large and is a class
+        is broken up into pieces of its members."""
+        pieces = []
+        piece_start = start
+        nodes = sorted((node for node in nodes if start <= node.start and node.end <= end), key=lambda n: n.start)
+        for index, node in enumerate(nodes):
+            piece_end = end if index == len(nodes) - 1 else node.end
+            if piece_end - piece_start > self.chunk_size and node.kind == 'class' and node.children:
+                pieces.extend(self._pieces(text, node.children, piece_start, piece_end, node.name))
+            else:
+                if node.kind == 'class':
+                    methods = [child.name for child in node.children if child.kind == 'method']
+                else:
+                    methods = [node.name] if node.kind == 'method' and node.name else []
+                pieces.append(_Piece(piece_start, piece_end, node.name if node.kind == 'class' else class_name,
+                                     methods))
+            piece_start = piece_end
+        if not nodes:
+            pieces.append(_Piece(start, end, class_name, []))
+        return pieces
+
+    def _pack(self, pieces: List[_Piece]) -> List[_Piece]:
+        packed: List[_Piece] = []
+        for piece in pieces:
+            last = packed[-1] if packed else None
+            if last is not None and last.class_name == piece.class_name \
+                    and piece.end - last.start <= self.chunk_size:
+                last.end = piece.end
+                last.methods.extend(piece.methods)
+            else:
+                packed.append(_Piece(piece.start, piece.end, piece.class_name, list(piece.methods)))
+        return packed
+
+    def _cut(self, text: str, piece: _Piece, language: Optional[Language]):
+        content = text[piece.start:piece.end]
+        if len(content) <= self.chunk_size:
+            return [(piece.start, content)]
+        # Whitespace is kept, so the cut chunks still cover the piece exactly
+        if language is not None:
+            splitter = RecursiveCharacterTextSplitter.from_language(language, chunk_size=self.chunk_size,
+                                                                    chunk_overlap=0, add_start_index=True,
+                                                                    strip_whitespace=False)
+        else:
+            splitter = RecursiveCharacterTextSplitter(chunk_size=self.chunk_size, chunk_overlap=0,
+                                                      add_start_index=True, strip_whitespace=False)
+        return [(piece.start + document.metadata['start_index'], document.page_content)
+                for document in splitter.create_documents([content])]
+
+
+def split_source_file(file_path: str, chunk_size: int = CHUNK_SIZE) -> Optional[List[Document]]:
+    """Chunks of a plain-text source file, or None if it is not UTF-8 text."""
+    try:
+        with open(file_path, encoding='utf-8') as f:
+            text = f.read()
+    except UnicodeDecodeError:
+        return None
+    return CodeSplitter(chunk_size).split_text(text, language_for(file_path))
@@ -1,110 +1,573 @@
+import base64
+import json
+import queue
+import re
 import sqlite3
+import threading
+from contextlib import contextmanager
 
+from api import logs
 from api.data.types import DataType
+from api.env import DB_POOL_SIZE
+
+logger = logs.get_logger(__name__)
 
 DB_NAME = "rag_app.db"
 
+# Applied to every pooled connection
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    # Safe with WAL: a power loss may drop the last commits but never corrupts the database
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA cache_size=-16000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=134217728',
+)
+
+# Per-connection cache of prepared statements, keyed by SQL text
+STATEMENT_CACHE_SIZE = 256
+
+DOCUMENT_PENDING = 'pending'
+DOCUMENT_INDEXED = 'indexed'
+DOCUMENT_FAILED = 'failed'
 
+DOCUMENT_COLUMNS = 'id, data_type, filename, content_hash, size, chunk_count, status, upload_timestamp, source_path'
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
+
+def get_db_connection(db_path=DB_NAME):
+    conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
 
+class ConnectionPool:
+    """Thread-safe pool of SQLite connections.
+
+    Connections are opened on demand up to `size` and handed out one thread at a time. Because a
+    connection is reused, its prepared statements are too. With `size=0` every borrow opens a
+    fresh connection, which is how this module worked before pooling (used by the benchmark).
+    """
+
+    def __init__(self, db_path, size):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self.size == 0 or self._opened < self.size:
+                self._opened += 1
+                return get_db_connection(self.db_path)
+        return self._idle.get()
+
+    def _release(self, conn):
+        if self.size == 0:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection; commits when the block succeeds and rolls back when it raises."""
+        conn = self._acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+__pool = None
+
+
+def connection():
+    return __pool.connection()
+
+
+def init_db(db_path=DB_NAME, pool_size=DB_POOL_SIZE):
+    """Creates the pool for `db_path` and makes sure tables and indexes exist."""
+    global __pool
+    if __pool is not None:
+        __pool.close()
+    __pool = ConnectionPool(db_path, pool_size)
+    create_application_logs()
+    create_document_tables()
+    create_ingestion_jobs_table()
+    create_code_graph_tables()
+    migrate_document_tables()
+    return __pool
+
+
+def close_db():
+    if __pool is not None:
+        __pool.close()
+
+
 def create_application_logs():
-    conn = get_db_connection()
-    conn.execute('''CREATE TABLE IF NOT EXISTS application_logs
-                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                     session_id TEXT,
-                     user_query TEXT,
-                     gpt_response TEXT,
-                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    conn.close()
+    with connection() as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS application_logs
+                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                         session_id TEXT,
+                         user_query TEXT,
+                         gpt_response TEXT,
+                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_application_logs_session '
+                     'ON application_logs (session_id, created_at)')
 
 
 def create_document_tables():
-    conn = get_db_connection()
-    for data_type in DataType:
-        table_name = f"document_store_{data_type.name.lower()}"
-        conn.execute(f'''CREATE TABLE IF NOT EXISTS {table_name}
+    with connection() as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS documents
                         (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                         data_type TEXT NOT NULL,
                          filename TEXT,
-                         upload_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    conn.close()
+                         content_hash TEXT,
+                         size INTEGER,
+                         chunk_count INTEGER,
+                         status TEXT NOT NULL DEFAULT 'indexed',
+                         upload_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                         source_path TEXT)''')
+        # Catalogs created before documents could be kept in sync with a repository
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(documents)')}
+        if 'source_path' not in columns:
+            conn.execute('ALTER TABLE documents ADD COLUMN source_path TEXT')
+        # Both serve the keyset listing, newest first, with and without a data type
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_documents_type_listing '
+                     'ON documents (data_type, status, upload_timestamp DESC, id DESC)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_documents_listing '
+                     'ON documents (status, upload_timestamp DESC, id DESC)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents (content_hash)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_documents_filename ON documents (data_type, filename)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_documents_source_path ON documents (data_type, source_path)')
+        # Documents whose id changed in migrate_document_tables; their chunks are relabelled on startup
+        conn.execute('''CREATE TABLE IF NOT EXISTS document_id_remaps
+                        (data_type TEXT NOT NULL,
+                         old_id INTEGER NOT NULL,
+                         new_id INTEGER NOT NULL,
+                         PRIMARY KEY (data_type, old_id))''')
+
+
+def create_ingestion_jobs_table():
+    with connection() as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS ingestion_jobs
+                        (id TEXT PRIMARY KEY,
+                         filename TEXT NOT NULL,
+                         data_type TEXT NOT NULL,
+                         file_path TEXT NOT NULL,
+                         status TEXT NOT NULL,
+                         attempts INTEGER NOT NULL DEFAULT 0,
+                         file_id INTEGER,
+                         progress TEXT,
+                         error TEXT,
+                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_status ON ingestion_jobs (status)')
+
+
+def create_code_graph_tables():
+    """Files, methods and PMD violations of ingested code graphs (see api.data.code_graph).
+
+    `graph_id` is the document id of the graph. Rows are looked up by the file's base name and
+    line, since the graph and the uploaded sources rarely agree on the directory a path starts at.
+    """
+    with connection() as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS graph_files
+                        (graph_id INTEGER NOT NULL,
+                         path TEXT NOT NULL,
+                         file_name TEXT NOT NULL,
+                         vertex_id TEXT,
+                         violation_count INTEGER NOT NULL DEFAULT 0)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS graph_methods
+                        (graph_id INTEGER NOT NULL,
+                         path TEXT NOT NULL,
+                         file_name TEXT NOT NULL,
+                         name TEXT,
+                         full_name TEXT,
+                         signature TEXT,
+                         start_line INTEGER,
+                         end_line INTEGER)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS graph_violations
+                        (graph_id INTEGER NOT NULL,
+                         path TEXT NOT NULL,
+                         file_name TEXT NOT NULL,
+                         start_line INTEGER,
+                         end_line INTEGER,
+                         rule TEXT,
+                         ruleset TEXT,
+                         priority INTEGER,
+                         description TEXT)''')
+        for table in ('graph_files', 'graph_methods', 'graph_violations'):
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_graph ON {table} (graph_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_graph_files_file_name ON graph_files (file_name)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_graph_methods_file_name '
+                     'ON graph_methods (file_name, start_line)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_graph_violations_file_name '
+                     'ON graph_violations (file_name, start_line)')
 
 
 def insert_application_logs(session_id, user_query, gpt_response):
-    conn = get_db_connection()
-    conn.execute('INSERT INTO application_logs (session_id, user_query, gpt_response) VALUES (?, ?, ?)',
-                 (session_id, user_query, gpt_response))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        conn.execute('INSERT INTO application_logs (session_id, user_query, gpt_response) VALUES (?, ?, ?)',
+                     (session_id, user_query, gpt_response))
+
+
+def insert_application_logs_many(rows):
+    """Inserts (session_id, user_query, gpt_response) rows in one transaction."""
+    with connection() as conn:
+        conn.executemany('INSERT INTO application_logs (session_id, user_query, gpt_response) VALUES (?, ?, ?)',
+                         rows)
 
 
 def get_chat_history(session_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? ORDER BY created_at',
-                   (session_id,))
+    with connection() as conn:
+        rows = conn.execute('SELECT user_query, gpt_response FROM application_logs WHERE session_id = ? '
+                            'ORDER BY created_at, id',
+                            (session_id,)).fetchall()
     messages = []
-    for row in cursor.fetchall():
+    for row in rows:
         messages.extend([
             {"role": "human", "content": row['user_query']},
             {"role": "ai", "content": row['gpt_response']}
         ])
-    conn.close()
     return messages
 
 
-def insert_document_record(filename, data_type: DataType):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    table_name = f"document_store_{data_type.name.lower()}"
-    cursor.execute(f'INSERT INTO {table_name} (filename) VALUES (?)', (filename,))
-    file_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return file_id
+def migrate_document_tables():
+    """Moves the rows of the former per-type document_store_<type> tables into `documents`.
+
+    Those tables numbered their documents independently, so an id may exist in several of them.
+    The first document keeps its id, every other one gets a new id that is recorded in
+    document_id_remaps, since its chunks in Chroma still carry the old one. Unfinished ingestion
+    jobs already own an id in their type's table and are moved the same way.
+    """
+    with connection() as conn:
+        legacy_tables = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'document_store_%'")}
+        if not legacy_tables:
+            return
+
+        rows = []
+        for data_type in DataType:
+            table_name = f"document_store_{data_type.name.lower()}"
+            if table_name in legacy_tables:
+                rows.extend((data_type.name, row['id'], row['filename'], row['upload_timestamp'], DOCUMENT_INDEXED)
+                            for row in conn.execute(f'SELECT id, filename, upload_timestamp FROM {table_name} '
+                                                    f'ORDER BY id'))
+        # Reserved by an ingestion job that has not published its document yet
+        rows.extend((row['data_type'], row['file_id'], row['filename'], row['created_at'], DOCUMENT_PENDING)
+                    for row in conn.execute("SELECT data_type, file_id, filename, created_at FROM ingestion_jobs "
+                                            "WHERE status IN ('queued', 'running') AND file_id IS NOT NULL"))
+
+        taken = {row[0] for row in conn.execute('SELECT id FROM documents')}
+        colliding = []
+        for data_type, old_id, filename, upload_timestamp, status in rows:
+            if old_id in taken:
+                colliding.append((data_type, old_id, filename, upload_timestamp, status))
+                continue
+            taken.add(old_id)
+            conn.execute('INSERT INTO documents (id, data_type, filename, status, upload_timestamp) '
+                         'VALUES (?, ?, ?, ?, ?)',
+                         (old_id, data_type, filename, status, upload_timestamp))
+        # Only now, so that new ids are above every id kept above
+        for data_type, old_id, filename, upload_timestamp, status in colliding:
+            new_id = conn.execute('INSERT INTO documents (data_type, filename, status, upload_timestamp) '
+                                  'VALUES (?, ?, ?, ?)',
+                                  (data_type, filename, status, upload_timestamp)).lastrowid
+            conn.execute('INSERT INTO document_id_remaps (data_type, old_id, new_id) VALUES (?, ?, ?)',
+                         (data_type, old_id, new_id))
+            conn.execute("UPDATE ingestion_jobs SET file_id = ? WHERE data_type = ? AND file_id = ? "
+                         "AND status IN ('queued', 'running')",
+                         (new_id, data_type, old_id))
+
+        for table_name in legacy_tables:
+            conn.execute(f'DROP TABLE {table_name}')
+    logger.info(f"Migrated {len(rows)} documents from {len(legacy_tables)} per-type tables, "
+                f"{len(colliding)} of them under a new id")
+
+
+def get_document_id_remaps():
+    with connection() as conn:
+        return [dict(row) for row in conn.execute('SELECT data_type, old_id, new_id FROM document_id_remaps')]
+
+
+def delete_document_id_remap(data_type: DataType, old_id):
+    with connection() as conn:
+        conn.execute('DELETE FROM document_id_remaps WHERE data_type = ? AND old_id = ?', (data_type.name, old_id))
+
+
+def insert_document_record(filename, data_type: DataType, content_hash=None, size=None, status=DOCUMENT_INDEXED,
+                           source_path=None):
+    with connection() as conn:
+        cursor = conn.execute('INSERT INTO documents (data_type, filename, content_hash, size, status, source_path) '
+                              'VALUES (?, ?, ?, ?, ?, ?)',
+                              (data_type.name, filename, content_hash, size, status, source_path))
+        return cursor.lastrowid
+
+
+def update_document_status(file_id, status, chunk_count=None):
+    with connection() as conn:
+        conn.execute('UPDATE documents SET status = ?, chunk_count = COALESCE(?, chunk_count) WHERE id = ?',
+                     (status, chunk_count, file_id))
+
+
+def update_document_content(file_id, content_hash, size, chunk_count, source_path=None):
+    """Records a new version of a document that was re-indexed in place, under the same id."""
+    with connection() as conn:
+        conn.execute('UPDATE documents SET content_hash = ?, size = ?, chunk_count = ?, status = ?, '
+                     'source_path = COALESCE(?, source_path), upload_timestamp = CURRENT_TIMESTAMP WHERE id = ?',
+                     (content_hash, size, chunk_count, DOCUMENT_INDEXED, source_path, file_id))
+
+
+def get_document_by_source_path(source_path, data_type: DataType):
+    """The document synced from `source_path` (see api.data.reindex), or else the document uploaded
+    by hand for the same file, which is then adopted by the sync.
+
+    Uploads only keep the base name of a file (`Foo.java` for `owner/repo:src/main/java/Foo.java`).
+    Uploads under one name are versions of one file, so the newest is adopted, unless another path
+    with that base name was synced already: the upload may then be either file, and none is adopted.
+    """
+    path = source_path.split(':', 1)[-1]
+    name = path.rsplit('/', 1)[-1]
+    with connection() as conn:
+        row = conn.execute(f'SELECT {DOCUMENT_COLUMNS} FROM documents WHERE data_type = ? AND source_path = ? '
+                           f'ORDER BY id DESC LIMIT 1',
+                           (data_type.name, source_path)).fetchone()
+        if row is not None:
+            return dict(row)
+
+        # Synced documents are named by their path, or keep the name of the upload they adopted
+        escaped = name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        other = conn.execute("SELECT source_path FROM documents WHERE data_type = ? AND source_path IS NOT NULL "
+                             "AND (filename = ? OR filename LIKE ? ESCAPE '\\') LIMIT 1",
+                             (data_type.name, name, f"%/{escaped}")).fetchone()
+        if other is not None:
+            logger.info(f"Not adopting an upload named {name} for {source_path}: {other[0]} has the same name")
+            return None
+        row = conn.execute(f'SELECT {DOCUMENT_COLUMNS} FROM documents WHERE data_type = ? AND filename IN (?, ?) '
+                           f'AND source_path IS NULL AND status = ? ORDER BY id DESC LIMIT 1',
+                           (data_type.name, name, path, DOCUMENT_INDEXED)).fetchone()
+    return dict(row) if row else None
 
 
 def delete_document_record(file_id, data_type: DataType):
-    conn = get_db_connection()
-    table_name = f"document_store_{data_type.name.lower()}"
-    conn.execute(f'DELETE FROM {table_name} WHERE id = ?', (file_id,))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        if conn.execute('DELETE FROM documents WHERE id = ? AND data_type = ?', (file_id, data_type.name)).rowcount:
+            _delete_code_graphs(conn, [file_id])
     return True
 
 
+def get_replaced_document_ids(file_id):
+    """Ids of the other indexed documents with the same file name and data type as `file_id`."""
+    with connection() as conn:
+        rows = conn.execute('SELECT other.id FROM documents AS document '
+                            'JOIN documents AS other ON other.data_type = document.data_type '
+                            'AND other.filename = document.filename AND other.id != document.id '
+                            'WHERE document.id = ? AND other.status = ?',
+                            (file_id, DOCUMENT_INDEXED)).fetchall()
+    return [row[0] for row in rows]
+
+
+def get_document(file_id):
+    with connection() as conn:
+        row = conn.execute(f'SELECT {DOCUMENT_COLUMNS} FROM documents WHERE id = ?', (file_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def encode_cursor(document: dict) -> str:
+    key = json.dumps([document['upload_timestamp'], document['id']])
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """Returns the (upload_timestamp, id) key of a cursor; raises ValueError if it is malformed."""
+    try:
+        upload_timestamp, file_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(upload_timestamp, str) or not isinstance(file_id, int):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return upload_timestamp, file_id
+
+
+def get_documents_page(data_type: DataType = None, status=DOCUMENT_INDEXED, limit=100, cursor=None):
+    """Returns up to `limit` documents, newest first, and the cursor of the next page (None on the last page).
+
+    Keyset pagination: a page starts right after the (upload_timestamp, id) of the previous page's
+    last document, so every page is a single range scan of a listing index.
+    """
+    conditions, params = ['status = ?'], [status]
+    if data_type is not None:
+        conditions.append('data_type = ?')
+        params.append(data_type.name)
+    if cursor is not None:
+        conditions.append('(upload_timestamp, id) < (?, ?)')
+        params.extend(decode_cursor(cursor))
+
+    with connection() as conn:
+        rows = conn.execute(f'SELECT {DOCUMENT_COLUMNS} FROM documents WHERE {" AND ".join(conditions)} '
+                            f'ORDER BY upload_timestamp DESC, id DESC LIMIT ?',
+                            (*params, limit + 1)).fetchall()
+
+    documents = [dict(row) for row in rows[:limit]]
+    next_cursor = encode_cursor(documents[-1]) if len(rows) > limit else None
+    return documents, next_cursor
+
+
 def get_all_documents(data_type: DataType = None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    if data_type is None:
-        # Get documents from all tables
-        documents = []
-        for dtype in DataType:
-            table_name = f"document_store_{dtype.name.lower()}"
-            cursor.execute(
-                f'SELECT id, filename, upload_timestamp, ? as data_type FROM {table_name} ORDER BY upload_timestamp DESC',
-                (dtype.name,))
-            documents.extend(cursor.fetchall())
-    else:
-        # Get documents from specific table
-        table_name = f"document_store_{data_type.name.lower()}"
-        cursor.execute(
-            f'SELECT id, filename, upload_timestamp, ? as data_type FROM {table_name} ORDER BY upload_timestamp DESC',
-            (data_type.name,))
-        documents = cursor.fetchall()
-
-    conn.close()
-    return [dict(doc) for doc in documents]
+    with connection() as conn:
+        if data_type is None:
+            rows = conn.execute(f'SELECT {DOCUMENT_COLUMNS} FROM documents WHERE status = ? '
+                                f'ORDER BY upload_timestamp DESC, id DESC',
+                                (DOCUMENT_INDEXED,)).fetchall()
+        else:
+            rows = conn.execute(f'SELECT {DOCUMENT_COLUMNS} FROM documents WHERE status = ? AND data_type = ? '
+                                f'ORDER BY upload_timestamp DESC, id DESC',
+                                (DOCUMENT_INDEXED, data_type.name)).fetchall()
+    return [dict(row) for row in rows]
 
 
 def get_documents_by_type(data_type: DataType):
     return get_all_documents(data_type)
 
 
-create_application_logs()
-create_document_tables()
\ No newline at end of file
+def _job_to_dict(row):
+    job = dict(row)
+    job['progress'] = json.loads(job['progress']) if job['progress'] else None
+    return job
+
+
+def insert_ingestion_job(job_id, filename, data_type: DataType, file_path, file_id=None):
+    with connection() as conn:
+        conn.execute('INSERT INTO ingestion_jobs (id, filename, data_type, file_path, status, file_id) '
+                     'VALUES (?, ?, ?, ?, ?, ?)',
+                     (job_id, filename, data_type.name, file_path, 'queued', file_id))
+
+
+def get_ingestion_job(job_id):
+    with connection() as conn:
+        row = conn.execute('SELECT * FROM ingestion_jobs WHERE id = ?', (job_id,)).fetchone()
+    return _job_to_dict(row) if row else None
+
+
+def get_ingestion_jobs(status=None, limit=100):
+    with connection() as conn:
+        if status is None:
+            rows = conn.execute('SELECT * FROM ingestion_jobs ORDER BY created_at DESC LIMIT ?', (limit,)).fetchall()
+        else:
+            rows = conn.execute('SELECT * FROM ingestion_jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?',
+                                (status, limit)).fetchall()
+    return [_job_to_dict(row) for row in rows]
+
+
+def start_ingestion_job(job_id, file_id):
+    with connection() as conn:
+        conn.execute('UPDATE ingestion_jobs SET status = ?, file_id = ?, attempts = attempts + 1, error = NULL, '
+                     'updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                     ('running', file_id, job_id))
+
+
+def update_ingestion_job_progress(job_id, progress: dict):
+    with connection() as conn:
+        conn.execute('UPDATE ingestion_jobs SET progress = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                     (json.dumps(progress), job_id))
+
+
+def update_ingestion_job_status(job_id, status, error=None):
+    with connection() as conn:
+        conn.execute('UPDATE ingestion_jobs SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                     (status, error, job_id))
+
+
+def complete_ingestion_job(job_id, file_id, chunk_count):
+    """Marks the document as indexed and the job as done in one transaction."""
+    with connection() as conn:
+        conn.execute('UPDATE documents SET status = ?, chunk_count = ? WHERE id = ?',
+                     (DOCUMENT_INDEXED, chunk_count, file_id))
+        conn.execute('UPDATE ingestion_jobs SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                     ('succeeded', job_id))
+
+
+def insert_code_graph_rows(graph_id, files, methods, violations):
+    """Inserts rows of a code graph; `files`, `methods` and `violations` are tuples of their columns after graph_id."""
+    with connection() as conn:
+        conn.executemany('INSERT INTO graph_files (graph_id, path, file_name, vertex_id, violation_count) '
+                         'VALUES (?, ?, ?, ?, ?)', [(graph_id, *row) for row in files])
+        conn.executemany('INSERT INTO graph_methods (graph_id, path, file_name, name, full_name, signature, '
+                         'start_line, end_line) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', [(graph_id, *row) for row in methods])
+        conn.executemany('INSERT INTO graph_violations (graph_id, path, file_name, start_line, end_line, rule, '
+                         'ruleset, priority, description) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         [(graph_id, *row) for row in violations])
+
+
+def _delete_code_graphs(conn, graph_ids):
+    for table in ('graph_files', 'graph_methods', 'graph_violations'):
+        conn.executemany(f'DELETE FROM {table} WHERE graph_id = ?', [(graph_id,) for graph_id in graph_ids])
+
+
+def delete_code_graphs(graph_ids):
+    with connection() as conn:
+        _delete_code_graphs(conn, graph_ids)
+
+
+def _graph_path_condition(path):
+    """Matches `path` exactly or as the trailing part of a longer path, via the indexed base name."""
+    path = re.sub(r'^(?:\./|/)+', '', path.replace('\\', '/'))
+    escaped = path.replace('%', '\\%').replace('_', '\\_')
+    return "file_name = ? AND (path = ? OR path LIKE ? ESCAPE '\\')", [path.rsplit('/', 1)[-1], path, f"%/{escaped}"]
+
+
+def get_graph_violations(path, start_line=None, end_line=None, limit=100):
+    """PMD violations of a file from the code graphs, optionally only those overlapping the given lines."""
+    condition, params = _graph_path_condition(path)
+    if start_line is not None:
+        condition += ' AND COALESCE(end_line, start_line) >= ?'
+        params.append(start_line)
+    if end_line is not None:
+        condition += ' AND start_line <= ?'
+        params.append(end_line)
+    with connection() as conn:
+        rows = conn.execute(f'SELECT graph_id, path, start_line, end_line, rule, ruleset, priority, description '
+                            f'FROM graph_violations WHERE {condition} ORDER BY priority, start_line LIMIT ?',
+                            (*params, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_graph_file_paths(path):
+    """The distinct paths of the files in the code graphs that `path` matches, see `_graph_path_condition`."""
+    condition, params = _graph_path_condition(path)
+    with connection() as conn:
+        return [row[0] for row in conn.execute(f'SELECT DISTINCT path FROM graph_files WHERE {condition}', params)]
+
+
+def get_graph_methods(path, line=None):
+    """Methods of a file from the code graphs, optionally only the one(s) containing `line`."""
+    condition, params = _graph_path_condition(path)
+    if line is not None:
+        condition += ' AND start_line <= ? AND end_line >= ?'
+        params.extend([line, line])
+    with connection() as conn:
+        rows = conn.execute(f'SELECT graph_id, path, name, full_name, signature, start_line, end_line '
+                            f'FROM graph_methods WHERE {condition} ORDER BY start_line', params).fetchall()
+    return [dict(row) for row in rows]
+
+
+init_db()
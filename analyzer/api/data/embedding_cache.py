@@ -0,0 +1,143 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+from api import logs
+
+logger = logs.get_logger(__name__)
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def _pack(vector: List[float]) -> bytes:
+    return array('f', vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    vector = array('f')
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCacheStore:
+    """SQLite table of embeddings keyed by (model, sha256 of the chunk text).
+
+    Vectors are stored as float32, the precision Chroma keeps them in anyway. Every hit refreshes
+    the entry's last use; once the table grows past `max_entries`, the least recently used tenth
+    is evicted.
+    """
+
+    def __init__(self, path: str, max_entries: int = 200_000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS embedding_cache
+                              (model TEXT NOT NULL,
+                               chunk_hash TEXT NOT NULL,
+                               vector BLOB NOT NULL,
+                               last_used REAL NOT NULL,
+                               PRIMARY KEY (model, chunk_hash))''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used ON embedding_cache (last_used)')
+        self._conn.commit()
+        self._entries = self._conn.execute('SELECT COUNT(*) FROM embedding_cache').fetchone()[0]
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        if not hashes:
+            return {}
+        found = {}
+        with self._lock:
+            # Stay below SQLite's default limit of 999 bound parameters
+            for start in range(0, len(hashes), 900):
+                part = hashes[start:start + 900]
+                placeholders = ','.join('?' * len(part))
+                rows = self._conn.execute(
+                    f'SELECT chunk_hash, vector FROM embedding_cache WHERE model = ? AND chunk_hash IN ({placeholders})',
+                    (model, *part))
+                for hash_, blob in rows:
+                    found[hash_] = _unpack(blob)
+            if found:
+                now = time.time()
+                self._conn.executemany('UPDATE embedding_cache SET last_used = ? WHERE model = ? AND chunk_hash = ?',
+                                       [(now, model, hash_) for hash_ in found])
+                self._conn.commit()
+            self._stats["hits"] += len(found)
+            self._stats["misses"] += len(set(hashes)) - len(found)
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]):
+        if not vectors:
+            return
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany('INSERT OR IGNORE INTO embedding_cache (model, chunk_hash, vector, last_used) '
+                                   'VALUES (?, ?, ?, ?)',
+                                   [(model, hash_, _pack(vector), now) for hash_, vector in vectors.items()])
+            self._entries += self._conn.total_changes - before
+            if self._entries > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        target = int(self.max_entries * 0.9)
+        count = self._entries - target
+        self._conn.execute('DELETE FROM embedding_cache WHERE rowid IN '
+                           '(SELECT rowid FROM embedding_cache ORDER BY last_used LIMIT ?)', (count,))
+        self._entries = target
+        self._stats["evictions"] += count
+        logger.info(f"Evicted {count} least recently used embeddings from the cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._entries
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        return stats
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings that only send chunks to `embeddings` whose vectors are not cached yet.
+
+    Queries are passed through, since they are rarely repeated verbatim.
+    """
+
+    def __init__(self, embeddings: Embeddings, store: EmbeddingCacheStore, model: str):
+        self.embeddings = embeddings
+        self.store = store
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [chunk_hash(text) for text in texts]
+        vectors = self.store.get_many(self.model, hashes)
+
+        # Identical chunks within one call are embedded once
+        missing: Dict[str, str] = {}
+        for hash_, text in zip(hashes, texts):
+            if hash_ not in vectors:
+                missing.setdefault(hash_, text)
+        if missing:
+            embedded = self.embeddings.embed_documents(list(missing.values()))
+            new_vectors = dict(zip(missing.keys(), embedded))
+            self.store.put_many(self.model, new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[hash_] for hash_ in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    def stats(self) -> dict:
+        return self.store.stats()
@@ -0,0 +1,182 @@
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from api import logs
+
+logger = logs.get_logger(__name__)
+
+
+@dataclass
+class EmbeddingProgress:
+    """Progress of one indexing run, passed to `on_progress` after every written batch."""
+    name: str
+    total_chunks: int
+    total_batches: int
+    embedded_chunks: int = 0
+    written_batches: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def chunks_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.embedded_chunks / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def done(self) -> bool:
+        return self.written_batches == self.total_batches
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "total_chunks": self.total_chunks,
+            "embedded_chunks": self.embedded_chunks,
+            "total_batches": self.total_batches,
+            "written_batches": self.written_batches,
+            "elapsed": round(self.elapsed, 3),
+            "chunks_per_second": round(self.chunks_per_second, 2),
+        }
+
+
+ProgressCallback = Callable[[EmbeddingProgress], None]
+
+
+class EmbeddingPipeline:
+    """Embeds chunks in batches on a shared pool of workers and writes them to Chroma in order.
+
+    The pool size bounds the concurrent requests against the embedding backend for all callers
+    together. Each call keeps at most `max_pending_batches` batches in flight, so a huge upload
+    waits for the backend instead of queueing all of its chunks at once.
+    Any `Embeddings` implementation works, e.g. `DeterministicFakeEmbedding` for local runs.
+    """
+
+    def __init__(self, embeddings: Embeddings, batch_size: int = 32, max_concurrency: int = 4,
+                 max_pending_batches: Optional[int] = None):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_pending_batches = max_pending_batches or max_concurrency * 2
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embedding")
+        self._lock = threading.Lock()
+        self._active: dict[str, EmbeddingProgress] = {}
+        self._stats = {"batches": 0, "chunks": 0, "failed_batches": 0, "embedding_seconds": 0.0}
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        started = time.monotonic()
+        try:
+            vectors = self.embeddings.embed_documents(texts)
+        except Exception:
+            with self._lock:
+                self._stats["failed_batches"] += 1
+            raise
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["chunks"] += len(texts)
+            self._stats["embedding_seconds"] += time.monotonic() - started
+        return vectors
+
+    def _batches(self, items: list) -> List[list]:
+        return [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+
+    def _run(self, texts: List[str], name: str, on_batch: Callable[[int, List[List[float]]], None],
+             on_progress: Optional[ProgressCallback]) -> EmbeddingProgress:
+        batches = self._batches(texts)
+        progress = EmbeddingProgress(name=name, total_chunks=len(texts), total_batches=len(batches))
+        with self._lock:
+            self._active[name] = progress
+
+        pending: deque[tuple[int, Future]] = deque()
+
+        def complete_oldest():
+            start, future = pending.popleft()
+            vectors = future.result()
+            on_batch(start, vectors)
+            progress.embedded_chunks += len(vectors)
+            progress.written_batches += 1
+            if on_progress is not None:
+                on_progress(progress)
+
+        try:
+            for index, batch in enumerate(batches):
+                # Backpressure: wait for the oldest batch before submitting more
+                while len(pending) >= self.max_pending_batches:
+                    complete_oldest()
+                pending.append((index * self.batch_size, self._executor.submit(self._embed_batch, batch)))
+            while pending:
+                complete_oldest()
+        except Exception:
+            for _, future in pending:
+                future.cancel()
+            raise
+        finally:
+            with self._lock:
+                self._active.pop(name, None)
+
+        logger.info(f"Embedded {progress.total_chunks} chunks of '{name}' in {progress.total_batches} batches, "
+                    f"{progress.elapsed:.2f}s ({progress.chunks_per_second:.1f} chunks/s)")
+        return progress
+
+    def embed_documents(self, texts: List[str], name: Optional[str] = None,
+                        on_progress: Optional[ProgressCallback] = None) -> List[List[float]]:
+        vectors: List[List[float]] = [[] for _ in texts]
+
+        def collect(start: int, batch_vectors: List[List[float]]):
+            vectors[start:start + len(batch_vectors)] = batch_vectors
+
+        self._run(texts, name or uuid.uuid4().hex, collect, on_progress)
+        return vectors
+
+    def index_documents(self, vectorstore: Chroma, documents: List[Document], name: Optional[str] = None,
+                        on_progress: Optional[ProgressCallback] = None) -> List[str]:
+        """Embeds `documents` and upserts each batch into `vectorstore` as soon as it is ready.
+
+        If anything fails, the batches written so far are deleted again, so a document is never
+        left half-indexed. Returns the Chroma ids of the written chunks.
+        """
+        ids = [str(uuid.uuid4()) for _ in documents]
+        written_ids: List[str] = []
+
+        def write(start: int, batch_vectors: List[List[float]]):
+            end = start + len(batch_vectors)
+            # Chroma has no public API for precomputed embeddings; go through its collection like add_texts does
+            vectorstore._collection.upsert(
+                ids=ids[start:end],
+                embeddings=batch_vectors,
+                documents=[doc.page_content for doc in documents[start:end]],
+                metadatas=[doc.metadata for doc in documents[start:end]],
+            )
+            written_ids.extend(ids[start:end])
+
+        try:
+            self._run([doc.page_content for doc in documents], name or uuid.uuid4().hex, write, on_progress)
+        except Exception:
+            if written_ids:
+                logger.warning(f"Removing {len(written_ids)} already written chunks after a failed indexing run")
+                vectorstore.delete(ids=written_ids)
+            raise
+        return ids
+
+    def active(self) -> List[dict]:
+        """Progress of all indexing runs currently in the pipeline."""
+        with self._lock:
+            return [progress.to_dict() for progress in self._active.values()]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["avg_batch_seconds"] = stats["embedding_seconds"] / stats["batches"] if stats["batches"] else 0.0
+        stats["batch_size"] = self.batch_size
+        stats["max_concurrency"] = self.max_concurrency
+        return stats
@@ -0,0 +1,175 @@
+import hashlib
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Optional
+
+from api import logs
+from api.data.db import insert_ingestion_job, get_ingestion_job, get_ingestion_jobs, start_ingestion_job, \
+    update_ingestion_job_progress, update_ingestion_job_status, complete_ingestion_job, insert_document_record, \
+    update_document_status, get_document_id_remaps, delete_document_id_remap, get_replaced_document_ids, \
+    delete_code_graphs, DOCUMENT_PENDING, DOCUMENT_FAILED
+from api.data.code_graph import index_code_graph
+from api.data.embedding_pipeline import EmbeddingProgress
+from api.data.response_cache import get_response_cache
+from api.data.types import DataType
+from api.data.vectorstore import index_document_to_chroma, delete_doc_from_chroma, relabel_doc_in_chroma
+from api.env import INGESTION_WORKERS, INGESTION_MAX_ATTEMPTS, INGESTION_RETRY_DELAY, INGESTION_UPLOAD_DIR
+
+logger = logs.get_logger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+
+class IngestionQueue:
+    """Indexes uploaded documents on a pool of worker threads.
+
+    Jobs live in the `ingestion_jobs` table and their files in INGESTION_UPLOAD_DIR, so queued and
+    interrupted jobs are picked up again by `recover` after a restart. A document is listed as
+    `pending` in the catalog until all of its chunks are in Chroma (see `complete_ingestion_job`).
+    """
+
+    def __init__(self, workers: int, max_attempts: int, retry_delay: float, upload_dir: str):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.upload_dir = upload_dir
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingestion")
+        os.makedirs(upload_dir, exist_ok=True)
+
+    def submit_upload(self, filename: str, source: BinaryIO, dtype: DataType) -> str:
+        """Persists the uploaded file, records the document and the job and queues it. Returns the job id."""
+        job_id, file_path = self.new_upload(filename)
+        content_hash, size = self._copy(source, file_path)
+        return self.submit_file(job_id, filename, dtype, file_path, content_hash, size)
+
+    def new_upload(self, filename: str):
+        """A job id and the path in the upload directory to write the file of that job to."""
+        job_id = uuid.uuid4().hex
+        return job_id, os.path.join(self.upload_dir, f"{job_id}_{os.path.basename(filename)}")
+
+    def submit_file(self, job_id: str, filename: str, dtype: DataType, file_path: str, content_hash: str,
+                    size: int) -> str:
+        """Records the document and the job for a file written to the path from `new_upload`, and queues it."""
+        file_id = insert_document_record(filename, dtype, content_hash, size, status=DOCUMENT_PENDING)
+        insert_ingestion_job(job_id, filename, dtype, file_path, file_id)
+        self._executor.submit(self._run, job_id)
+        logger.info(f"Queued ingestion job {job_id} for {filename} ({dtype.name})")
+        return job_id
+
+    @staticmethod
+    def _copy(source: BinaryIO, file_path: str):
+        digest = hashlib.sha256()
+        size = 0
+        with open(file_path, "wb") as buffer:
+            for block in iter(lambda: source.read(1024 * 1024), b""):
+                digest.update(block)
+                size += len(block)
+                buffer.write(block)
+        return digest.hexdigest(), size
+
+    def recover(self):
+        """Re-queues jobs that were queued or running when the API stopped."""
+        # Chunks of documents that got a new id in the catalog migration
+        for remap in get_document_id_remaps():
+            dtype = DataType[remap['data_type']]
+            relabelled = relabel_doc_in_chroma(remap['old_id'], remap['new_id'], dtype)
+            delete_document_id_remap(dtype, remap['old_id'])
+            logger.info(f"Moved {relabelled} chunks of {dtype.name} document {remap['old_id']} to id {remap['new_id']}")
+
+        for job in get_ingestion_jobs(JOB_RUNNING, limit=-1):
+            # The run was interrupted, so its chunks may be only partially written
+            self._discard_chunks(job)
+            update_ingestion_job_status(job['id'], JOB_QUEUED, "interrupted by a restart")
+        queued = get_ingestion_jobs(JOB_QUEUED, limit=-1)
+        for job in reversed(queued):
+            self._executor.submit(self._run, job['id'])
+        if queued:
+            logger.info(f"Recovered {len(queued)} ingestion jobs")
+
+    def _discard_chunks(self, job: dict):
+        if job['file_id'] is not None:
+            delete_doc_from_chroma(job['file_id'], DataType[job['data_type']])
+            delete_code_graphs([job['file_id']])
+
+    def _run(self, job_id: str):
+        job = get_ingestion_job(job_id)
+        if job is None or job['status'] != JOB_QUEUED:
+            return
+        dtype = DataType[job['data_type']]
+
+        file_id = job['file_id']
+        if file_id is None:
+            # Queued before the document catalog existed
+            with open(job['file_path'], "rb") as f:
+                content_hash, size = self._copy(f, os.devnull)
+            file_id = insert_document_record(job['filename'], dtype, content_hash, size, status=DOCUMENT_PENDING)
+        start_ingestion_job(job_id, file_id)
+
+        def on_progress(progress: EmbeddingProgress):
+            update_ingestion_job_progress(job_id, progress.to_dict())
+
+        logger.info(f"Ingestion job {job_id}: indexing {job['filename']} as file_id {file_id} "
+                    f"(attempt {job['attempts'] + 1}/{self.max_attempts})")
+        try:
+            chunk_count = index_document_to_chroma(job['file_path'], file_id, dtype, on_progress=on_progress)
+            success = chunk_count is not None
+            graph = None
+            if success and dtype == DataType.REPORTS and job['file_path'].endswith('.json'):
+                # Merged Joern/PMD graphs are also indexed by file and line, see api.data.code_graph
+                graph = index_code_graph(job['file_path'], file_id)
+            if success:
+                complete_ingestion_job(job_id, file_id, chunk_count)
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {e}", exc_info=True)
+            success = False
+
+        if success:
+            logger.info(f"Ingestion job {job_id} succeeded")
+            # A new upload of a file replaces what was generated from its earlier versions
+            replaced = get_replaced_document_ids(file_id)
+            cache = get_response_cache()
+            if cache is not None:
+                cache.invalidate_files(replaced)
+            if graph is not None:
+                # Only the newest version of a graph is queried
+                delete_code_graphs(replaced)
+            self._remove_file(job['file_path'])
+            return
+
+        # index_document_to_chroma removes what it wrote; this also covers a failed final commit
+        self._discard_chunks(get_ingestion_job(job_id))
+        if job['attempts'] + 1 < self.max_attempts:
+            update_ingestion_job_status(job_id, JOB_QUEUED, "indexing failed, retry scheduled")
+            delay = self.retry_delay * 2 ** job['attempts']
+            logger.warning(f"Ingestion job {job_id} will be retried in {delay:.0f}s")
+            timer = threading.Timer(delay, lambda: self._executor.submit(self._run, job_id))
+            timer.daemon = True
+            timer.start()
+        else:
+            update_ingestion_job_status(job_id, JOB_FAILED, f"indexing failed after {self.max_attempts} attempts")
+            update_document_status(file_id, DOCUMENT_FAILED)
+            self._remove_file(job['file_path'])
+
+    @staticmethod
+    def _remove_file(file_path: str):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+__ingestion_queue: Optional[IngestionQueue] = None
+
+
+def get_ingestion_queue() -> IngestionQueue:
+    global __ingestion_queue
+    if __ingestion_queue is None:
+        __ingestion_queue = IngestionQueue(
+            INGESTION_WORKERS,
+            max_attempts=INGESTION_MAX_ATTEMPTS,
+            retry_delay=INGESTION_RETRY_DELAY,
+            upload_dir=INGESTION_UPLOAD_DIR
+        )
+    return __ingestion_queue
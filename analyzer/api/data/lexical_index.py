@@ -0,0 +1,207 @@
+import json
+import re
+import sqlite3
+import threading
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from api import logs
+from api.env import LEXICAL_INDEX_ENABLED, LEXICAL_INDEX_PATH
+
+logger = logs.get_logger(__name__)
+
+IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*|[0-9]+')
+# Parts of camelCase, PascalCase, snake_case and ACRONYMCase identifiers
+IDENTIFIER_PART = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+')
+# Chunk metadata that names the code in a chunk, indexed apart from its text
+INDEXED_METADATA = ('class', 'method', 'filename', 'rule')
+# Weight of a term in those names relative to one in the text, so the chunk that defines a
+# method outranks the ones that merely call it
+NAME_WEIGHT = 4.0
+COLLECTION_NAME = re.compile(r'^[A-Za-z0-9_]+$')
+# Query terms sent to FTS5; the rest of a very long query adds little but time
+MAX_QUERY_TERMS = 64
+
+
+def terms(text: str) -> Iterator[str]:
+    """Lowercase search terms of a text: every identifier, and its parts if it is a compound one,
+    so `OrderService.refund` is found by `orderservice`, `order`, `service` and `refund`."""
+    for identifier in IDENTIFIER.findall(text):
+        if len(identifier) < 2:
+            continue
+        yield identifier.lower()
+        parts = IDENTIFIER_PART.findall(identifier)
+        if len(parts) > 1:
+            yield from (part.lower() for part in parts if len(part) > 1)
+
+
+def names(metadata: dict) -> str:
+    """The names of the code in a chunk (class, method, file, rule) from its metadata."""
+    return "\n".join(str(metadata[key]) for key in INDEXED_METADATA if metadata.get(key))
+
+
+def searchable_text(document: Document) -> str:
+    return f"{document.page_content}\n{names(document.metadata)}"
+
+
+class LexicalIndex:
+    """SQLite FTS5 index of the chunks in the vector store, ranked by BM25.
+
+    Every collection gets its own FTS5 table, so term statistics of large reports do not skew
+    the ranking of source code. Chunks are stored under their Chroma id, so lexical and vector
+    results of the same chunk can be matched up, and the index is kept in step with Chroma by
+    the functions in vectorstore.py.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS lexical_chunks
+                              (id INTEGER PRIMARY KEY,
+                               collection TEXT NOT NULL,
+                               chunk_id TEXT NOT NULL,
+                               file_id INTEGER,
+                               content TEXT NOT NULL,
+                               metadata TEXT NOT NULL)''')
+        self._conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_lexical_chunks_chunk_id '
+                           'ON lexical_chunks (collection, chunk_id)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_lexical_chunks_file_id '
+                           'ON lexical_chunks (collection, file_id)')
+        self._conn.commit()
+        self._tables = set()
+
+    def _terms_table(self, collection: str) -> str:
+        if not COLLECTION_NAME.match(collection):
+            raise ValueError(f"Invalid collection name: {collection}")
+        table = f"lexical_terms_{collection}"
+        if table not in self._tables:
+            # Terms are lowercase identifiers separated by spaces; '_' belongs to the identifier
+            self._conn.execute(f'''CREATE VIRTUAL TABLE IF NOT EXISTS {table}
+                                   USING fts5(text_terms, name_terms, tokenize="unicode61 tokenchars '_'")''')
+            # Number of chunks per term, see `_match_expression`
+            self._conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_vocab USING fts5vocab({table}, 'row')")
+            self._tables.add(table)
+        return table
+
+    def add(self, collection: str, ids: List[str], documents: List[Document]):
+        """Indexes `documents` under their Chroma `ids`, replacing chunks with the same ids."""
+        with self._lock:
+            table = self._terms_table(collection)
+            self._delete_rows(collection, table, 'chunk_id', ids)
+            for chunk_id, document in zip(ids, documents):
+                rowid = self._conn.execute(
+                    'INSERT INTO lexical_chunks (collection, chunk_id, file_id, content, metadata) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (collection, chunk_id, document.metadata.get('file_id'), document.page_content,
+                     json.dumps(document.metadata))).lastrowid
+                self._conn.execute(f'INSERT INTO {table} (rowid, text_terms, name_terms) VALUES (?, ?, ?)',
+                                   (rowid, " ".join(terms(document.page_content)),
+                                    " ".join(terms(names(document.metadata)))))
+            self._conn.commit()
+
+    def update_metadata(self, collection: str, ids: List[str], metadatas: List[dict]):
+        """Replaces the metadata of chunks whose text did not change (see `reindex_document_in_chroma`)."""
+        with self._lock:
+            table = self._terms_table(collection)
+            for chunk_id, metadata in zip(ids, metadatas):
+                row = self._conn.execute('SELECT id FROM lexical_chunks WHERE collection = ? AND chunk_id = ?',
+                                         (collection, chunk_id)).fetchone()
+                if row is None:
+                    continue
+                self._conn.execute('UPDATE lexical_chunks SET file_id = ?, metadata = ? WHERE id = ?',
+                                   (metadata.get('file_id'), json.dumps(metadata), row[0]))
+                self._conn.execute(f'UPDATE {table} SET name_terms = ? WHERE rowid = ?',
+                                   (" ".join(terms(names(metadata))), row[0]))
+            self._conn.commit()
+
+    def relabel(self, collection: str, old_file_id: int, new_file_id: int):
+        with self._lock:
+            self._conn.execute("UPDATE lexical_chunks SET file_id = ?, metadata = json_set(metadata, '$.file_id', ?) "
+                               "WHERE collection = ? AND file_id = ?",
+                               (new_file_id, new_file_id, collection, old_file_id))
+            self._conn.commit()
+
+    def delete(self, collection: str, ids: Optional[Iterable[str]] = None, file_id: Optional[int] = None):
+        """Removes the chunks with the given Chroma `ids`, or all chunks of `file_id`."""
+        with self._lock:
+            table = self._terms_table(collection)
+            if ids is not None:
+                self._delete_rows(collection, table, 'chunk_id', list(ids))
+            if file_id is not None:
+                self._delete_rows(collection, table, 'file_id', [file_id])
+            self._conn.commit()
+
+    def _delete_rows(self, collection: str, table: str, column: str, values: list):
+        # Stay below SQLite's default limit of 999 bound parameters
+        for start in range(0, len(values), 500):
+            batch = values[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            rowids = [(row[0],) for row in self._conn.execute(
+                f'SELECT id FROM lexical_chunks WHERE collection = ? AND {column} IN ({placeholders})',
+                [collection] + batch)]
+            self._conn.executemany(f'DELETE FROM {table} WHERE rowid = ?', rowids)
+            self._conn.executemany('DELETE FROM lexical_chunks WHERE id = ?', rowids)
+
+    def clear(self, collection: str):
+        with self._lock:
+            self._conn.execute(f'DELETE FROM {self._terms_table(collection)}')
+            self._conn.execute('DELETE FROM lexical_chunks WHERE collection = ?', (collection,))
+            self._conn.commit()
+
+    def count(self, collection: str) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM lexical_chunks WHERE collection = ?',
+                                      (collection,)).fetchone()[0]
+
+    def _match_expression(self, collection: str, table: str, query: str) -> Optional[str]:
+        """FTS5 query for any of the terms of `query` that are in the index.
+
+        Terms in more than half of the chunks are left out: BM25 gives them no weight (FTS5 clamps
+        their IDF to almost zero), but matching them means scoring most of the index. Only if
+        all terms are that common are they kept.
+        """
+        unique = list(dict.fromkeys(terms(query)))[:MAX_QUERY_TERMS]
+        if not unique:
+            return None
+        placeholders = ','.join('?' * len(unique))
+        chunks_per_term = dict(self._conn.execute(
+            f'SELECT term, doc FROM {table}_vocab WHERE term IN ({placeholders})', unique).fetchall())
+        chunks = self._conn.execute('SELECT COUNT(*) FROM lexical_chunks WHERE collection = ?',
+                                    (collection,)).fetchone()[0]
+        found = [term for term in unique if chunks_per_term.get(term)]
+        selective = [term for term in found if chunks_per_term[term] <= chunks / 2]
+        return " OR ".join(f'"{term}"' for term in selective or found) or None
+
+    def search(self, collection: str, query: str, k: int) -> List[Tuple[Document, float]]:
+        """The `k` best chunks for the terms of `query` with their BM25 score, best first.
+        Any term may match; chunks matching more and rarer terms rank higher."""
+        with self._lock:
+            table = self._terms_table(collection)
+            expression = self._match_expression(collection, table, query)
+            if expression is None:
+                return []
+            # FTS5's bm25() is lower for better matches
+            rows = self._conn.execute(
+                f'SELECT c.chunk_id, c.content, c.metadata, -bm25({table}, 1.0, ?) AS score '
+                f'FROM {table} JOIN lexical_chunks c ON c.id = {table}.rowid '
+                f'WHERE {table} MATCH ? ORDER BY bm25({table}, 1.0, ?) LIMIT ?',
+                (NAME_WEIGHT, expression, NAME_WEIGHT, k)).fetchall()
+        return [(Document(id=chunk_id, page_content=content, metadata=json.loads(metadata)), score)
+                for chunk_id, content, metadata, score in rows]
+
+
+__lexical_index: Optional[LexicalIndex] = None
+__lexical_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> Optional[LexicalIndex]:
+    """The shared lexical index, or None if LEXICAL_INDEX_ENABLED is off."""
+    global __lexical_index
+    with __lexical_index_lock:
+        if __lexical_index is None and LEXICAL_INDEX_ENABLED:
+            __lexical_index = LexicalIndex(LEXICAL_INDEX_PATH)
+    return __lexical_index
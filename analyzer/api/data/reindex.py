@@ -0,0 +1,188 @@
+import hashlib
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import requests
+
+from api import logs
+from api.data.db import get_document_by_source_path, insert_document_record, update_document_content, \
+    update_document_status, delete_document_record, DOCUMENT_PENDING, DOCUMENT_INDEXED, DOCUMENT_FAILED
+from api.data.response_cache import get_response_cache
+from api.data.types import DataType
+from api.data.vectorstore import reindex_document_in_chroma, delete_doc_from_chroma
+from api.env import REINDEX_DEBOUNCE_SECONDS, GITHUB_RAW_URL, GITHUB_TOKEN
+
+logger = logs.get_logger(__name__)
+
+CHANGE_UPSERT = 'upsert'
+CHANGE_REMOVE = 'remove'
+
+
+def source_path(repository: str, path: str) -> str:
+    """Catalog key of a file in a repository, e.g. `owner/repo:src/main.py`."""
+    return f"{repository}:{path}"
+
+
+def push_changes(payload: dict) -> Dict[str, str]:
+    """Net change of every path touched by a push event: the last commit touching a path decides."""
+    changes = {}
+    for commit in payload.get('commits') or []:
+        for path in commit.get('added', []) + commit.get('modified', []):
+            changes[path] = CHANGE_UPSERT
+        for path in commit.get('removed', []):
+            changes[path] = CHANGE_REMOVE
+    return changes
+
+
+@dataclass
+class _Change:
+    action: str
+    ref: str
+
+
+class PushReindexer:
+    """Keeps the indexed source code in sync with the pushes to a repository's default branch.
+
+    Changes are collected per file for `debounce` seconds after the first push, so a series of
+    quick pushes costs one re-index per file in its final state. Files are fetched at the pushed
+    commit and re-indexed in place under their existing file_id, embedding only their changed
+    chunks (see `reindex_document_in_chroma`); removed files are dropped from Chroma and the catalog.
+    """
+
+    def __init__(self, debounce: float, raw_url: str, token: Optional[str] = None,
+                 dtype: DataType = DataType.SOURCE_CODE):
+        self.debounce = debounce
+        self.raw_url = raw_url
+        self.token = token
+        self.dtype = dtype
+        self._pending: Dict[Tuple[str, str], _Change] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._session = requests.Session()
+
+    def submit_push(self, payload: dict) -> int:
+        """Queues the files changed by a push event. Returns the number of queued files."""
+        repository = payload['repository']['full_name']
+        default_branch = payload['repository'].get('default_branch')
+        if payload.get('deleted') or (default_branch and payload.get('ref') != f"refs/heads/{default_branch}"):
+            logger.info(f"Ignoring push to {payload.get('ref')} of {repository}")
+            return 0
+
+        changes = push_changes(payload)
+        with self._lock:
+            for path, action in changes.items():
+                self._pending[(repository, path)] = _Change(action, payload['after'])
+            if self._pending and self._timer is None:
+                self._timer = threading.Timer(self.debounce, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        logger.info(f"Queued {len(changes)} changed files of {repository} at {payload['after'][:12]}")
+        return len(changes)
+
+    def flush(self) -> Dict[str, int]:
+        """Applies the queued changes now. Returns counts of what was done with the files and chunks."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+
+            stats = {"files": len(pending), "indexed": 0, "unchanged": 0, "removed": 0, "failed": 0,
+                     "chunks_added": 0, "chunks_removed": 0, "chunks_kept": 0}
+            for (repository, path), change in pending.items():
+                try:
+                    if change.action == CHANGE_UPSERT:
+                        self._upsert(repository, path, change.ref, stats)
+                    else:
+                        self._remove(repository, path, stats)
+                except Exception as e:
+                    stats["failed"] += 1
+                    logger.error(f"Re-indexing {path} of {repository} failed: {e}", exc_info=True)
+            if pending:
+                logger.info(f"Applied pushed changes: {stats}")
+            return stats
+
+    def _fetch(self, repository: str, ref: str, path: str) -> Optional[bytes]:
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        response = self._session.get(self.raw_url.format(repository=repository, ref=ref, path=path),
+                                     headers=headers, timeout=30)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.content
+
+    def _upsert(self, repository: str, path: str, ref: str, stats: Dict[str, int]):
+        content = self._fetch(repository, ref, path)
+        if content is None:
+            # Gone again by the time we got to it
+            self._remove(repository, path, stats)
+            return
+
+        key = source_path(repository, path)
+        document = get_document_by_source_path(key, self.dtype)
+        content_hash = hashlib.sha256(content).hexdigest()
+        if document is not None and document['content_hash'] == content_hash \
+                and document['status'] == DOCUMENT_INDEXED:
+            stats["unchanged"] += 1
+            return
+
+        if document is None:
+            file_id = insert_document_record(path, self.dtype, content_hash, len(content),
+                                             status=DOCUMENT_PENDING, source_path=key)
+        else:
+            file_id = document['id']
+
+        # The splitter picks its strategy by file extension
+        fd, file_path = tempfile.mkstemp(suffix=os.path.splitext(path)[1])
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            result = reindex_document_in_chroma(file_path, file_id, self.dtype)
+        finally:
+            os.remove(file_path)
+
+        if result is None:
+            stats["failed"] += 1
+            if document is None:
+                update_document_status(file_id, DOCUMENT_FAILED)
+            return
+
+        update_document_content(file_id, content_hash, len(content), result["added"] + result["kept"], key)
+        stats["indexed"] += 1
+        stats["chunks_added"] += result["added"]
+        stats["chunks_removed"] += result["removed"]
+        stats["chunks_kept"] += result["kept"]
+        if document is not None:
+            self._invalidate(file_id)
+
+    def _remove(self, repository: str, path: str, stats: Dict[str, int]):
+        document = get_document_by_source_path(source_path(repository, path), self.dtype)
+        if document is None:
+            return
+        if not delete_doc_from_chroma(document['id'], self.dtype):
+            stats["failed"] += 1
+            return
+        delete_document_record(document['id'], self.dtype)
+        stats["removed"] += 1
+        self._invalidate(document['id'])
+
+    @staticmethod
+    def _invalidate(file_id: int):
+        cache = get_response_cache()
+        if cache is not None:
+            cache.invalidate_files([file_id])
+
+
+__push_reindexer: Optional[PushReindexer] = None
+
+
+def get_push_reindexer() -> PushReindexer:
+    global __push_reindexer
+    if __push_reindexer is None:
+        __push_reindexer = PushReindexer(REINDEX_DEBOUNCE_SECONDS, GITHUB_RAW_URL, GITHUB_TOKEN)
+    return __push_reindexer
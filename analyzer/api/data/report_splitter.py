@@ -0,0 +1,123 @@
+import re
+from typing import Iterator, Optional, Tuple
+
+import ijson
+from langchain_core.documents import Document
+
+PMD = 'pmd'
+GRAPHSON = 'graphson'
+
+PMD_FILE = 'files.item'
+# `vertices` at the top level or inside the graph wrapper of a GraphSON export, as written by the merge tool
+GRAPHSON_VERTICES = re.compile(r'^(?:(?:graph|@value)\.)*vertices$')
+
+
+class UnknownReportFormat(ValueError):
+    """The JSON document is neither a PMD report nor a GraphSON graph."""
+
+
+def unwrap_graphson_value(value):
+    """Strips GraphSON type wrappers ({"@type": ..., "@value": ...}) from a value."""
+    while isinstance(value, dict) and '@value' in value:
+        value = value['@value']
+    return value
+
+
+def vertex_property(properties: dict, key: str):
+    """The first value of a GraphSON vertex property, or None if it is missing."""
+    value = unwrap_graphson_value(properties.get(key))
+    if isinstance(value, list):
+        value = unwrap_graphson_value(value[0]) if value else None
+    if isinstance(value, dict) and 'value' in value:
+        value = unwrap_graphson_value(value['value'])
+    return value
+
+
+def _metadata(**values) -> dict:
+    # Chroma only stores scalars, and no None
+    return {key: value for key, value in values.items() if isinstance(value, (str, int, float, bool))}
+
+
+def violation_document(violation: dict, filename: Optional[str], **metadata) -> Document:
+    """One PMD violation as a document, e.g. from `files[].violations[]` of a PMD JSON report."""
+    begin, end = violation.get('beginline'), violation.get('endline')
+    lines = f"line {begin}" if begin == end or end is None else f"lines {begin}-{end}"
+    text = (f"{violation.get('rule')} ({violation.get('ruleset')}, priority {violation.get('priority')}) "
+            f"in {filename or 'unknown file'}, {lines}:\n{(violation.get('description') or '').strip()}")
+    return Document(page_content=text, metadata=_metadata(
+        report_format=PMD, filename=filename, rule=violation.get('rule'), ruleset=violation.get('ruleset'),
+        priority=violation.get('priority'), start_line=begin, end_line=end, **metadata))
+
+
+def _file_vertex_documents(vertex: dict) -> Iterator[Document]:
+    """The FILE vertex itself, followed by the PMD violations the merge tool attached to it."""
+    properties = vertex.get('properties') or {}
+    if not isinstance(properties, dict):
+        return
+    name = vertex_property(properties, 'NAME')
+    if not isinstance(name, str) or name == '<unknown>':
+        return
+    vertex_id = str(unwrap_graphson_value(vertex.get('id')))
+    violations = unwrap_graphson_value(properties.get('pmd_violations')) or []
+
+    lines = [f"Source file {name} (FILE vertex {vertex_id} of the code property graph)"]
+    for key in sorted(properties):
+        value = vertex_property(properties, key)
+        if key not in ('NAME', 'pmd_violations') and isinstance(value, (str, int, float, bool)):
+            lines.append(f"{key}: {value}")
+    lines.append(f"PMD violations: {len(violations)}")
+    yield Document(page_content="\n".join(lines), metadata=_metadata(
+        report_format=GRAPHSON, filename=name, vertex_id=vertex_id, violation_count=len(violations)))
+
+    for violation in violations:
+        if isinstance(violation, dict):
+            yield violation_document(unwrap_graphson_value(violation), name, vertex_id=vertex_id)
+
+
+def report_shape(f) -> Optional[Tuple[str, str]]:
+    """The format of a report and the prefix of its items, from the first events that tell them apart."""
+    for prefix, event, value in ijson.parse(f):
+        if (event == 'map_key' and prefix == '' and value == 'pmdVersion') \
+                or (event == 'start_array' and prefix == 'files.item.violations'):
+            return PMD, PMD_FILE
+        if event == 'start_array' and GRAPHSON_VERTICES.match(prefix):
+            return GRAPHSON, f"{prefix}.item"
+    return None
+
+
+def iter_graph_vertices(file_path: str) -> Iterator[dict]:
+    """Streams the vertices of a (merged) GraphSON graph, one at a time.
+    Raises UnknownReportFormat if the file is not a GraphSON graph."""
+    with open(file_path, 'rb') as f:
+        shape = report_shape(f)
+        if shape is None or shape[0] != GRAPHSON:
+            raise UnknownReportFormat(f"{file_path} is not a GraphSON graph")
+
+        f.seek(0)
+        for vertex in ijson.items(f, shape[1], use_float=True):
+            if isinstance(vertex, dict):
+                yield vertex
+
+
+def iter_report_documents(file_path: str) -> Iterator[Document]:
+    """Streams the documents of a PMD report or a (merged) GraphSON graph without loading the file.
+
+    A PMD report gives one document per violation, a GraphSON graph one per FILE vertex and one per
+    PMD violation attached to it. Only one entry of `files` or `vertices` is held in memory at a
+    time. Raises UnknownReportFormat, before yielding anything, if the file has neither shape.
+    """
+    with open(file_path, 'rb') as f:
+        shape = report_shape(f)
+        if shape is None:
+            raise UnknownReportFormat(f"{file_path} is neither a PMD report nor a GraphSON graph")
+        report_format, item_prefix = shape
+
+        f.seek(0)
+        for item in ijson.items(f, item_prefix, use_float=True):
+            if not isinstance(item, dict):
+                continue
+            if report_format == PMD:
+                for violation in item.get('violations') or []:
+                    yield violation_document(violation, item.get('filename'))
+            elif item.get('label') == 'FILE':
+                yield from _file_vertex_documents(item)
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional
+
+from langchain_core.documents import Document
+
+from api import logs
+from api.data.embedding_cache import chunk_hash
+from api.env import RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_PATH, RESPONSE_CACHE_MAX_ENTRIES
+
+logger = logs.get_logger(__name__)
+
+CACHE_HIT = 'HIT'
+CACHE_MISS = 'MISS'
+CACHE_BYPASS = 'BYPASS'
+
+
+def context_sources(documents: List[Document]) -> List[dict]:
+    """Identity and version of the retrieved chunks: their document and a hash of their content."""
+    return [{"file_id": doc.metadata.get('file_id'), "chunk_hash": chunk_hash(doc.page_content)}
+            for doc in documents]
+
+
+def response_key(parameters: dict, documents: List[Document]) -> str:
+    """Cache key of a generation from `parameters` (request, model, prompt, ...) over `documents`."""
+    payload = json.dumps({"parameters": parameters, "context": context_sources(documents)}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class ResponseCache:
+    """SQLite cache of generated answers, keyed by `response_key`.
+
+    Because the key covers the retrieved chunks, any change of the context produces a new key.
+    Every entry also records the documents it was generated from, so it is dropped as soon as one
+    of them is deleted or replaced (see `invalidate_files`). Once the table grows past
+    `max_entries`, the least recently used tenth is evicted.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10_000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS response_cache
+                              (key TEXT PRIMARY KEY,
+                               answer TEXT NOT NULL,
+                               created_at REAL NOT NULL,
+                               last_used REAL NOT NULL)''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_last_used ON response_cache (last_used)')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS response_cache_files
+                              (file_id INTEGER NOT NULL,
+                               key TEXT NOT NULL,
+                               PRIMARY KEY (file_id, key))''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_files_key ON response_cache_files (key)')
+        self._conn.commit()
+        self._entries = self._conn.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+        self._stats = {"hits": 0, "misses": 0, "invalidated": 0, "evictions": 0}
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute('SELECT answer FROM response_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._conn.execute('UPDATE response_cache SET last_used = ? WHERE key = ?', (time.time(), key))
+            self._conn.commit()
+            self._stats["hits"] += 1
+            return row[0]
+
+    def put(self, key: str, answer: str, documents: List[Document]):
+        file_ids = {doc.metadata['file_id'] for doc in documents if doc.metadata.get('file_id') is not None}
+        now = time.time()
+        with self._lock:
+            if not self._conn.execute('SELECT 1 FROM response_cache WHERE key = ?', (key,)).fetchone():
+                self._entries += 1
+            self._conn.execute('INSERT OR REPLACE INTO response_cache (key, answer, created_at, last_used) '
+                               'VALUES (?, ?, ?, ?)', (key, answer, now, now))
+            self._conn.executemany('INSERT OR IGNORE INTO response_cache_files (file_id, key) VALUES (?, ?)',
+                                   [(file_id, key) for file_id in file_ids])
+            if self._entries > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def invalidate_files(self, file_ids: Iterable[int]) -> int:
+        """Drops every answer generated from one of `file_ids`. Returns the number of dropped answers."""
+        file_ids = list(file_ids)
+        if not file_ids:
+            return 0
+        placeholders = ','.join('?' * len(file_ids))
+        with self._lock:
+            keys = [row[0] for row in self._conn.execute(
+                f'SELECT DISTINCT key FROM response_cache_files WHERE file_id IN ({placeholders})', file_ids)]
+            self._delete(keys)
+            self._conn.commit()
+            self._stats["invalidated"] += len(keys)
+        if keys:
+            logger.info(f"Invalidated {len(keys)} cached answers generated from documents {file_ids}")
+        return len(keys)
+
+    def _delete(self, keys: List[str]):
+        self._conn.executemany('DELETE FROM response_cache WHERE key = ?', [(key,) for key in keys])
+        self._conn.executemany('DELETE FROM response_cache_files WHERE key = ?', [(key,) for key in keys])
+        self._entries -= len(keys)
+
+    def _evict(self):
+        count = self._entries - int(self.max_entries * 0.9)
+        keys = [row[0] for row in self._conn.execute(
+            'SELECT key FROM response_cache ORDER BY last_used LIMIT ?', (count,))]
+        self._delete(keys)
+        self._stats["evictions"] += len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._entries
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+__response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """The shared response cache, or None if RESPONSE_CACHE_ENABLED is off."""
+    global __response_cache
+    if __response_cache is None and RESPONSE_CACHE_ENABLED:
+        __response_cache = ResponseCache(RESPONSE_CACHE_PATH, max_entries=RESPONSE_CACHE_MAX_ENTRIES)
+    return __response_cache
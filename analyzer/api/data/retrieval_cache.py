@@ -0,0 +1,85 @@
+import threading
+from typing import Callable, Dict, List, Optional
+
+from cachetools import TTLCache
+
+from api import logs
+from api.env import RETRIEVAL_CACHE_ENABLED, RETRIEVAL_CACHE_MAX_ENTRIES, RETRIEVAL_CACHE_TTL_SECONDS
+
+logger = logs.get_logger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    # Requests built from the same template differ in whitespace at most
+    return " ".join(query.split())
+
+
+class RetrievalCache:
+    """In-process LRU caches, with a time to live, of query embeddings and of the search results
+    of a collection per (collection, kind of search, k, query).
+
+    Every collection has a version counter that is bumped whenever its chunks change (see
+    vectorstore.py). Results are cached under the version they were computed at, so a change
+    makes them unreachable at once; they then age out of the LRU. Query embeddings only depend
+    on the embedding model, which is fixed for the process, and stay valid.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 600):
+        self._embeddings = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._results = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stats = {"embedding_hits": 0, "embedding_misses": 0, "result_hits": 0, "result_misses": 0}
+
+    def bump_version(self, collection: str):
+        with self._lock:
+            self._versions[collection] = self._versions.get(collection, 0) + 1
+
+    def embedding(self, query: str, embed: Callable[[str], List[float]]) -> List[float]:
+        """The embedding of `query`, from the cache or from `embed`."""
+        key = normalize_query(query)
+        with self._lock:
+            vector = self._embeddings.get(key)
+            self._stats["embedding_hits" if vector is not None else "embedding_misses"] += 1
+        if vector is None:
+            # Outside the lock; at worst, two threads embed the same new query
+            vector = embed(query)
+            with self._lock:
+                self._embeddings[key] = vector
+        return vector
+
+    def results(self, collection: str, kind: str, k: int, query: str, search: Callable[[], list]) -> list:
+        """The results of a search of `collection`, from the cache or from `search`."""
+        with self._lock:
+            key = (collection, self._versions.get(collection, 0), kind, k, normalize_query(query))
+            results = self._results.get(key)
+            self._stats["result_hits" if results is not None else "result_misses"] += 1
+        if results is None:
+            results = search()
+            with self._lock:
+                self._results[key] = results
+        return list(results)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["embeddings"] = len(self._embeddings)
+            stats["results"] = len(self._results)
+            stats["versions"] = dict(self._versions)
+        for kind in ("embedding", "result"):
+            lookups = stats[f"{kind}_hits"] + stats[f"{kind}_misses"]
+            stats[f"{kind}_hit_rate"] = round(stats[f"{kind}_hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+__retrieval_cache: Optional[RetrievalCache] = None
+__retrieval_cache_lock = threading.Lock()
+
+
+def get_retrieval_cache() -> Optional[RetrievalCache]:
+    """The shared retrieval cache, or None if RETRIEVAL_CACHE_ENABLED is off."""
+    global __retrieval_cache
+    with __retrieval_cache_lock:
+        if __retrieval_cache is None and RETRIEVAL_CACHE_ENABLED:
+            __retrieval_cache = RetrievalCache(RETRIEVAL_CACHE_MAX_ENTRIES, RETRIEVAL_CACHE_TTL_SECONDS)
+    return __retrieval_cache
@@ -1,20 +1,73 @@
+import dataclasses
+import itertools
 import json
-from typing import List
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
 
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
 from langchain_ollama import OllamaEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter, RecursiveJsonSplitter
-from langchain_unstructured import UnstructuredLoader
 
 from api import logs
+from api.data.code_splitter import split_source_file
+from api.data.embedding_cache import CachedEmbeddings, EmbeddingCacheStore, chunk_hash
+from api.data.embedding_pipeline import EmbeddingPipeline, EmbeddingProgress, ProgressCallback
+from api.data.lexical_index import get_lexical_index
+from api.data.report_splitter import iter_report_documents, UnknownReportFormat
+from api.data.retrieval_cache import get_retrieval_cache
 from api.data.types import DataType
-from api.env import LLM_MODEL, VECTORSTORE_PATH
+from api.env import LLM_MODEL, VECTORSTORE_PATH, EMBEDDING_BATCH_SIZE, EMBEDDING_CONCURRENCY, EMBEDDING_BACKEND, \
+    EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES, INDEX_SEGMENT_CHUNKS
 
 logger = logs.get_logger(__name__)
 
 
 __vector_stores: dict[DataType, Chroma] = {}
+__embeddings: Optional[Embeddings] = None
+__embedding_pipeline: Optional[EmbeddingPipeline] = None
+# The singletons above must not be created concurrently (startup warm-up vs. ingestion workers)
+__init_lock = threading.RLock()
+
+
+def get_embeddings() -> Embeddings:
+    global __embeddings
+    with __init_lock:
+        if __embeddings is None:
+            if EMBEDDING_BACKEND == "fake":
+                embeddings, model = DeterministicFakeEmbedding(size=768), "fake-768"
+            else:
+                embeddings, model = OllamaEmbeddings(model=LLM_MODEL), LLM_MODEL
+
+            if EMBEDDING_CACHE_ENABLED:
+                store = EmbeddingCacheStore(EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+                embeddings = CachedEmbeddings(embeddings, store, model)
+            __embeddings = embeddings
+    return __embeddings
+
+
+def get_embedding_cache_stats() -> Optional[dict]:
+    embeddings = get_embeddings()
+    return embeddings.stats() if isinstance(embeddings, CachedEmbeddings) else None
+
+
+def get_retrieval_cache_stats() -> Optional[dict]:
+    cache = get_retrieval_cache()
+    return cache.stats() if cache is not None else None
+
+
+def get_embedding_pipeline() -> EmbeddingPipeline:
+    global __embedding_pipeline
+    with __init_lock:
+        if __embedding_pipeline is None:
+            __embedding_pipeline = EmbeddingPipeline(
+                get_embeddings(),
+                batch_size=EMBEDDING_BATCH_SIZE,
+                max_concurrency=EMBEDDING_CONCURRENCY
+            )
+    return __embedding_pipeline
 
 
 def get_collection_name(dtype: DataType) -> str:
@@ -22,26 +75,44 @@ def get_collection_name(dtype: DataType) -> str:
 
 
 def get_vectorstore(dtype: DataType) -> Chroma:
-    if dtype not in __vector_stores:
-        vectorstore = Chroma(
-            collection_name=get_collection_name(dtype),
-            persist_directory=VECTORSTORE_PATH,
-            embedding_function=OllamaEmbeddings(model=LLM_MODEL)
-        )
+    with __init_lock:
+        if dtype not in __vector_stores:
+            vectorstore = Chroma(
+                collection_name=get_collection_name(dtype),
+                persist_directory=VECTORSTORE_PATH,
+                embedding_function=get_embeddings()
+            )
 
-        __vector_stores[dtype] = vectorstore
+            __vector_stores[dtype] = vectorstore
 
     return __vector_stores[dtype]
 
 
-def __embed_document(file_path: str) -> List[Document]:
+def _collection_changed(dtype: DataType):
+    # Drops the cached search results of the collection
+    cache = get_retrieval_cache()
+    if cache is not None:
+        cache.bump_version(get_collection_name(dtype))
+
+
+def __embed_document(file_path: str, dtype: DataType) -> Iterable[Document]:
     if file_path.endswith('.json'):
         return _process_json_file(file_path)
-    else:
-        return _process_text_file(file_path)
+    if dtype == DataType.SOURCE_CODE:
+        splits = split_source_file(file_path)
+        if splits is not None:
+            return splits
+    return _process_text_file(file_path)
+
 
+def _process_json_file(file_path: str) -> Iterator[Document]:
+    try:
+        # PMD reports and (merged) GraphSON graphs are streamed, however large they are
+        yield from iter_report_documents(file_path)
+        return
+    except UnknownReportFormat:
+        pass
 
-def _process_json_file(file_path: str) -> List[Document]:
     with open(file_path, encoding='utf-8') as f:
         json_data = json.load(f)
 
@@ -49,41 +120,152 @@ def _process_json_file(file_path: str) -> List[Document]:
         max_chunk_size=800
     )
 
-    return splitter.create_documents(texts=[json_data])
+    yield from splitter.create_documents(texts=[json_data])
 
 
 def _process_text_file(file_path: str) -> List[Document]:
+    # Slow to import, and only needed for documents other than plain-text source code
+    from langchain_unstructured import UnstructuredLoader
+
     loader = UnstructuredLoader(file_path)
     loaded = loader.load()
 
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=3000,
         chunk_overlap=250,
-        length_function=len
+        length_function=len,
+        # Lets the context assembler merge neighbouring chunks
+        add_start_index=True
     )
 
     return splitter.split_documents(loaded)
 
 
-def index_document_to_chroma(file_path: str, file_id: int, dtype: DataType) -> bool:
+def iter_splits(file_path: str, file_id: int, dtype: DataType) -> Iterator[Document]:
+    """Splits a document into the chunks that are stored in Chroma, with their metadata."""
+    for split in __embed_document(file_path, dtype):
+        # some weird stuff with lists in metadata
+        for k, v in split.metadata.items():
+            if isinstance(v, list):
+                split.metadata[k] = str(v)
+
+        split.metadata['file_id'] = file_id
+        split.metadata['chunk_hash'] = chunk_hash(split.page_content)
+        yield split
+
+
+def split_document(file_path: str, file_id: int, dtype: DataType) -> List[Document]:
+    return list(iter_splits(file_path, file_id, dtype))
+
+
+def index_document_to_chroma(file_path: str, file_id: int, dtype: DataType,
+                             on_progress: Optional[ProgressCallback] = None) -> Optional[int]:
+    """Returns the number of indexed chunks, or None if indexing failed.
+
+    Chunks are read and indexed INDEX_SEGMENT_CHUNKS at a time, so a large report is never held
+    in memory as a whole. Progress is reported over all segments so far.
+    """
     vectorstore = get_vectorstore(dtype)
+    name = f"{dtype.name}:{file_id}"
+    splits = iter_splits(file_path, file_id, dtype)
+    written: List[str] = []
+    started_at = time.monotonic()
+
+    def segment_progress(progress: EmbeddingProgress):
+        on_progress(dataclasses.replace(progress, total_chunks=len(written) + progress.total_chunks,
+                                        embedded_chunks=len(written) + progress.embedded_chunks,
+                                        started_at=started_at))
 
+    lexical_index = get_lexical_index()
     try:
-        splits = __embed_document(file_path)
+        while segment := list(itertools.islice(splits, INDEX_SEGMENT_CHUNKS)):
+            ids = get_embedding_pipeline().index_documents(
+                vectorstore, segment, name=name, on_progress=segment_progress if on_progress else None)
+            written.extend(ids)
+            if lexical_index is not None:
+                lexical_index.add(get_collection_name(dtype), ids, segment)
+        return len(written)
+    except Exception as e:
+        logger.error(f"Error indexing document: {e}")
+        # A failed segment removes its own chunks, the earlier ones are still there
+        if written:
+            vectorstore.delete(ids=written)
+            if lexical_index is not None:
+                lexical_index.delete(get_collection_name(dtype), ids=written)
+        return None
+    finally:
+        _collection_changed(dtype)
+
+
+def reindex_document_in_chroma(file_path: str, file_id: int, dtype: DataType) -> Optional[Dict[str, int]]:
+    """Brings the chunks of `file_id` in line with a new version of the document in `file_path`.
+
+    Only chunks whose content hash is new are embedded, and only chunks whose hash is gone are
+    deleted; the chunks that stayed just get their metadata (e.g. `start_index`) updated.
+    New chunks are written before stale ones are deleted, so a failure leaves the previous version.
+    Returns the numbers of added, removed and kept chunks, or None if indexing failed.
+    """
+    vectorstore = get_vectorstore(dtype)
+    collection = vectorstore._collection
+    lexical_index = get_lexical_index()
 
+    try:
+        splits = split_document(file_path, file_id, dtype)
+        existing = collection.get(where={"file_id": file_id}, include=["metadatas", "documents"])
+        ids_by_hash: Dict[str, List[str]] = {}
+        for id_, metadata, text in zip(existing['ids'], existing['metadatas'], existing['documents']):
+            hash_ = (metadata or {}).get('chunk_hash') or chunk_hash(text or '')
+            ids_by_hash.setdefault(hash_, []).append(id_)
+
+        added, kept_ids, kept_metadatas = [], [], []
         for split in splits:
-            # some weird stuff with lists in metadata
-            for k, v in split.metadata.items():
-                if isinstance(v, list):
-                    split.metadata[k] = str(v)
+            ids = ids_by_hash.get(split.metadata['chunk_hash'])
+            if ids:
+                kept_ids.append(ids.pop())
+                kept_metadatas.append(split.metadata)
+            else:
+                added.append(split)
+        stale_ids = [id_ for ids in ids_by_hash.values() for id_ in ids]
+
+        if added:
+            added_ids = get_embedding_pipeline().index_documents(vectorstore, added, name=f"{dtype.name}:{file_id}")
+            if lexical_index is not None:
+                lexical_index.add(get_collection_name(dtype), added_ids, added)
+        if kept_ids:
+            collection.update(ids=kept_ids, metadatas=kept_metadatas)
+            if lexical_index is not None:
+                lexical_index.update_metadata(get_collection_name(dtype), kept_ids, kept_metadatas)
+        if stale_ids:
+            collection.delete(ids=stale_ids)
+            if lexical_index is not None:
+                lexical_index.delete(get_collection_name(dtype), ids=stale_ids)
+        return {"added": len(added), "removed": len(stale_ids), "kept": len(kept_ids)}
+    except Exception as e:
+        logger.error(f"Error re-indexing document {file_id}: {e}", exc_info=True)
+        return None
+    finally:
+        _collection_changed(dtype)
 
-            split.metadata['file_id'] = file_id
 
-        vectorstore.add_documents(splits)
-        return True
-    except Exception as e:
-        logger.error(f"Error indexing document: {e}")
-        return False
+def get_all_chunks(dtype: DataType, limit: Optional[int] = None) -> List[Document]:
+    """All chunks of a collection, up to `limit`."""
+    chunks = get_vectorstore(dtype).get(include=["documents", "metadatas"], limit=limit)
+    return [Document(page_content=text, metadata=metadata or {})
+            for text, metadata in zip(chunks['documents'], chunks['metadatas'])]
+
+
+def relabel_doc_in_chroma(old_file_id: int, new_file_id: int, dtype: DataType) -> int:
+    """Moves the chunks of a document to a new file_id. Returns the number of relabelled chunks."""
+    collection = get_vectorstore(dtype)._collection
+    chunks = collection.get(where={"file_id": old_file_id}, include=["metadatas"])
+    if chunks['ids']:
+        collection.update(ids=chunks['ids'],
+                          metadatas=[dict(metadata, file_id=new_file_id) for metadata in chunks['metadatas']])
+    lexical_index = get_lexical_index()
+    if lexical_index is not None:
+        lexical_index.relabel(get_collection_name(dtype), old_file_id, new_file_id)
+    _collection_changed(dtype)
+    return len(chunks['ids'])
 
 
 def delete_doc_from_chroma(file_id: int, dtype: DataType) -> bool:
@@ -97,8 +279,39 @@ def delete_doc_from_chroma(file_id: int, dtype: DataType) -> bool:
             logger.error(f"Documents remain after deletion for file_id {file_id}")
             return False
 
+        lexical_index = get_lexical_index()
+        if lexical_index is not None:
+            lexical_index.delete(get_collection_name(dtype), file_id=file_id)
         return True
 
     except Exception as e:
         logger.error(f"Deletion failed: {str(e)}", exc_info=True)
-        return False
\ No newline at end of file
+        return False
+    finally:
+        _collection_changed(dtype)
+
+
+def sync_lexical_index(dtype: DataType, page_size: int = 5000) -> bool:
+    """Rebuilds the lexical index of a collection from Chroma if their chunk counts differ, e.g. for
+    chunks indexed before the lexical index existed. Returns whether it was rebuilt."""
+    lexical_index = get_lexical_index()
+    if lexical_index is None:
+        return False
+    collection = get_vectorstore(dtype)._collection
+    name = get_collection_name(dtype)
+    if collection.count() == lexical_index.count(name):
+        return False
+
+    started = time.perf_counter()
+    lexical_index.clear(name)
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        if not page['ids']:
+            break
+        lexical_index.add(name, page['ids'], [Document(page_content=text or '', metadata=metadata or {})
+                                               for text, metadata in zip(page['documents'], page['metadatas'])])
+        offset += len(page['ids'])
+    _collection_changed(dtype)
+    logger.info(f"Rebuilt the lexical index of {name} from {offset} chunks in {time.perf_counter() - started:.1f}s")
+    return True
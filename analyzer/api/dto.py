@@ -1,11 +1,23 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import Any
 
 
 class DocumentInfo(BaseModel):
     id: int
     filename: str
     upload_timestamp: datetime
+    data_type: str | None = None
+    content_hash: str | None = None
+    size: int | None = None
+    chunk_count: int | None = None
+    status: str | None = None
+    source_path: str | None = None
+
+
+class DocumentPage(BaseModel):
+    items: list[DocumentInfo]
+    next_cursor: str | None = None
 
 
 class SummaryRequest(BaseModel):
@@ -16,6 +28,8 @@ class SummaryRequest(BaseModel):
 class SummaryResponse(BaseModel):
     session_id: str = Field(default=None)
     summary: dict[str, str]
+    # Chunks analyzed, served from the cache, failed, and the number of merged findings
+    stats: dict[str, int] | None = None
 
 
 class UnitTestRequest(BaseModel):
@@ -25,6 +39,27 @@ class UnitTestRequest(BaseModel):
     framework: str = Field(default='Any')
 
 
+class UnitTestBatchRequest(BaseModel):
+    items: list[UnitTestRequest] = Field(min_length=1, max_length=500)
+    # Total time for the whole batch; unfinished items are cancelled when it passes
+    deadline_seconds: float | None = Field(default=None, gt=0)
+
+
 class UnitTestResponse(BaseModel):
     session_id: str = Field(default=None)
     source_code: str
+    # Context assembly, prompt tokens and prefill time; None for cached answers
+    prompt_stats: dict[str, Any] | None = None
+
+
+class IngestionJobInfo(BaseModel):
+    id: str
+    filename: str
+    data_type: str
+    status: str
+    attempts: int
+    file_id: int | None = None
+    progress: dict[str, Any] | None = None
+    error: str | None = None
+    created_at: datetime
+    updated_at: datetime
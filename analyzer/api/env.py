@@ -7,3 +7,64 @@ API_PORT=int(getenv("API_PORT"))
 LLM_MODEL=getenv("LLM_MODEL")
 VECTORSTORE_PATH=getenv("VECTORSTORE_PATH")
 LLM_OUTPUT_TOKEN_LIMIT=int(getenv("LLM_OUTPUT_TOKEN_LIMIT"))  # Debug stuff to speed up gen
+# Build chains and load the models into Ollama at startup instead of on the first request
+WARM_UP_MODELS=getenv("WARM_UP_MODELS", "true").lower() == "true"
+# Generations running against the LLM backend at once, over all requests
+GENERATION_CONCURRENCY=int(getenv("GENERATION_CONCURRENCY", "2"))
+# Default and upper limit of the total time of a batch generation request, in seconds
+GENERATION_BATCH_DEADLINE=float(getenv("GENERATION_BATCH_DEADLINE", "1800"))
+# Tokens of retrieved context packed into a unit test prompt; tokens are estimated from characters
+CONTEXT_TOKEN_BUDGET=int(getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+CONTEXT_CHARS_PER_TOKEN=float(getenv("CONTEXT_CHARS_PER_TOKEN", "3.5"))
+# PMD violations of the retrieved code, from ingested code graphs, added to a unit test prompt
+CONTEXT_MAX_VIOLATIONS=int(getenv("CONTEXT_MAX_VIOLATIONS", "20"))
+# Upper limit of source code chunks analyzed by one /generation/analysis-summary request
+ANALYSIS_MAX_CHUNKS=int(getenv("ANALYSIS_MAX_CHUNKS", "500"))
+# Source code chunks retrieved for an analysis request that names what to look for
+ANALYSIS_RELEVANT_CHUNKS=int(getenv("ANALYSIS_RELEVANT_CHUNKS", "20"))
+
+# Connections kept open to the SQLite database, shared by all request handlers
+DB_POOL_SIZE=int(getenv("DB_POOL_SIZE", "8"))
+# Chat logs written within this many seconds of each other are committed together
+DB_WRITE_BATCH_SIZE=int(getenv("DB_WRITE_BATCH_SIZE", "64"))
+DB_WRITE_BATCH_DELAY=float(getenv("DB_WRITE_BATCH_DELAY", "0.005"))
+
+# Embedding pipeline: chunks per request to the embedding backend and concurrent requests
+EMBEDDING_BATCH_SIZE=int(getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_CONCURRENCY=int(getenv("EMBEDDING_CONCURRENCY", "4"))
+# Chunks of one document read and indexed at a time, which bounds memory for large reports
+INDEX_SEGMENT_CHUNKS=int(getenv("INDEX_SEGMENT_CHUNKS", "2000"))
+# "ollama", or "fake" for deterministic local embeddings without an Ollama server
+EMBEDDING_BACKEND=getenv("EMBEDDING_BACKEND", "ollama")
+# Persistent cache of chunk embeddings, keyed by embedding model and chunk content hash
+EMBEDDING_CACHE_ENABLED=getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH=getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+EMBEDDING_CACHE_MAX_ENTRIES=int(getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# Background ingestion of uploaded documents
+INGESTION_WORKERS=int(getenv("INGESTION_WORKERS", "2"))
+INGESTION_MAX_ATTEMPTS=int(getenv("INGESTION_MAX_ATTEMPTS", "3"))
+INGESTION_RETRY_DELAY=float(getenv("INGESTION_RETRY_DELAY", "5"))
+INGESTION_UPLOAD_DIR=getenv("INGESTION_UPLOAD_DIR", "uploads")
+
+# Cache of generated unit tests, keyed by request, model and retrieved chunks
+RESPONSE_CACHE_ENABLED=getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_PATH=getenv("RESPONSE_CACHE_PATH", "response_cache.db")
+RESPONSE_CACHE_MAX_ENTRIES=int(getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+
+# BM25 index of all chunks, searched along with the vector store and fused by rank (reciprocal rank fusion)
+LEXICAL_INDEX_ENABLED=getenv("LEXICAL_INDEX_ENABLED", "true").lower() == "true"
+LEXICAL_INDEX_PATH=getenv("LEXICAL_INDEX_PATH", "lexical_index.db")
+HYBRID_RRF_K=int(getenv("HYBRID_RRF_K", "60"))
+# A query naming code symbols skips its embedding if the best lexical hit has them all and leads the best
+# hit without them by this factor; 1 accepts any lead
+HYBRID_LEXICAL_MARGIN=float(getenv("HYBRID_LEXICAL_MARGIN", "1.0"))
+# In-process LRU cache of query embeddings and search results; results are dropped when their collection changes
+RETRIEVAL_CACHE_ENABLED=getenv("RETRIEVAL_CACHE_ENABLED", "true").lower() == "true"
+RETRIEVAL_CACHE_MAX_ENTRIES=int(getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "1024"))
+RETRIEVAL_CACHE_TTL_SECONDS=float(getenv("RETRIEVAL_CACHE_TTL_SECONDS", "600"))
+
+# Re-indexing of source code from GitHub push events; changes arriving within the delay are applied together
+REINDEX_DEBOUNCE_SECONDS=float(getenv("REINDEX_DEBOUNCE_SECONDS", "5"))
+GITHUB_RAW_URL=getenv("GITHUB_RAW_URL", "https://raw.githubusercontent.com/{repository}/{ref}/{path}")
+GITHUB_TOKEN=getenv("GITHUB_TOKEN")
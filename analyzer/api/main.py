@@ -1,14 +1,30 @@
+import threading
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.openapi.utils import get_openapi
 
 from api import logs
-from api.env import API_PORT
-from api.routers import document_router, generation_router, hook_router
+from api.ai.generation import warm_up_models
+from api.data.ingestion import get_ingestion_queue
+from api.env import API_PORT, WARM_UP_MODELS
+from api.routers import document_router, generation_router, graph_router, hook_router
 
 logger = logs.get_logger(__name__)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # Pick up uploads that were not indexed before the last shutdown
+    get_ingestion_queue().recover()
+    if WARM_UP_MODELS:
+        # Loading a model can take a while; the API serves requests in the meantime
+        threading.Thread(target=warm_up_models, name="warm-up", daemon=True).start()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 def custom_openapi():
     if app.openapi_schema:
@@ -25,6 +41,7 @@ def custom_openapi():
 app.openapi = custom_openapi
 app.include_router(document_router.router)
 app.include_router(generation_router.router)
+app.include_router(graph_router.router)
 app.include_router(hook_router.router)
 
 
@@ -1,47 +1,56 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-import os
-import shutil
+from fastapi import APIRouter, UploadFile, File, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional
 
+from api.data import async_db
 from api.data.db import *
 from api.data.vectorstore import *
+from api.data.ingestion import get_ingestion_queue
+from api.data.response_cache import get_response_cache
 from api.data.types import DataType
-from api.dto import DocumentInfo
+from api.dto import DocumentInfo, DocumentPage, IngestionJobInfo
 
 logger = logs.get_logger(__name__)
 
 router = APIRouter(prefix="/project", tags=["Project files"])
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
 
-async def upload_and_index_document(file: UploadFile, dtype: DataType):
-    temp_file_path = f"temp_{file.filename}"
 
-    try:
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+async def upload_and_index_document(file: UploadFile, dtype: DataType):
+    # Only the file copy happens here; splitting and embedding run in the ingestion workers
+    job_id = await run_in_threadpool(get_ingestion_queue().submit_upload, file.filename, file.file, dtype)
+    return {"message": f"File {file.filename} has been uploaded and queued for indexing.",
+            "job_id": job_id, "status": "queued"}
 
-        file_id = insert_document_record(file.filename, dtype)
-        success = index_document_to_chroma(temp_file_path, file_id, dtype)
 
-        if success:
-            return {"message": f"File {file.filename} has been uploaded and indexed.", "file_id": file_id}
-        else:
-            delete_document_record(file_id, dtype)
-            raise HTTPException(status_code=500, detail=f"Failed to index {file.filename}.")
-    finally:
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+async def list_documents(dtype: Optional[DataType] = None, status: str = DOCUMENT_INDEXED,
+                         limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None):
+    try:
+        documents, next_cursor = await async_db.get_documents_page(dtype, status, min(max(limit, 1), MAX_PAGE_SIZE),
+                                                                   cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": documents, "next_cursor": next_cursor}
 
 
-async def list_documents(dtype: Optional[DataType] = None):
-    return get_all_documents(dtype)
+async def list_documents_of_type(dtype: DataType, response: Response, limit: int, cursor: Optional[str]):
+    page = await list_documents(dtype, limit=limit, cursor=cursor)
+    # These routes return a plain list, so the cursor of the next page travels in a header
+    if page["next_cursor"] is not None:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return page["items"]
 
 
 async def delete_document(file_id: int, dtype: DataType):
-    chroma_delete_success = delete_doc_from_chroma(file_id, dtype)
+    chroma_delete_success = await run_in_threadpool(delete_doc_from_chroma, file_id, dtype)
 
     if chroma_delete_success:
-        db_delete_success = delete_document_record(file_id, dtype)
+        db_delete_success = await async_db.delete_document_record(file_id, dtype)
+        cache = get_response_cache()
+        if cache is not None:
+            await run_in_threadpool(cache.invalidate_files, [file_id])
         if db_delete_success:
             return {"message": f"Deleted document with file_id {file_id} from the system."}
         else:
@@ -50,8 +59,59 @@ async def delete_document(file_id: int, dtype: DataType):
         return {"error": f"Failed to delete document with file_id {file_id} from Chroma."}
 
 
+@router.get("/documents",
+         response_model=DocumentPage,
+         description='Returns one page of documents of all or one data type, newest first. '
+                     'Pass next_cursor of a page as cursor to get the next one')
+async def get_documents(data_type: Optional[str] = None, status: str = DOCUMENT_INDEXED,
+                        limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None):
+    dtype = None
+    if data_type is not None:
+        try:
+            dtype = DataType[data_type.upper()]
+        except KeyError:
+            raise HTTPException(status_code=400, detail=f"Unknown data type {data_type}.")
+    return await list_documents(dtype, status, limit, cursor)
+
+
+@router.get("/documents/{file_id}",
+         response_model=DocumentInfo,
+         description='Returns the catalog entry of a document')
+async def get_document_info(file_id: int):
+    document = await async_db.get_document(file_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail=f"Document {file_id} not found.")
+    return document
+
+
+@router.get("/indexing",
+         description='Returns progress of documents currently being embedded, embedding pipeline and cache statistics')
+async def get_indexing_progress():
+    pipeline = get_embedding_pipeline()
+    return {"active": pipeline.active(), "stats": pipeline.stats(), "embedding_cache": get_embedding_cache_stats(),
+            "retrieval_cache": get_retrieval_cache_stats()}
+
+
+@router.get("/jobs",
+         response_model=list[IngestionJobInfo],
+         description='Returns the most recent ingestion jobs, optionally filtered by status')
+async def list_ingestion_jobs(status: Optional[str] = None, limit: int = 100):
+    return await async_db.get_ingestion_jobs(status, min(max(limit, 1), 1000))
+
+
+@router.get("/jobs/{job_id}",
+         response_model=IngestionJobInfo,
+         description='Returns status and progress of an ingestion job')
+async def get_ingestion_job_status(job_id: str):
+    job = await async_db.get_ingestion_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingestion job {job_id} not found.")
+    return job
+
+
 # Source Code Routes
 @router.post("/code",
+          status_code=202,
           description='Uploads source code for project to generate tests and summary for',
           response_model=dict)
 async def upload_source_code(file: UploadFile = File(...)):
@@ -60,9 +120,9 @@ async def upload_source_code(file: UploadFile = File(...)):
 
 @router.get("/code",
          response_model=list[DocumentInfo],
-         description='Returns all uploaded source code documents')
-async def get_source_code():
-    return await list_documents(DataType.SOURCE_CODE)
+         description='Returns uploaded source code documents, newest first, one page at a time (see X-Next-Cursor)')
+async def get_source_code(response: Response, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None):
+    return await list_documents_of_type(DataType.SOURCE_CODE, response, limit, cursor)
 
 
 @router.delete("/code/{file_id}",
@@ -73,6 +133,7 @@ async def delete_source_code(file_id: int):
 
 # Requirements Routes
 @router.post("/requirements",
+          status_code=202,
           description='Uploads technical requirements document for project to improve tests and summary generation')
 async def upload_requirements(file: UploadFile = File(...)):
     return await upload_and_index_document(file, DataType.REQUIREMENTS)
@@ -80,9 +141,9 @@ async def upload_requirements(file: UploadFile = File(...)):
 
 @router.get("/requirements",
          response_model=list[DocumentInfo],
-         description='Returns all uploaded technical requirements')
-async def get_requirements():
-    return await list_documents(DataType.REQUIREMENTS)
+         description='Returns uploaded technical requirements, newest first, one page at a time (see X-Next-Cursor)')
+async def get_requirements(response: Response, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None):
+    return await list_documents_of_type(DataType.REQUIREMENTS, response, limit, cursor)
 
 
 @router.delete("/requirements/{file_id}",
@@ -93,6 +154,7 @@ async def delete_requirements(file_id: int):
 
 # Reports Routes
 @router.post("/reports",
+          status_code=202,
           description='Uploads static analysis reports for the project')
 async def upload_report(file: UploadFile = File(...)):
     return await upload_and_index_document(file, DataType.REPORTS)
@@ -100,9 +162,9 @@ async def upload_report(file: UploadFile = File(...)):
 
 @router.get("/reports",
          response_model=list[DocumentInfo],
-         description='Returns all uploaded reports')
-async def get_reports():
-    return await list_documents(DataType.REPORTS)
+         description='Returns uploaded reports, newest first, one page at a time (see X-Next-Cursor)')
+async def get_reports(response: Response, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None):
+    return await list_documents_of_type(DataType.REPORTS, response, limit, cursor)
 
 
 @router.delete("/reports/{file_id}",
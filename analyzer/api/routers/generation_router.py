@@ -1,10 +1,19 @@
+import json
 import logging
+import time
 import uuid
+from typing import Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header, Response
+from fastapi.responses import StreamingResponse
 
 from api import logs
+from api.ai.analysis import ChunkAnalysis, select_chunks
 from api.ai.generation import *
+from api.ai.streaming import FenceStripper, sse_event
+from api.ai.unit_tests import unit_tests_input, retrieve_context, lookup_answer, cache_answer, generate, \
+    generation_slots, assemble_context, start_batch, finish_batch, get_batch
+from api.data import async_db
 from api.data.db import *
 from api.dto import *
 
@@ -17,43 +26,131 @@ router = APIRouter(prefix="/generation", tags=["Generation"])
 
 @router.post("/analysis-summary",
           response_model=SummaryResponse,
-          description='Generates summary with found vulnerabilities and bad practices.')
-def get_code_summary(query_input: SummaryRequest):
-    raise HTTPException(status_code=500, detail="Not implemented. Yet.")
-    # session_id = query_input.session_id or str(uuid.uuid4())
-    #
-    # chat_history = get_chat_history(session_id)
-    # rag_chain = get_analysis_rag_chain(query_input.model.value)
-    # answer = rag_chain.invoke({
-    #     "input": query_input.source_code,
-    #     "chat_history": chat_history
-    # })['answer']
-    #
-    # # markdown stuff
-    # summary_str = str.replace(answer, '```', '')
-    # summary = json.loads(summary_str)
-    #
-    # insert_application_logs(session_id, query_input.source_code, answer, query_input.model.value)
-    # logger.info(f"SID: {session_id}, Response: {summary}")
-    # return SummaryResponse(summary=summary, session_id=session_id, model=query_input.model)
+          description='Generates summary with found vulnerabilities and bad practices. Without a request, '
+                      'every indexed source code chunk is analyzed, otherwise the chunks relevant to it. '
+                      'Findings are cached per chunk, so unchanged code is not analyzed again.')
+async def get_code_summary(query_input: SummaryRequest):
+    session_id = query_input.session_id or str(uuid.uuid4())
+
+    chunks = await select_chunks(query_input.request)
+    if not chunks:
+        raise HTTPException(status_code=404, detail="No source code has been indexed yet.")
+
+    analysis = ChunkAnalysis(query_input.request)
+    summary = await analysis.run(chunks)
+
+    logger.info(f"SID: {session_id}, Analysis: {analysis.stats}, Response: {summary}")
+    await async_db.insert_application_logs(session_id, query_input.request or 'analysis_summary_request',
+                                           json.dumps(summary))
+    return SummaryResponse(summary=summary, session_id=session_id, stats=analysis.stats)
 
 
 @router.post("/unit-tests",
           response_model=UnitTestResponse,
-          description='Generates source code for unit tests for given source code file.')
-def get_unit_tests(request: UnitTestRequest):
+          description='Generates source code for unit tests for given source code file. '
+                      'Answers for the same request and retrieved context are served from a cache, '
+                      'reported in the X-Cache header (HIT, MISS or BYPASS); send Cache-Control: no-cache to regenerate.')
+async def get_unit_tests(request: UnitTestRequest, response: Response, cache_control: Optional[str] = Header(None)):
+    session_id = request.session_id or str(uuid.uuid4())
+    chain_input = unit_tests_input(request)
+    context = await retrieve_context(chain_input["input"])
+    key, answer, cache_status = await lookup_answer(chain_input, context, cache_control)
+
+    prompt_stats = None
+    if answer is None:
+        answer, prompt_stats = await generate(chain_input, context)
+        await cache_answer(key, answer, context)
+
+    response.headers["X-Cache"] = cache_status
+    logger.info(f"SID: {session_id}, Cache: {cache_status}, Prompt: {prompt_stats}, Response: {answer}")
+    await async_db.insert_application_logs(session_id, 'unit_tests_request', answer)
+    return UnitTestResponse(source_code=answer, session_id=session_id, prompt_stats=prompt_stats)
+
+
+@router.post("/unit-tests/stream",
+          response_class=StreamingResponse,
+          description='Like /unit-tests, but streams the answer as server-sent events while it is generated: '
+                      '"start" with the session_id right away, then "token" events with pieces of source code, '
+                      'then "done" with the cache status and prompt stats, or "error" if generation failed.')
+async def stream_unit_tests(request: UnitTestRequest, cache_control: Optional[str] = Header(None)):
     session_id = request.session_id or str(uuid.uuid4())
+    chain_input = unit_tests_input(request)
+
+    async def events():
+        started = time.perf_counter()
+        # Sent before retrieval, so clients and proxies see bytes immediately
+        yield sse_event("start", {"session_id": session_id})
+        try:
+            context = await retrieve_context(chain_input["input"])
+            key, answer, cache_status = await lookup_answer(chain_input, context, cache_control)
+            report = None
+            if answer is not None:
+                yield sse_event("token", answer)
+            else:
+                stripper = FenceStripper()
+                pieces = []
+                packed, report = assemble_context(context)
+                async with generation_slots():
+                    async for chunk in get_unit_tests_answer_chain().astream({**chain_input, "context": packed},
+                                                                             config={"callbacks": [report.callback]}):
+                        piece = stripper.feed(chunk)
+                        if piece:
+                            if not pieces:
+                                logger.info(f"SID: {session_id}, first token after "
+                                            f"{time.perf_counter() - started:.3f}s")
+                            pieces.append(piece)
+                            yield sse_event("token", piece)
+                pieces.append(stripper.flush())
+                if pieces[-1]:
+                    yield sse_event("token", pieces[-1])
+                answer = ''.join(pieces)
+                await cache_answer(key, answer, context)
+        except Exception as e:
+            logger.error(f"SID: {session_id}, streaming generation failed: {e}", exc_info=True)
+            yield sse_event("error", {"detail": str(e)})
+            return
+
+        prompt_stats = report.to_dict() if report is not None else None
+        logger.info(f"SID: {session_id}, Cache: {cache_status}, streamed in {time.perf_counter() - started:.3f}s, "
+                    f"Prompt: {prompt_stats}, Response: {answer}")
+        await async_db.insert_application_logs(session_id, 'unit_tests_request', answer)
+        yield sse_event("done", {"session_id": session_id, "cache": cache_status, "prompt_stats": prompt_stats})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             # Keep nginx and similar proxies from buffering the stream
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.post("/unit-tests/batch",
+          response_class=StreamingResponse,
+          description='Generates unit tests for many requests, streamed back as server-sent events: "start" with '
+                      'the batch_id, one "result" per request as soon as it finishes (in completion order, with its '
+                      'index), then "done" with totals and throughput. Unfinished requests are cancelled when '
+                      'deadline_seconds passes, the batch is cancelled or the client disconnects.')
+async def batch_unit_tests(request: UnitTestBatchRequest, cache_control: Optional[str] = Header(None)):
+    deadline = min(request.deadline_seconds or GENERATION_BATCH_DEADLINE, GENERATION_BATCH_DEADLINE)
+    batch = start_batch(request.items, deadline, cache_control)
+
+    async def events():
+        try:
+            yield sse_event("start", {"batch_id": batch.id, "total": len(request.items), "deadline": deadline})
+            async for result in batch.results():
+                yield sse_event("result", result)
+            summary = batch.summary()
+            logger.info(f"Batch {batch.id}: {summary}")
+            yield sse_event("done", summary)
+        finally:
+            finish_batch(batch)
 
-    rag_chain = get_unit_tests_rag_chain()
-    answer = rag_chain.invoke({
-        "input": f"strictly follow system instructions and write unit tests for {'all source code in context' if request.request is None else request.request}",
-        "language": request.language,
-        "framework": request.framework,
-    })['answer']
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    # markdown stuff
-    answer = str.replace(answer, '```', '')
 
-    logger.info(f"SID: {session_id}, Response: {answer}")
-    insert_application_logs(session_id, 'unit_tests_request', answer)
-    return UnitTestResponse(source_code=answer, session_id=session_id)
+@router.delete("/unit-tests/batch/{batch_id}",
+            description='Cancels the unfinished requests of a running batch')
+async def cancel_batch(batch_id: str):
+    batch = get_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found.")
+    batch.cancel()
+    return {"message": f"Cancelled batch {batch_id}.", **batch.summary()}
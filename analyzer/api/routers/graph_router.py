@@ -0,0 +1,96 @@
+import hashlib
+import os
+import re
+import zlib
+from typing import Optional
+
+import zstandard
+from fastapi import APIRouter, HTTPException, Request, Query
+from fastapi.concurrency import run_in_threadpool
+
+from api import logs
+from api.data import async_db
+from api.data.code_graph import decompressor, UnsupportedEncoding
+from api.data.ingestion import get_ingestion_queue
+from api.data.types import DataType
+
+logger = logs.get_logger(__name__)
+
+router = APIRouter(prefix="/project/graph", tags=["Code graphs"])
+
+UPLOAD_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+DECODE_ERRORS = (zlib.error, zstandard.ZstdError)
+# The exporter's compact graph format (`--output-format compact`)
+CPGZ_CONTENT_TYPE = 'application/x-cpg-graph'
+
+
+@router.post("", response_model=dict)
+async def upload_graph(request: Request):
+    """Receives the merged Joern/PMD graph of the exporter (`orchestrate.py --target-url .../project/graph`).
+    The exporter finds no upload sessions here and streams the graph compressed, in one request, as GraphSON.
+
+    The body is decompressed (Content-Encoding gzip, zstd or identity) and written to disk as it
+    arrives, then indexed like a report. A graph uploaded under the same X-Upload-Id replaces the
+    previous one; without it, every upload replaces the last `merged_graph`.
+    """
+    content_type = (request.headers.get('content-type') or '').split(';')[0].strip()
+    if content_type == CPGZ_CONTENT_TYPE:
+        raise HTTPException(status_code=415, detail="CPGZ graphs are not read here; the exporter converts them to "
+                                                    "GraphSON when it uploads without sessions")
+    if content_type != 'application/json':
+        raise HTTPException(status_code=415, detail="Content-Type must be application/json (GraphSON)")
+    upload_id = request.headers.get('x-upload-id') or 'merged_graph'
+    if not UPLOAD_ID_RE.match(upload_id):
+        raise HTTPException(status_code=400, detail="X-Upload-Id may only contain letters, digits, '-' and '_' (max. 64)")
+    try:
+        decompress, flush, complete = decompressor((request.headers.get('content-encoding') or 'identity').strip().lower())
+    except UnsupportedEncoding as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
+    filename = f"{upload_id}.json"
+    queue = get_ingestion_queue()
+    job_id, file_path = queue.new_upload(filename)
+    digest = hashlib.sha256()
+    received_bytes, size = 0, 0
+    try:
+        # Blocks are small, so they are decompressed and written right here
+        with open(file_path, 'wb') as out:
+            def write(data: bytes):
+                nonlocal size
+                digest.update(data)
+                size += len(data)
+                out.write(data)
+
+            async for block in request.stream():
+                received_bytes += len(block)
+                write(decompress(block))
+            write(flush())
+    except DECODE_ERRORS as e:
+        os.remove(file_path)
+        raise HTTPException(status_code=400, detail=f"Could not decode the request body: {e}")
+    if size == 0:
+        os.remove(file_path)
+        raise HTTPException(status_code=400, detail="No data received")
+    if not complete():
+        os.remove(file_path)
+        raise HTTPException(status_code=400, detail="The compressed request body is truncated")
+
+    job_id = await run_in_threadpool(queue.submit_file, job_id, filename, DataType.REPORTS, file_path,
+                                     digest.hexdigest(), size)
+    logger.info(f"Received code graph {filename}: {received_bytes} bytes received, {size} bytes stored")
+    return {"status": "received", "job_id": job_id, "upload_id": upload_id, "size": size,
+            "received_bytes": received_bytes, "message": "Graph data received and queued for indexing."}
+
+
+@router.get("/violations", response_model=list[dict])
+async def get_violations(path: str, start_line: Optional[int] = None, end_line: Optional[int] = None,
+                         limit: int = Query(100, ge=1, le=1000)):
+    """PMD violations of a source file from the ingested graphs, optionally only within a line range.
+    `path` may be the full path or any trailing part of it, e.g. `com/example/Foo.java`."""
+    return await async_db.get_graph_violations(path, start_line, end_line, limit)
+
+
+@router.get("/methods", response_model=list[dict])
+async def get_methods(path: str, line: Optional[int] = None):
+    """Methods of a source file from the ingested graphs, or only the one containing `line`."""
+    return await async_db.get_graph_methods(path, line)
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, UploadFile
 
+from api.data.reindex import get_push_reindexer
 from api.data.vectorstore import *
 from api.routers.document_router import upload_and_index_document
 
@@ -32,14 +33,8 @@ async def process_hook(src: dict):
                 await upload_and_index_document(upload_file, DataType.REQUIREMENTS)
 
     elif event == 'push':
-        # fixme
-        for commit in payload['commits']:
-          for file in commit['added']:
-              pass
-              # add
-          for file in commit['removed']:
-              pass
-              # remove
-          for file in commit['modified']:
-              pass
-              # remove, add
+        # Applied in the background, together with the pushes that follow within REINDEX_DEBOUNCE_SECONDS
+        queued = get_push_reindexer().submit_push(payload)
+        return {"message": "Push queued for re-indexing", "files": queued}
+
+    return {"message": f"Event {event} processed"}
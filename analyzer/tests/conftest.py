@@ -0,0 +1,19 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# api.env reads its settings at import; keep the stores of the tests out of the working directory,
+# including the catalog, which api.data.db opens relative to it
+_data_dir = tempfile.mkdtemp(prefix="analyzer-tests-")
+os.chdir(_data_dir)
+os.environ.setdefault("API_PORT", "8000")
+os.environ.setdefault("LLM_MODEL", "test-model")
+os.environ.setdefault("LLM_OUTPUT_TOKEN_LIMIT", "256")
+os.environ.setdefault("VECTORSTORE_PATH", os.path.join(_data_dir, "vectorstore"))
+os.environ.setdefault("EMBEDDING_BACKEND", "fake")
+os.environ.setdefault("WARM_UP_MODELS", "false")
+for name, file in (("EMBEDDING_CACHE_PATH", "embedding_cache.db"), ("RESPONSE_CACHE_PATH", "response_cache.db"),
+                   ("LEXICAL_INDEX_PATH", "lexical_index.db")):
+    os.environ.setdefault(name, os.path.join(_data_dir, file))
@@ -0,0 +1,43 @@
+import asyncio
+import json
+
+from langchain_core.documents import Document
+
+from api.ai import analysis
+from api.data.response_cache import ResponseCache
+
+
+class CountingChain:
+    """Stands in for the analysis map chain and counts the chunks sent to the LLM."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, chain_input):
+        self.calls += 1
+        return json.dumps({"SQL injection": f"in {chain_input['context'][:20]}"})
+
+
+def chunks(file_id):
+    return [Document(page_content=f"class Service{n} {{ void run() {{ query(input + {n}); }} }}",
+                     metadata={"file_id": file_id}) for n in range(3)]
+
+
+def test_reupload_of_unchanged_file_sends_no_chunk_to_the_llm(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "response_cache.db"))
+    chain = CountingChain()
+    monkeypatch.setattr(analysis, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(analysis, "get_analysis_map_chain", lambda: chain)
+
+    first = asyncio.run(analysis.ChunkAnalysis(None).run(chunks(file_id=1)))
+    assert chain.calls == 3
+
+    # What ingestion does once the new upload (file_id 2) of the same file is indexed
+    cache.invalidate_files([1])
+    chain.calls = 0
+    rerun = analysis.ChunkAnalysis(None)
+    second = asyncio.run(rerun.run(chunks(file_id=2)))
+
+    assert chain.calls == 0
+    assert rerun.stats["cached"] == 3
+    assert second == first
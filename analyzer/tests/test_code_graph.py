@@ -0,0 +1,40 @@
+import uuid
+
+from langchain_core.documents import Document
+
+from api.data.code_graph import graph_violations_for
+from api.data.db import insert_code_graph_rows, insert_document_record
+from api.data.types import DataType
+
+
+def utils_graph():
+    """A code graph with two files of the same name in different packages, each with one violation."""
+    name = f"Utils{uuid.uuid4().hex[:8]}.java"
+    files, violations = [], []
+    for package in ("a", "b"):
+        path = f"src/main/java/{package}/{name}"
+        files.append((path, name, None, 1))
+        violations.append((path, name, 3, 3, f"Rule{package.upper()}", "bestpractices", 3, f"violation in {package}"))
+    insert_code_graph_rows(uuid.uuid4().hex, files, [], violations)
+    return name
+
+
+def chunk(file_id):
+    return Document(page_content="class Utils {}", metadata={"file_id": file_id, "start_line": 1, "end_line": 10})
+
+
+def test_violations_of_synced_file_come_from_its_own_package():
+    name = utils_graph()
+    file_id = insert_document_record(name, DataType.SOURCE_CODE, source_path=f"o/r:src/main/java/a/{name}")
+
+    violations = graph_violations_for([chunk(file_id)], limit=10)
+
+    assert [v.metadata['rule'] for v in violations] == ["RuleA"]
+    assert violations[0].metadata['filename'] == f"src/main/java/a/{name}"
+
+
+def test_uploaded_file_matching_several_graph_files_gets_no_violations():
+    name = utils_graph()
+    file_id = insert_document_record(name, DataType.SOURCE_CODE)
+
+    assert graph_violations_for([chunk(file_id)], limit=10) == []
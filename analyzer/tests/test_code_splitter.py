@@ -0,0 +1,32 @@
+from langchain_text_splitters import Language
+
+from api.data.code_splitter import CodeSplitter
+
+LONG_METHOD = "\n".join(f"        int value{i} = compute({i}, {i + 1});" for i in range(30))
+JAVA = f"""package a;
+
+import java.util.List;
+
+public class Calculator {{
+
+    public int small() {{
+        return 1;
+    }}
+
+    public void large() {{
+{LONG_METHOD}
+    }}
+}}
+"""
+
+
+def test_chunks_of_an_oversized_method_cover_the_file_exactly():
+    documents = CodeSplitter(chunk_size=300).split_text(JAVA, Language.JAVA)
+
+    assert "".join(document.page_content for document in documents) == JAVA
+    assert any(document.metadata.get("method") == "large" for document in documents[1:-1])
+    for document in documents:
+        start = document.metadata["start_index"]
+        assert JAVA[start:start + len(document.page_content)] == document.page_content
+        first_line = JAVA[:start + len(document.page_content) - len(document.page_content.lstrip())].count("\n") + 1
+        assert document.metadata["start_line"] == first_line
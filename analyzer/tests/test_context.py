@@ -0,0 +1,48 @@
+from langchain_core.documents import Document
+
+from api.ai.context import ContextAssembler
+
+FILE = "".join(f"line {i:03d} of the source file\n" for i in range(40))
+
+
+def chunk(file_id, start, end, positioned=True):
+    metadata = {"file_id": file_id}
+    if positioned:
+        metadata["start_index"] = start
+    return Document(page_content=FILE[start:end], metadata=metadata)
+
+
+def assembler(budget):
+    return ContextAssembler(budget=budget, count_tokens=len)
+
+
+def test_duplicates_are_dropped_and_overlapping_chunks_merged_by_position():
+    documents, stats = assembler(10_000).assemble([chunk(1, 100, 300), chunk(1, 250, 500), chunk(1, 100, 300),
+                                                   chunk(1, 500, 600)])
+
+    assert [document.page_content for document in documents] == [FILE[100:600]]
+    assert documents[0].metadata["merged_chunks"] == 3
+    assert stats.duplicate_chunks == 1
+    assert stats.merged_chunks == 2
+
+
+def test_chunks_without_position_are_merged_by_their_overlapping_text():
+    documents, stats = assembler(10_000).assemble([chunk(1, 200, 400, positioned=False),
+                                                   chunk(1, 0, 250, positioned=False)])
+
+    assert [document.page_content for document in documents] == [FILE[0:400]]
+    assert stats.merged_chunks == 1
+
+
+def test_chunks_of_different_files_are_not_merged():
+    documents, _ = assembler(10_000).assemble([chunk(1, 0, 200), chunk(2, 150, 300)])
+
+    assert [document.page_content for document in documents] == [FILE[0:200], FILE[150:300]]
+
+
+def test_blocks_that_do_not_fit_are_skipped_for_smaller_ones():
+    documents, stats = assembler(300).assemble([chunk(1, 0, 200), chunk(2, 0, 150), chunk(3, 0, 100)])
+
+    assert [document.metadata["file_id"] for document in documents] == [1, 3]
+    assert stats.dropped_blocks == 1
+    assert stats.context_tokens == 300
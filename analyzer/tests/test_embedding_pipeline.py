@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from api.data.embedding_pipeline import EmbeddingPipeline
+
+
+class RecordingStore:
+    """Stands in for a Chroma store: records the upserted batches and the deleted ids."""
+
+    def __init__(self):
+        self._collection = self
+        self.batches, self.deleted = [], []
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.batches.append(documents)
+
+    def delete(self, ids):
+        self.deleted.extend(ids)
+
+
+class GatedEmbeddings(Embeddings):
+    """Fake embeddings that wait for `release` on the batches starting with a chunk in `gated`, and
+    fail on those starting with a chunk in `failing`."""
+
+    def __init__(self, gated=(), failing=()):
+        self.fake = DeterministicFakeEmbedding(size=8)
+        self.gated, self.failing = set(gated), set(failing)
+        self.release = threading.Event()
+        self.started = []
+
+    def embed_documents(self, texts):
+        self.started.append(texts[0])
+        if texts[0] in self.failing:
+            raise RuntimeError(f"embedding of {texts[0]} failed")
+        if texts[0] in self.gated:
+            self.release.wait(5)
+        return self.fake.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.fake.embed_query(text)
+
+
+def documents(count):
+    return [Document(page_content=f"chunk {i}", metadata={"index": i}) for i in range(count)]
+
+
+def test_batches_are_written_in_order_when_later_ones_finish_first():
+    embeddings = GatedEmbeddings(gated=["chunk 0"])
+    store = RecordingStore()
+    pipeline = EmbeddingPipeline(embeddings, batch_size=2, max_concurrency=4)
+    threading.Timer(0.2, embeddings.release.set).start()
+
+    ids = pipeline.index_documents(store, documents(7))
+
+    assert store.batches == [["chunk 0", "chunk 1"], ["chunk 2", "chunk 3"], ["chunk 4", "chunk 5"], ["chunk 6"]]
+    assert len(ids) == 7
+    assert pipeline.stats()["chunks"] == 7
+
+
+def test_no_more_than_max_pending_batches_are_submitted():
+    embeddings = GatedEmbeddings(gated=["chunk 0"])
+    pipeline = EmbeddingPipeline(embeddings, batch_size=1, max_concurrency=4, max_pending_batches=2)
+    run = threading.Thread(target=pipeline.embed_documents, args=([f"chunk {i}" for i in range(6)],))
+    run.start()
+    try:
+        time.sleep(0.3)
+        # The oldest batch is still embedding, so the run waits for it instead of submitting more
+        assert sorted(embeddings.started) == ["chunk 0", "chunk 1"]
+    finally:
+        embeddings.release.set()
+        run.join(5)
+    assert sorted(embeddings.started) == [f"chunk {i}" for i in range(6)]
+
+
+def test_written_batches_are_removed_when_a_later_batch_fails():
+    embeddings = GatedEmbeddings(failing=["chunk 4"])
+    store = RecordingStore()
+    pipeline = EmbeddingPipeline(embeddings, batch_size=2, max_concurrency=1, max_pending_batches=1)
+
+    with pytest.raises(RuntimeError):
+        pipeline.index_documents(store, documents(6))
+
+    assert store.batches == [["chunk 0", "chunk 1"], ["chunk 2", "chunk 3"]]
+    assert len(store.deleted) == 4
+    assert pipeline.stats()["failed_batches"] == 1
+    assert pipeline.active() == []
@@ -0,0 +1,63 @@
+import gzip
+import os
+
+import pytest
+import zstandard
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.routers import graph_router
+
+GRAPH = b'{"vertices": [' + b'{"id": 1, "label": "FILE"},' * 2000 + b'{}]}'
+
+
+class FakeQueue:
+    def __init__(self, directory):
+        self.directory = directory
+        self.submitted = []
+
+    def new_upload(self, filename):
+        return "job", os.path.join(self.directory, filename)
+
+    def submit_file(self, job_id, filename, dtype, file_path, content_hash, size):
+        with open(file_path, 'rb') as f:
+            self.submitted.append(f.read())
+        return job_id
+
+
+@pytest.fixture
+def upload(tmp_path, monkeypatch):
+    queue = FakeQueue(str(tmp_path))
+    monkeypatch.setattr(graph_router, "get_ingestion_queue", lambda: queue)
+    app = FastAPI()
+    app.include_router(graph_router.router)
+    client = TestClient(app)
+
+    def post(body, encoding):
+        return client.post("/project/graph", content=body,
+                           headers={"Content-Type": "application/json", "Content-Encoding": encoding})
+    post.queue = queue
+    return post
+
+
+def zstd_frames(data):
+    # One frame per block, as the exporter may write them
+    compressor = zstandard.ZstdCompressor()
+    return b''.join(compressor.compress(data[start:start + 4096]) for start in range(0, len(data), 4096))
+
+
+@pytest.mark.parametrize("encoding, body", [("gzip", gzip.compress(GRAPH)), ("zstd", zstd_frames(GRAPH))])
+def test_complete_body_is_queued(upload, encoding, body):
+    response = upload(body, encoding)
+
+    assert response.status_code == 200
+    assert upload.queue.submitted == [GRAPH]
+
+
+@pytest.mark.parametrize("encoding, body", [("gzip", gzip.compress(GRAPH)), ("zstd", zstd_frames(GRAPH))])
+def test_truncated_body_is_rejected(upload, encoding, body):
+    response = upload(body[:-3], encoding)
+
+    assert response.status_code == 400
+    assert "truncated" in response.json()["detail"]
+    assert upload.queue.submitted == []
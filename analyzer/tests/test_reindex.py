@@ -0,0 +1,59 @@
+import hashlib
+import uuid
+
+import pytest
+
+from api.data import reindex
+from api.data.db import insert_document_record, get_document, DOCUMENT_INDEXED
+from api.data.types import DataType
+
+
+@pytest.fixture
+def reindexer(monkeypatch):
+    """A PushReindexer whose files are served from `files` and whose indexing is only recorded."""
+    files, indexed = {}, []
+    indexer = reindex.PushReindexer(debounce=60, raw_url="{repository}/{ref}/{path}")
+    monkeypatch.setattr(indexer, "_fetch", lambda repository, ref, path: files.get(path))
+    monkeypatch.setattr(reindex, "reindex_document_in_chroma",
+                        lambda file_path, file_id, dtype: indexed.append(file_id) or {"added": 1, "removed": 0,
+                                                                                       "kept": 0})
+    indexer.files, indexer.indexed = files, indexed
+    return indexer
+
+
+def push(indexer, repository, *paths):
+    indexer.submit_push({"repository": {"full_name": repository, "default_branch": "main"},
+                         "ref": "refs/heads/main", "after": "c0ffee" * 7,
+                         "commits": [{"added": [], "modified": list(paths), "removed": []}]})
+    return indexer.flush()
+
+
+def upload(name, content):
+    return insert_document_record(name, DataType.SOURCE_CODE, hashlib.sha256(content).hexdigest(), len(content),
+                                  status=DOCUMENT_INDEXED)
+
+
+def test_push_adopts_upload_of_file_in_subdirectory(reindexer):
+    name = f"Foo{uuid.uuid4().hex[:8]}.java"
+    file_id = upload(name, b"class Foo {}")
+    reindexer.files[f"src/main/java/com/example/{name}"] = b"class Foo { int x; }"
+
+    stats = push(reindexer, "owner/repo", f"src/main/java/com/example/{name}")
+
+    assert stats["indexed"] == 1
+    assert reindexer.indexed == [file_id]
+    assert get_document(file_id)["source_path"] == f"owner/repo:src/main/java/com/example/{name}"
+
+
+def test_upload_is_not_adopted_when_its_name_is_ambiguous(reindexer):
+    name = f"Utils{uuid.uuid4().hex[:8]}.java"
+    file_id = upload(name, b"class Utils {}")
+    reindexer.files[f"src/main/java/a/{name}"] = b"package a; class Utils {}"
+    reindexer.files[f"src/main/java/b/{name}"] = b"package b; class Utils {}"
+
+    push(reindexer, "owner/repo", f"src/main/java/a/{name}")
+    push(reindexer, "owner/repo", f"src/main/java/b/{name}")
+
+    assert reindexer.indexed[0] == file_id
+    assert reindexer.indexed[1] != file_id
+    assert get_document(file_id)["source_path"] == f"owner/repo:src/main/java/a/{name}"
@@ -0,0 +1,39 @@
+from langchain_core.documents import Document
+
+from api.ai.retrieval import reciprocal_rank_fusion, query_symbols
+
+
+def doc(id_):
+    return Document(id=id_, page_content=f"content of {id_}")
+
+
+def ids(documents):
+    return [document.id for document in documents]
+
+
+def test_documents_ranked_by_both_lists_come_first():
+    vector = [doc("a"), doc("b"), doc("c")]
+    lexical = [doc("c"), doc("d"), doc("b")]
+
+    assert ids(reciprocal_rank_fusion([(vector, 1.0), (lexical, 1.0)], rrf_k=60)) == ["c", "b", "a", "d"]
+
+
+def test_weights_decide_between_lists():
+    vector = [doc("a"), doc("b")]
+    lexical = [doc("b"), doc("a")]
+
+    assert ids(reciprocal_rank_fusion([(vector, 1.0), (lexical, 2.0)], rrf_k=60)) == ["b", "a"]
+    assert ids(reciprocal_rank_fusion([(vector, 2.0), (lexical, 1.0)], rrf_k=60)) == ["a", "b"]
+
+
+def test_documents_without_id_are_identified_by_file_and_content():
+    first = Document(page_content="class A {}", metadata={"file_id": 1})
+    same = Document(page_content="class A {}", metadata={"file_id": 1})
+    other_file = Document(page_content="class A {}", metadata={"file_id": 2})
+
+    assert len(reciprocal_rank_fusion([([first], 1.0), ([same, other_file], 1.0)], rrf_k=60)) == 2
+
+
+def test_query_symbols_splits_qualified_names():
+    assert query_symbols("Test `OrderService.refund` and parse_date in the invoiceTotal method") == \
+        ["OrderService", "refund", "parse_date", "invoiceTotal"]
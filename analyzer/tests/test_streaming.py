@@ -0,0 +1,26 @@
+import pytest
+
+from api.ai.streaming import FenceStripper
+
+
+@pytest.mark.parametrize("pieces", [
+    ["```java\nclass A {}\n```"],
+    ["``", "`java\nclass A {}\n`", "``"],
+    ["`", "`", "`java\n", "String s = \"`\";\n", "```"],
+    ["a `b` c``", "d ```", "`"],
+])
+def test_stripping_pieces_equals_stripping_the_whole_text(pieces):
+    stripper = FenceStripper()
+
+    streamed = "".join(stripper.feed(piece) for piece in pieces) + stripper.flush()
+
+    assert streamed == "".join(pieces).replace("```", "")
+
+
+def test_trailing_backticks_are_held_back_until_the_next_piece():
+    stripper = FenceStripper()
+
+    assert stripper.feed("int x;``") == "int x;"
+    assert stripper.feed("`\n") == "\n"
+    assert stripper.feed("a``") == "a"
+    assert stripper.flush() == "``"
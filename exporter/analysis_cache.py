@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import subprocess
+
+CACHE_DIR_NAME = ".analysis_cache"
+MANIFEST_FILE_NAME = "manifest.json"
+CHANGED_FILES_NAME = "changed_files.json"
+
+# Build outputs and tool state that neither Joern nor PMD results depend on
+IGNORED_DIRS = {".git", ".idea", ".gradle", ".mvn", "target", "build", "out", "node_modules", "__pycache__"}
+
+# Modules the merge script imports from its own directory; a change in any of them, or in the
+# merge script itself, invalidates the cache
+MERGE_SOURCES = ("path_index.py", "graph_codec.py")
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+STATUS_HIT = "hit"
+STATUS_PARTIAL = "partial"
+STATUS_MISS = "miss"
+STATUS_DISABLED = "disabled"
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_project_files(project_dir):
+    """Returns a mapping of project-relative path (forward slashes) to the sha256 of its content."""
+    file_hashes = {}
+    for root, dirs, files in os.walk(project_dir):
+        dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRS)
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            rel_path = os.path.relpath(path, project_dir).replace("\\", "/")
+            file_hashes[rel_path] = hash_file(path)
+    return file_hashes
+
+
+def _docker_image_id(image):
+    try:
+        process = subprocess.run(["docker", "image", "inspect", "--format", "{{.Id}}", image],
+                                 check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        return process.stdout.strip() or image
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        # Not pulled yet or docker unavailable: the tag is the best version we know
+        return image
+
+
+def compose_images(compose_file, services):
+    """Reads the image of each service from a docker-compose file (plain `image:` keys only)."""
+    images = {}
+    current_service = None
+    in_services = False
+    with open(compose_file, "r", encoding="utf-8") as f:
+        for line in f:
+            stripped = line.strip()
+            if not stripped or stripped.startswith("#"):
+                continue
+            indent = len(line) - len(line.lstrip())
+            if indent == 0:
+                in_services = stripped == "services:"
+                continue
+            if in_services and indent == 2 and stripped.endswith(":"):
+                current_service = stripped[:-1]
+            elif in_services and current_service in services and stripped.startswith("image:"):
+                images[current_service] = stripped[len("image:"):].strip()
+    return images
+
+
+def collect_tool_versions(compose_file, merge_script, output_format, services=("joern", "lint")):
+    """Versions of everything besides the project sources that the analysis artifacts depend on."""
+    versions = {
+        "output_format": output_format,
+        "compose_file": hash_file(compose_file),
+        "merge_script": hash_file(merge_script),
+    }
+    for service, image in compose_images(compose_file, services).items():
+        versions[f"image:{service}"] = _docker_image_id(image)
+    merge_dir = os.path.dirname(os.path.abspath(merge_script))
+    for source in MERGE_SOURCES:
+        source_path = os.path.join(merge_dir, source)
+        if os.path.exists(source_path):
+            versions[source] = hash_file(source_path)
+    return versions
+
+
+def compute_cache_key(file_hashes, tool_versions):
+    payload = json.dumps({"files": file_hashes, "tools": tool_versions}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def diff_file_hashes(previous, current):
+    return {
+        "added": sorted(path for path in current if path not in previous),
+        "modified": sorted(path for path in current if path in previous and previous[path] != current[path]),
+        "removed": sorted(path for path in previous if path not in current),
+    }
+
+
+def _artifact_fingerprint(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class CacheLookup:
+    def __init__(self, status, key, reason, changes=None):
+        self.status = status
+        self.key = key
+        self.reason = reason
+        self.changes = changes or {"added": [], "modified": [], "removed": []}
+
+    @property
+    def is_hit(self):
+        return self.status == STATUS_HIT
+
+    def changed_file_count(self):
+        return sum(len(paths) for paths in self.changes.values())
+
+    def describe(self):
+        if self.status == STATUS_DISABLED:
+            return "disabled"
+        short_key = self.key[:12] if self.key else "n/a"
+        if self.status == STATUS_PARTIAL:
+            return (f"MISS (partial, key {short_key}): {len(self.changes['added'])} added, "
+                    f"{len(self.changes['modified'])} modified, {len(self.changes['removed'])} removed file(s)")
+        return f"{self.status.upper()} (key {short_key}): {self.reason}"
+
+
+class AnalysisCache:
+    """Content-addressed cache of the PMD report, Joern export and merged graph in an export directory.
+
+    The key is derived from per-file content hashes of the Java project plus the tool versions.
+    Artifacts stay where the workflow writes them; the manifest records their size and mtime so a
+    hit is only reported when they are still exactly the files produced for that key.
+    """
+
+    def __init__(self, export_dir, project_dir, tool_versions):
+        self.export_dir = export_dir
+        self.project_dir = project_dir
+        self.tool_versions = tool_versions
+        self.cache_dir = os.path.join(export_dir, CACHE_DIR_NAME)
+        self.manifest_path = os.path.join(self.cache_dir, MANIFEST_FILE_NAME)
+        self.changed_files_path = os.path.join(export_dir, CHANGED_FILES_NAME)
+        self.file_hashes = None
+        self.key = None
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Warning: Ignoring unreadable analysis cache manifest {self.manifest_path}: {e}")
+            return None
+
+    def lookup(self, artifact_paths):
+        """Hashes the project and compares it with the manifest of the previous successful run."""
+        self.file_hashes = hash_project_files(self.project_dir)
+        self.key = compute_cache_key(self.file_hashes, self.tool_versions)
+        print(f"Hashed {len(self.file_hashes)} project file(s). Analysis cache key: {self.key[:12]}")
+
+        manifest = self._load_manifest()
+        if manifest is None:
+            return CacheLookup(STATUS_MISS, self.key, "no previous run recorded",
+                               diff_file_hashes({}, self.file_hashes))
+
+        changes = diff_file_hashes(manifest.get("files", {}), self.file_hashes)
+        if manifest.get("tools") != self.tool_versions:
+            return CacheLookup(STATUS_MISS, self.key, "tool versions changed", changes)
+        if manifest.get("key") != self.key:
+            return CacheLookup(STATUS_PARTIAL, self.key, "project files changed", changes)
+
+        recorded_artifacts = manifest.get("artifacts", {})
+        for name, path in artifact_paths.items():
+            recorded = recorded_artifacts.get(name)
+            if recorded is None or recorded.get("path") != path or not os.path.exists(path) or \
+                    _artifact_fingerprint(path) != recorded.get("fingerprint"):
+                return CacheLookup(STATUS_MISS, self.key, f"cached {name} is missing or was modified")
+
+        return CacheLookup(STATUS_HIT, self.key, "project and tools unchanged")
+
+    def record_changes(self, lookup):
+        """Writes the files changed since the previous run for downstream incremental work."""
+        with open(self.changed_files_path, "w", encoding="utf-8") as f:
+            json.dump({"status": lookup.status, "key": self.key, **lookup.changes}, f, indent=2)
+        print(f"Recorded {lookup.changed_file_count()} changed file(s) in {self.changed_files_path}")
+
+    def invalidate(self):
+        """Forgets the previous run, so an interrupted run can never be reported as a hit."""
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+
+    def store(self, artifact_paths):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        manifest = {
+            "key": self.key,
+            "tools": self.tool_versions,
+            "files": self.file_hashes,
+            "artifacts": {name: {"path": path, "fingerprint": _artifact_fingerprint(path)}
+                          for name, path in artifact_paths.items()},
+        }
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self.manifest_path)
+        print(f"Stored analysis cache manifest for key {self.key[:12]}")
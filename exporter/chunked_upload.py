@@ -0,0 +1,314 @@
+"""Chunked, compressed and resumable upload of merged graphs.
+
+The file is compressed on the fly and cut into fixed-size parts, which are uploaded in parallel
+over one pooled HTTP session:
+
+    POST   {target_url}/sessions                  -> {"session_id": ...}
+    GET    {target_url}/sessions/{id}             -> {"parts": {"<n>": "<sha256>", ...}}
+    PUT    {target_url}/sessions/{id}/parts/{n}   body: raw part, header X-Part-SHA256
+    POST   {target_url}/sessions/{id}/complete    {"parts": n, "size": ..., "sha256": ...}
+
+Only a bounded number of parts is held in memory at a time. Progress is kept in a small state
+file next to the uploaded file, so an interrupted upload resumes with the first part the server
+does not have yet. Compression is deterministic, so re-compressing on resume yields the same parts.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ENCODING_GZIP = "gzip"
+ENCODING_ZSTD = "zstd"
+ENCODING_IDENTITY = "identity"
+ENCODINGS = (ENCODING_GZIP, ENCODING_ZSTD, ENCODING_IDENTITY)
+
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_WORKERS = 4
+DEFAULT_PART_RETRIES = 5
+DEFAULT_REQUEST_TIMEOUT = 120
+STATE_FILE_SUFFIX = ".upload.json"
+
+_READ_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+class SessionNotFound(UploadError):
+    pass
+
+
+class ChunkedUploadsUnsupported(UploadError):
+    """The receiver has no session endpoints; the file has to be sent in a single request."""
+
+
+def _gzip_compressor():
+    # wbits=31 writes a gzip header without file name or mtime, so the output is reproducible
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def _zstd_compressor():
+    compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    return compressor.compress, compressor.flush
+
+
+def _identity_compressor():
+    return (lambda data: data), (lambda: b"")
+
+
+def resolve_encoding(encoding):
+    if encoding == ENCODING_ZSTD and zstandard is None:
+        print("Warning: zstandard is not installed, falling back to gzip for the upload.")
+        return ENCODING_GZIP
+    return encoding
+
+
+def compressor(encoding):
+    """(compress, flush) functions that write one deterministic stream in `encoding`."""
+    return {
+        ENCODING_GZIP: _gzip_compressor,
+        ENCODING_ZSTD: _zstd_compressor,
+        ENCODING_IDENTITY: _identity_compressor,
+    }[encoding]()
+
+
+def iter_compressed(blocks, encoding):
+    """Compresses an iterable of byte blocks on the fly, yielding the non-empty compressed blocks."""
+    compress, flush = compressor(encoding)
+    for block in blocks:
+        data = compress(block)
+        if data:
+            yield data
+    data = flush()
+    if data:
+        yield data
+
+
+def iter_compressed_parts(file_path, encoding, part_size):
+    """Yields (part_number, bytes) of the compressed file, starting at 1. Every part but the last is `part_size` bytes."""
+    compress, flush = compressor(encoding)
+
+    buffer = bytearray()
+    part_number = 1
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(_READ_BLOCK_SIZE), b""):
+            buffer += compress(block)
+            while len(buffer) >= part_size:
+                yield part_number, bytes(buffer[:part_size])
+                del buffer[:part_size]
+                part_number += 1
+    buffer += flush()
+    while len(buffer) > part_size:
+        yield part_number, bytes(buffer[:part_size])
+        del buffer[:part_size]
+        part_number += 1
+    if buffer or part_number == 1:
+        yield part_number, bytes(buffer)
+
+
+def _file_fingerprint(file_path):
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class UploadState:
+    """Upload progress persisted next to the uploaded file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        self._lock = threading.Lock()
+
+    def load(self, expected):
+        """Loads the state if it belongs to an upload of the same file with the same settings."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Warning: Ignoring unreadable upload state {self.path}: {e}")
+            return False
+        if any(data.get(key) != value for key, value in expected.items()):
+            print("Previous upload state belongs to a different file or settings. Starting a new upload.")
+            return False
+        self.data = data
+        return True
+
+    def start(self, session_id, expected):
+        self.data = dict(expected, session_id=session_id, parts={})
+        self.save()
+
+    @property
+    def session_id(self):
+        return self.data.get("session_id")
+
+    def mark_part(self, part_number, checksum):
+        with self._lock:
+            self.data["parts"][str(part_number)] = checksum
+            self.save()
+
+    def save(self):
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f)
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ChunkedUploader:
+    def __init__(self, target_url, workers=DEFAULT_WORKERS, part_size=DEFAULT_PART_SIZE,
+                 encoding=ENCODING_GZIP, retries=DEFAULT_PART_RETRIES, timeout=DEFAULT_REQUEST_TIMEOUT):
+        self.target_url = target_url.rstrip("/")
+        self.workers = workers
+        self.part_size = part_size
+        self.encoding = resolve_encoding(encoding)
+        self.retries = retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _url(self, *parts):
+        return "/".join([self.target_url, "sessions", *map(str, parts)])
+
+    def _request(self, method, url, retry=True, **kwargs):
+        attempts = self.retries if retry else 1
+        for attempt in range(1, attempts + 1):
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                if response.status_code == 404:
+                    raise SessionNotFound(f"{method} {url} returned 404")
+                # Client errors other than a checksum mismatch will not go away on retry
+                if 400 <= response.status_code < 500 and response.status_code != 422:
+                    response.raise_for_status()
+                if response.status_code < 400:
+                    return response
+                error = f"{method} {url} returned {response.status_code}: {response.text[:200]}"
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = f"{method} {url} failed: {e}"
+            if attempt < attempts:
+                delay = min(2 ** (attempt - 1), 30)
+                print(f"Warning: {error}. Retrying in {delay}s ({attempt}/{attempts}).")
+                time.sleep(delay)
+        raise UploadError(error)
+
+    def _create_session(self, content_type):
+        try:
+            response = self._request("POST", self._url(), json={
+                "content_type": content_type,
+                "content_encoding": self.encoding,
+                "part_size": self.part_size,
+            })
+        except SessionNotFound:
+            raise ChunkedUploadsUnsupported(f"POST {self._url()} returned 404")
+        return response.json()["session_id"]
+
+    def _server_parts(self, session_id):
+        try:
+            return self._request("GET", self._url(session_id)).json().get("parts", {})
+        except SessionNotFound:
+            return None
+
+    def _upload_part(self, session_id, part_number, data, checksum, state):
+        self._request("PUT", self._url(session_id, "parts", part_number), data=data, headers={
+            "Content-Type": "application/octet-stream",
+            "X-Part-SHA256": checksum,
+        })
+        state.mark_part(part_number, checksum)
+        return len(data)
+
+    def upload(self, file_path, content_type):
+        """Uploads `file_path` and returns the JSON response of the complete call."""
+        state = UploadState(file_path + STATE_FILE_SUFFIX)
+        expected = {
+            "target_url": self.target_url,
+            "file": _file_fingerprint(file_path),
+            "content_encoding": self.encoding,
+            "part_size": self.part_size,
+        }
+
+        done_parts = {}
+        if state.load(expected):
+            done_parts = self._server_parts(state.session_id)
+            if done_parts is None:
+                print(f"Upload session {state.session_id} no longer exists on the server. Starting over.")
+            else:
+                print(f"Resuming upload session {state.session_id}: "
+                      f"{len(done_parts)} part(s) already on the server.")
+        if not state.session_id or done_parts is None:
+            done_parts = {}
+            state.start(self._create_session(content_type), expected)
+
+        try:
+            return self._upload_parts(file_path, state, done_parts)
+        except SessionNotFound:
+            # The server dropped the session mid-upload, e.g. after a restart; its parts are gone too
+            print(f"Upload session {state.session_id} no longer exists on the server. Starting over.")
+            state.start(self._create_session(content_type), expected)
+            return self._upload_parts(file_path, state, {})
+
+    def _upload_parts(self, file_path, state, done_parts):
+        """Uploads the parts missing from `done_parts` to the session in `state` and completes it."""
+        session_id = state.session_id
+        whole_digest = hashlib.sha256()
+        total_size = 0
+        part_count = 0
+        sent_bytes = 0
+        started = time.perf_counter()
+        # At most two parts per worker are held in memory at any time
+        max_in_flight = self.workers * 2
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="upload") as executor:
+            in_flight = set()
+            for part_number, data in iter_compressed_parts(file_path, self.encoding, self.part_size):
+                whole_digest.update(data)
+                total_size += len(data)
+                part_count = part_number
+                checksum = hashlib.sha256(data).hexdigest()
+                if done_parts.get(str(part_number)) == checksum:
+                    continue
+                while len(in_flight) >= max_in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    sent_bytes += sum(future.result() for future in done)
+                in_flight.add(executor.submit(self._upload_part, session_id, part_number, data, checksum, state))
+            for future in in_flight:
+                sent_bytes += future.result()
+
+        elapsed = time.perf_counter() - started
+        source_size = os.path.getsize(file_path)
+        print(f"Uploaded {sent_bytes} of {total_size} compressed bytes ({self.encoding}, {part_count} part(s), "
+              f"{source_size} bytes uncompressed) in {elapsed:.1f}s.")
+
+        response = self._request("POST", self._url(session_id, "complete"), json={
+            "parts": part_count,
+            "size": total_size,
+            "sha256": whole_digest.hexdigest(),
+        })
+        state.clear()
+        return response.json()
@@ -0,0 +1,350 @@
+"""Compact encoding ("CPGZ") for Joern GraphSON documents.
+
+A CPGZ file is the magic header followed by one zlib stream of framed events. The skeleton of the
+document (objects, keys, small values) is written as structural events, while every element of the
+`vertices` and `edges` arrays is its own record holding compact JSON. Records can therefore be
+iterated lazily, and decoding yields exactly the values json.load would produce for the original
+GraphSON. Repeated property keys, labels and GraphSON type wrappers are deduplicated by the
+compressor's dictionary instead of a Python-level string table, so both emit and parse stay in C.
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+
+MAGIC = b"CPGZ"
+FORMAT_VERSION = 1
+CONTENT_TYPE = "application/x-cpg-graph"
+FILE_EXTENSION = ".cpgz"
+DEFAULT_COMPRESSION_LEVEL = 3
+
+# Arrays of the graph components that are stored as records
+RECORD_ARRAYS = ("vertices", "edges")
+
+# Event kinds
+E_BEGIN_OBJECT = b"{"
+E_END_OBJECT = b"}"
+E_KEY = b"K"
+E_VALUE = b"="
+E_BEGIN_RECORDS = b"["
+E_RECORD = b"R"
+E_END_RECORDS = b"]"
+
+_FRAME_HEADER = struct.Struct(">cI")
+_READ_CHUNK_SIZE = 1024 * 1024
+
+_dumps = json.JSONEncoder(separators=(",", ":")).encode
+_loads = json.JSONDecoder().decode
+
+
+class CompactGraphWriter:
+    """Writes a GraphSON document as CPGZ events.
+
+    Containers are opened and closed explicitly, so a document can be written while it is still
+    being read (see merge_tool's streaming engine).
+    """
+
+    def __init__(self, f, compression_level=DEFAULT_COMPRESSION_LEVEL):
+        self._f = f
+        self._compressor = zlib.compressobj(compression_level)
+        f.write(MAGIC)
+        f.write(bytes([FORMAT_VERSION]))
+
+    def _event(self, kind, payload=b""):
+        data = self._compressor.compress(_FRAME_HEADER.pack(kind, len(payload)) + payload)
+        if data:
+            self._f.write(data)
+
+    def begin_object(self):
+        self._event(E_BEGIN_OBJECT)
+
+    def end_object(self):
+        self._event(E_END_OBJECT)
+
+    def key(self, key):
+        self._event(E_KEY, key.encode("utf-8"))
+
+    def value(self, value):
+        self._event(E_VALUE, _dumps(value).encode("utf-8"))
+
+    def begin_records(self):
+        self._event(E_BEGIN_RECORDS)
+
+    def record(self, value):
+        self._event(E_RECORD, _dumps(value).encode("utf-8"))
+
+    def end_records(self):
+        self._event(E_END_RECORDS)
+
+    def copy_value(self, reader):
+        """Copies the next value of a merge_tool.JsonStreamReader."""
+        self.value(reader.read_value())
+
+    def copy_records(self, reader):
+        """Copies the next array of a merge_tool.JsonStreamReader as records, one item at a time."""
+        self.begin_records()
+        for item in reader.iter_array():
+            self.record(item)
+        self.end_records()
+
+    def close(self):
+        self._f.write(self._compressor.flush())
+
+
+class CompactGraphReader:
+    """Reads a CPGZ document, decompressing only as much as the current event needs."""
+
+    def __init__(self, f):
+        self._f = f
+        self._decompressor = zlib.decompressobj()
+        self._buf = b""
+        self._pos = 0
+        header = f.read(len(MAGIC) + 1)
+        if header[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a CPGZ file (bad magic)")
+        if header[len(MAGIC)] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported CPGZ format version {header[len(MAGIC)]}")
+
+    def _ensure(self, size):
+        """Makes sure at least `size` decompressed bytes are buffered after the read position."""
+        if len(self._buf) - self._pos >= size:
+            return True
+        parts = [self._buf[self._pos:]]
+        available = len(parts[0])
+        while available < size:
+            pending = self._decompressor.unconsumed_tail
+            if not pending:
+                pending = self._f.read(_READ_CHUNK_SIZE)
+                if not pending:
+                    break
+            data = self._decompressor.decompress(pending, max(size - available, _READ_CHUNK_SIZE))
+            parts.append(data)
+            available += len(data)
+        self._buf = b"".join(parts)
+        self._pos = 0
+        return available >= size
+
+    def _next_event(self):
+        if not self._ensure(_FRAME_HEADER.size):
+            raise ValueError("Unexpected end of CPGZ stream")
+        kind, size = _FRAME_HEADER.unpack_from(self._buf, self._pos)
+        self._pos += _FRAME_HEADER.size
+        if size and not self._ensure(size):
+            raise ValueError("Unexpected end of CPGZ stream")
+        payload = self._buf[self._pos:self._pos + size]
+        self._pos += size
+        return kind, payload
+
+    def _iter_records(self):
+        while True:
+            kind, payload = self._next_event()
+            if kind == E_END_RECORDS:
+                return
+            yield _loads(payload.decode("utf-8"))
+
+    def _read_object(self):
+        result = {}
+        while True:
+            kind, payload = self._next_event()
+            if kind == E_END_OBJECT:
+                return result
+            if kind != E_KEY:
+                raise ValueError(f"Expected a key event in CPGZ stream but found {kind!r}")
+            result[payload.decode("utf-8")] = self._read_value()
+
+    def _read_value(self):
+        kind, payload = self._next_event()
+        if kind == E_VALUE:
+            return _loads(payload.decode("utf-8"))
+        if kind == E_BEGIN_OBJECT:
+            return self._read_object()
+        if kind == E_BEGIN_RECORDS:
+            return list(self._iter_records())
+        raise ValueError(f"Unexpected event {kind!r} in CPGZ stream")
+
+    def read_document(self):
+        return self._read_value()
+
+    def iter_json(self):
+        """Yields the document as compact GraphSON JSON, piece by piece, without decoding its values."""
+        kind, payload = self._next_event()
+        if kind == E_VALUE:
+            yield payload
+        elif kind == E_BEGIN_OBJECT:
+            yield b"{"
+            separator = b""
+            while True:
+                kind, payload = self._next_event()
+                if kind == E_END_OBJECT:
+                    break
+                if kind != E_KEY:
+                    raise ValueError(f"Expected a key event in CPGZ stream but found {kind!r}")
+                yield separator + _dumps(payload.decode("utf-8")).encode("utf-8") + b":"
+                separator = b","
+                yield from self.iter_json()
+            yield b"}"
+        elif kind == E_BEGIN_RECORDS:
+            yield b"["
+            separator = b""
+            while True:
+                kind, payload = self._next_event()
+                if kind == E_END_RECORDS:
+                    break
+                yield separator + payload
+                separator = b","
+            yield b"]"
+        else:
+            raise ValueError(f"Unexpected event {kind!r} in CPGZ stream")
+
+    def iter_records(self, array_name):
+        """Lazily yields the items of the first record array called `array_name` (`vertices` or `edges`).
+
+        Other parts of the document are skipped without being decoded.
+        """
+        while True:
+            kind, payload = self._next_event()
+            if kind == E_KEY and payload.decode("utf-8") == array_name:
+                kind, _ = self._next_event()
+                if kind == E_BEGIN_RECORDS:
+                    yield from self._iter_records()
+                    return
+            elif kind == E_END_OBJECT and not self._ensure(1):
+                return
+
+
+def write_compact(data, output_path, compression_level=DEFAULT_COMPRESSION_LEVEL):
+    """Writes a loaded GraphSON document in CPGZ format."""
+    with open(output_path, "wb") as f:
+        writer = CompactGraphWriter(f, compression_level)
+        _write_object(writer, data, in_graph=False)
+        writer.close()
+
+
+def _write_object(writer, data, in_graph):
+    writer.begin_object()
+    for key, value in data.items():
+        writer.key(key)
+        if in_graph and key in RECORD_ARRAYS and isinstance(value, list):
+            writer.begin_records()
+            for item in value:
+                writer.record(item)
+            writer.end_records()
+        elif not in_graph and key in ("@value", "graph") and isinstance(value, dict):
+            _write_object(writer, value, in_graph=True)
+        else:
+            writer.value(value)
+    writer.end_object()
+
+
+def read_compact(input_path):
+    """Reads a whole CPGZ file back into the GraphSON document structure."""
+    with open(input_path, "rb") as f:
+        return CompactGraphReader(f).read_document()
+
+
+def iter_vertices(input_path):
+    """Lazily yields the vertices of a CPGZ file one at a time."""
+    with open(input_path, "rb") as f:
+        yield from CompactGraphReader(f).iter_records("vertices")
+
+
+def iter_edges(input_path):
+    """Lazily yields the edges of a CPGZ file one at a time."""
+    with open(input_path, "rb") as f:
+        yield from CompactGraphReader(f).iter_records("edges")
+
+
+def iter_graphson(input_path, block_size=_READ_CHUNK_SIZE):
+    """Streams a CPGZ file as the equivalent compact GraphSON JSON, in blocks of about `block_size` bytes,
+    for receivers that only read GraphSON."""
+    with open(input_path, "rb") as f:
+        pieces, size = [], 0
+        for piece in CompactGraphReader(f).iter_json():
+            pieces.append(piece)
+            size += len(piece)
+            if size >= block_size:
+                yield b"".join(pieces)
+                pieces, size = [], 0
+        if pieces:
+            yield b"".join(pieces)
+
+
+def is_compact_file(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def benchmark(graphson_path, work_dir=None):
+    """Compares size and emit/parse time of pretty-printed GraphSON, compact GraphSON and CPGZ."""
+    work_dir = work_dir or os.path.dirname(os.path.abspath(graphson_path))
+    print(f"Loading {graphson_path} ...")
+    with open(graphson_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    def emit_json(path, **kwargs):
+        with open(path, "w", encoding="utf-8") as f_out:
+            json.dump(data, f_out, **kwargs)
+
+    def parse_json(path):
+        with open(path, "r", encoding="utf-8") as f_in:
+            return json.load(f_in)
+
+    outputs = {
+        "graphson (indent=2)": ("bench_graphson_indent.json", lambda p: emit_json(p, indent=2), parse_json),
+        "graphson (compact)": ("bench_graphson_compact.json",
+                               lambda p: emit_json(p, separators=(",", ":")), parse_json),
+        "cpgz": ("bench_graph" + FILE_EXTENSION, lambda p: write_compact(data, p), read_compact),
+    }
+
+    print(f"{'format':<22}{'size (bytes)':>15}{'emit (s)':>10}{'parse (s)':>11}{'first vertex (ms)':>19}")
+    for name, (filename, emit, parse) in outputs.items():
+        path = os.path.join(work_dir, filename)
+        started = time.perf_counter()
+        emit(path)
+        emit_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        parsed = parse(path)
+        parse_time = time.perf_counter() - started
+        if parsed != data:
+            print(f"ERROR: {name} did not round-trip exactly")
+        del parsed
+
+        first_vertex = "-"
+        if name == "cpgz":
+            started = time.perf_counter()
+            next(iter_vertices(path), None)
+            first_vertex = f"{(time.perf_counter() - started) * 1000:.2f}"
+
+        print(f"{name:<22}{os.path.getsize(path):>15}{emit_time:>10.2f}{parse_time:>11.2f}{first_vertex:>19}")
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert and benchmark the compact CPGZ graph format.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    encode_parser = subparsers.add_parser("encode", help="Convert a GraphSON file to CPGZ.")
+    encode_parser.add_argument("input")
+    encode_parser.add_argument("output")
+
+    decode_parser = subparsers.add_parser("decode", help="Convert a CPGZ file back to GraphSON.")
+    decode_parser.add_argument("input")
+    decode_parser.add_argument("output")
+
+    bench_parser = subparsers.add_parser("bench", help="Compare GraphSON and CPGZ on a Joern export.")
+    bench_parser.add_argument("input", help="Path to a Joern GraphSON export.")
+    args = parser.parse_args()
+
+    if args.command == "encode":
+        with open(args.input, "r", encoding="utf-8") as f_in:
+            write_compact(json.load(f_in), args.output)
+    elif args.command == "decode":
+        with open(args.output, "w", encoding="utf-8") as f_out:
+            json.dump(read_compact(args.input), f_out)
+    else:
+        benchmark(args.input)
+    sys.exit(0)
@@ -1,34 +1,281 @@
 import json
 import os
 import argparse
+import re
 import sys
 
+import graph_codec
+from path_index import DEFAULT_SOURCE_ROOTS, PmdPathIndex
+
+# Joern exports above this size are merged in streaming mode unless --no-stream is given
+DEFAULT_STREAM_THRESHOLD_MB = 256
+DEFAULT_STREAM_CHUNK_SIZE = 1024 * 1024
+
+OUTPUT_FORMAT_GRAPHSON = "graphson"
+OUTPUT_FORMAT_COMPACT = "compact"
+OUTPUT_FORMATS = (OUTPUT_FORMAT_GRAPHSON, OUTPUT_FORMAT_COMPACT)
+
+_STRUCTURAL_CHARS_RE = re.compile(r'["{}\[\]]')
+_STRING_END_RE = re.compile(r'["\\]')
+_WHITESPACE = " \t\r\n"
+
+
+class JsonStreamReader:
+    """Incremental JSON reader that keeps only a small window of the input file in memory."""
+
+    def __init__(self, f, chunk_size=DEFAULT_STREAM_CHUNK_SIZE):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Drops the consumed part of the buffer and appends the next chunk. Returns False at EOF."""
+        if self._eof:
+            return False
+        chunk = self._f.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
 
-def normalize_path(path_str):
-    """Normalize file paths to use forward slashes and OS-normalized separators."""
-    if path_str is None:
-        return None
-    path_str = path_str.replace("\\", "/")
-    return os.path.normpath(path_str)
+    def peek(self):
+        """Skips whitespace and returns the next character without consuming it ('' at EOF)."""
+        while True:
+            buf = self._buf
+            pos = self._pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' in JSON stream but found '{found or 'EOF'}'")
+        self._pos += 1
+
+    def read_value(self):
+        """Decodes the next complete JSON value, reading more input until it is fully buffered."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def iter_array(self):
+        """Yields the decoded items of the next JSON array one at a time."""
+        self.expect("[")
+        first = True
+        while self.peek() != "]":
+            if not first:
+                self.expect(",")
+            yield self.read_value()
+            first = False
+        self.expect("]")
+
+    def copy_value(self, write):
+        """Copies the raw text of the next JSON value to `write` without decoding it."""
+        if self.peek() not in "{[":
+            write(json.dumps(self.read_value()))
+            return
+
+        depth = 0
+        in_string = False
+        while True:
+            buf = self._buf
+            start = pos = self._pos
+            while True:
+                if in_string:
+                    match = _STRING_END_RE.search(buf, pos)
+                    if match is None:
+                        pos = len(buf)
+                        break
+                    pos = match.end()
+                    if match.group() == "\\":
+                        if pos == len(buf):
+                            # Keep the backslash so the escaped char is seen together with it
+                            pos -= 1
+                            break
+                        pos += 1
+                    else:
+                        in_string = False
+                    continue
 
+                match = _STRUCTURAL_CHARS_RE.search(buf, pos)
+                if match is None:
+                    pos = len(buf)
+                    break
+                pos = match.end()
+                char = match.group()
+                if char == '"':
+                    in_string = True
+                elif char in "{[":
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        write(buf[start:pos])
+                        self._pos = pos
+                        return
+
+            write(buf[start:pos])
+            self._pos = pos
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON stream while copying a value")
+
+
+class MergeStats:
+    def __init__(self):
+        self.joern_file_nodes_found = 0
+        self.joern_file_nodes_matched = 0
+
+
+def build_pmd_index(pmd_report_path, source_roots=DEFAULT_SOURCE_ROOTS):
+    """Loads the PMD report and indexes it for matching. Returns None if the report cannot be loaded."""
+    pmd_data = load_pmd_report(pmd_report_path)
+    if pmd_data is None:
+        return None
+    return PmdPathIndex.from_pmd_report(pmd_data, source_roots)
 
-def merge_reports(pmd_report_path, joern_export_path, merged_output_path):
-    print(f"Starting merge process...")
 
+def load_pmd_report(pmd_report_path):
     print(f"Loading PMD report from: {pmd_report_path}")
     try:
         with open(pmd_report_path, 'r', encoding='utf-8') as f:
-            pmd_data = json.load(f)
+            return json.load(f)
     except FileNotFoundError:
         print(f"ERROR: PMD report file not found at {pmd_report_path}")
-        return False
     except json.JSONDecodeError as e:
         print(f"ERROR: Could not decode JSON from PMD report at {pmd_report_path}: {e}")
-        return False
     except Exception as e:
         print(f"ERROR: Unexpected error loading PMD report {pmd_report_path}: {e}")
+    return None
+
+
+def unwrap_graphson_value(value):
+    """Strips GraphSON type wrappers ({"@type": ..., "@value": ...}) from a value."""
+    while isinstance(value, dict) and "@value" in value:
+        value = value["@value"]
+    return value
+
+
+def get_vertex_property(properties, key):
+    """Returns the first value of a GraphSON vertex property, or None if it is missing."""
+    value = unwrap_graphson_value(properties.get(key))
+    if isinstance(value, list):
+        value = unwrap_graphson_value(value[0]) if value else None
+    return value
+
+
+def attach_pmd_violations(vertex, pmd_index, stats):
+    """Adds the matching PMD violations to a Joern FILE vertex in place."""
+    if not isinstance(vertex, dict):
+        print(f"Warning: Found a non-dictionary item in Joern vertices list. Skipping: {vertex}")
+        return
+
+    if vertex.get("label") != "FILE":
+        return
+
+    stats.joern_file_nodes_found += 1
+    properties = vertex.get("properties", {})
+    if not isinstance(properties, dict):
+        print(
+            f"Warning: FILE node (ID: {vertex.get('id', 'N/A')}) has 'properties' not as a dictionary. Skipping properties.")
+        return
+
+    joern_filepath_original = get_vertex_property(properties, "NAME")
+    if not isinstance(joern_filepath_original, str) or not joern_filepath_original:
+        vertex_id_repr = unwrap_graphson_value(vertex.get('id', 'N/A'))
+        print(
+            f"Warning: Joern FILE node (ID: {vertex_id_repr}) could not extract a valid original path string. "
+            f"NAME property: {properties.get('NAME')}")
+        return
+
+    if joern_filepath_original == "<unknown>":
+        return
+
+    entry = pmd_index.resolve(joern_filepath_original)
+    if entry is not None:
+        print(f"  MATCH FOUND: Joern (orig: '{joern_filepath_original}') <-> PMD file '{entry.filename}'.")
+        properties["pmd_violations"] = entry.violations
+        entry.matched = True
+        stats.joern_file_nodes_matched += 1
+
+
+def print_merge_summary(stats, pmd_index):
+    print(f"\n--- Merge Summary ---")
+    print(f"Total Joern FILE nodes found: {stats.joern_file_nodes_found}")
+    print(f"Joern FILE nodes matched with PMD data: {stats.joern_file_nodes_matched}")
+
+    print("\nPMD File Match Report:")
+    if not len(pmd_index):
+        print("  No files were processed from the PMD report.")
+    else:
+        unmatched_entries = pmd_index.unmatched()
+        for entry in unmatched_entries:
+            print(f"  - Unmatched PMD file: '{entry.filename}' (normalized: '{entry.normalized}')")
+            print(
+                f"    Reason: No corresponding Joern FILE node (after path transformation) matched this PMD path.")
+
+        if not unmatched_entries and pmd_index.file_count > 0:
+            print("  All files listed in PMD report were matched/accounted for in Joern FILE nodes!")
+        elif pmd_index.file_count == 0:
+            print("  No files in PMD report to match.")
+        else:
+            print(f"  Total {len(unmatched_entries)} PMD file path(s) could not be matched to a Joern FILE node.")
+
+
+def should_stream(joern_export_path, threshold_mb=DEFAULT_STREAM_THRESHOLD_MB):
+    try:
+        return os.path.getsize(joern_export_path) >= threshold_mb * 1024 * 1024
+    except OSError:
         return False
 
+
+def merge_reports(pmd_report_path, joern_export_path, merged_output_path, stream=None,
+                  stream_threshold_mb=DEFAULT_STREAM_THRESHOLD_MB, source_roots=DEFAULT_SOURCE_ROOTS,
+                  output_format=OUTPUT_FORMAT_GRAPHSON, pmd_index=None):
+    """Merges the PMD report into the Joern export.
+
+    With `stream=None` the streaming engine is used when the Joern export is at least `stream_threshold_mb` big.
+    A `pmd_index` built beforehand (see build_pmd_index) is used instead of loading `pmd_report_path`.
+    """
+    if stream is None:
+        stream = should_stream(joern_export_path, stream_threshold_mb)
+
+    if stream:
+        return merge_reports_streaming(pmd_report_path, joern_export_path, merged_output_path, source_roots,
+                                       output_format, pmd_index)
+    return merge_reports_in_memory(pmd_report_path, joern_export_path, merged_output_path, source_roots,
+                                   output_format, pmd_index)
+
+
+def merge_reports_in_memory(pmd_report_path, joern_export_path, merged_output_path,
+                            source_roots=DEFAULT_SOURCE_ROOTS, output_format=OUTPUT_FORMAT_GRAPHSON,
+                            pmd_index=None):
+    print(f"Starting merge process...")
+
+    if pmd_index is None:
+        pmd_index = build_pmd_index(pmd_report_path, source_roots)
+        if pmd_index is None:
+            return False
+
     print(f"Loading Joern GraphSON export from: {joern_export_path}")
     raw_joern_data = None
     try:
@@ -39,13 +286,7 @@ def merge_reports(pmd_report_path, joern_export_path, merged_output_path):
         return False
     except json.JSONDecodeError as e:
         print(f"ERROR: Could not decode JSON from Joern export at {joern_export_path}: {e}")
-        try:
-            with open(joern_export_path, 'r', encoding='utf-8') as f_err:
-                print(f"--- Start of Joern file content (first 500 chars) ---")
-                print(f_err.read(500))
-                print(f"--- End of Joern file content snippet ---")
-        except Exception as read_err:
-            print(f"Could not read Joern file for debugging: {read_err}")
+        print_joern_snippet(joern_export_path)
         return False
     except Exception as e:
         print(f"ERROR: Unexpected error loading Joern export {joern_export_path}: {e}")
@@ -81,138 +322,12 @@ def merge_reports(pmd_report_path, joern_export_path, merged_output_path):
         print(f"Keys found in processed Joern graph components: {list(joern_graph_components.keys())}")
         return False
 
-    pmd_violations_map = {}
-    pmd_file_count = 0
-    if "files" in pmd_data and isinstance(pmd_data.get("files"), list):
-        for file_report in pmd_data.get("files", []):
-            original_filename = file_report.get("filename")
-            if not original_filename:
-                print(f"Warning: PMD file report found without a 'filename' field. Skipping.")
-                continue
-
-            normalized_filename = normalize_path(original_filename)
-            violations = file_report.get("violations", [])
-
-            if normalized_filename not in pmd_violations_map:
-                pmd_violations_map[normalized_filename] = []
-            if isinstance(violations, list):
-                pmd_violations_map[normalized_filename].extend(violations)
-            else:
-                print(
-                    f"Warning: PMD violations for '{original_filename}' is not a list. Skipping violations for this file.")
-
-            pmd_file_count += 1
-        print(f"Processed {pmd_file_count} file entries from PMD report.")
-    else:
-        print("Warning: 'files' key not found or not a list in PMD report. No PMD violations to merge.")
-
     # --- Iterate Joern Graph Vertices and Merge ---
-    vertices = joern_graph_components["vertices"]
-    matched_pmd_files = set()
-    joern_file_nodes_found = 0
-    joern_file_nodes_matched = 0
-    processed_pmd_files_for_reporting = set(pmd_violations_map.keys())
-
-    for vertex in vertices:
-        if not isinstance(vertex, dict):
-            print(f"Warning: Found a non-dictionary item in Joern vertices list. Skipping: {vertex}")
-            continue
-
-        if vertex.get("label") == "FILE":
-            joern_file_nodes_found += 1
-            properties = vertex.get("properties", {})
-            if not isinstance(properties, dict):
-                print(
-                    f"Warning: FILE node (ID: {vertex.get('id', 'N/A')}) has 'properties' not as a dictionary. Skipping properties.")
-                continue
-
-            name_prop_wrapper = properties.get("NAME", {})
-            joern_filepath_original = None
-            if isinstance(name_prop_wrapper, dict) and \
-                    name_prop_wrapper.get("@type") == "g:VertexProperty" and \
-                    "@value" in name_prop_wrapper and \
-                    isinstance(name_prop_wrapper["@value"], dict) and \
-                    name_prop_wrapper["@value"].get("@type") == "g:List" and \
-                    "@value" in name_prop_wrapper["@value"] and \
-                    isinstance(name_prop_wrapper["@value"]["@value"], list) and \
-                    len(name_prop_wrapper["@value"]["@value"]) > 0 and \
-                    isinstance(name_prop_wrapper["@value"]["@value"][0], str):
-                joern_filepath_original = name_prop_wrapper["@value"]["@value"][0]
-
-            if joern_filepath_original:
-                joern_path_for_matching = joern_filepath_original
-
-                if joern_path_for_matching == "<unknown>":
-                    continue
-
-                if ".class" in joern_path_for_matching:
-                    if "/tmp/" in joern_path_for_matching and "jimple2cpg" in joern_path_for_matching:
-                        # Try to find the start of the package structure (e.g., "org/", "com/")
-                        package_start_index = -1
-                        for pkg_root in ["org/", "com/", "net/", "io/"]:  # Add other common roots
-                            idx = joern_path_for_matching.rfind(pkg_root)
-                            if idx != -1:
-                                # Check if this is not part of a longer word like "sourceforge"
-                                if idx == 0 or joern_path_for_matching[idx - 1] == '/':
-                                    package_start_index = idx
-                                    break
-                        if package_start_index != -1:
-                            relative_path = joern_path_for_matching[package_start_index:]
-                            # PMD reports paths relative to /sources (which is project root)
-                            # Assuming standard Maven structure src/main/java
-                            pmd_like_base = "/sources/src/main/java/"
-                            # todo required configuration
-                            joern_path_for_matching = pmd_like_base + relative_path
-                        else:
-                            print(
-                                f"DEBUG: Could not determine relative path for Joern .class file: {joern_filepath_original}")
-
-                    joern_path_for_matching = joern_path_for_matching.replace(".class", ".java")
-
-                joern_filepath_normalized = normalize_path(joern_path_for_matching)
-
-                if joern_filepath_normalized in pmd_violations_map:
-                    print(
-                        f"  MATCH FOUND: Joern (orig: '{joern_filepath_original}', match_as: '{joern_path_for_matching}') "
-                        f"<-> PMD file.")
-                    vertex["properties"]["pmd_violations"] = pmd_violations_map[joern_filepath_normalized]
-                    matched_pmd_files.add(joern_filepath_normalized)
-                    joern_file_nodes_matched += 1
-            else:
-                vertex_id_repr = vertex.get('id', 'N/A')
-                if isinstance(vertex_id_repr, dict):
-                    vertex_id_repr = vertex_id_repr.get('@value', 'N/A_dict')
-                print(
-                    f"Warning: Joern FILE node (ID: {vertex_id_repr}) could not extract a valid original path string. NAME property: {name_prop_wrapper}")
-
-    print(f"\n--- Merge Summary ---")
-    print(f"Total Joern FILE nodes found: {joern_file_nodes_found}")
-    print(f"Joern FILE nodes matched with PMD data: {joern_file_nodes_matched}")
+    stats = MergeStats()
+    for vertex in joern_graph_components["vertices"]:
+        attach_pmd_violations(vertex, pmd_index, stats)
 
-    unmatched_pmd_files_count = 0
-    print("\nPMD File Match Report:")
-    if not processed_pmd_files_for_reporting:
-        print("  No files were processed from the PMD report.")
-    else:
-        for pmd_filename_normalized in processed_pmd_files_for_reporting:
-            if pmd_filename_normalized not in matched_pmd_files:
-                unmatched_pmd_files_count += 1
-                original_unmatched_path = "Unknown (normalized only)"
-                if "files" in pmd_data and isinstance(pmd_data.get("files"), list):
-                    for file_report in pmd_data.get("files", []):
-                        if normalize_path(file_report.get("filename")) == pmd_filename_normalized:
-                            original_unmatched_path = file_report.get("filename")
-                            break
-                print(f"  - Unmatched PMD file: '{original_unmatched_path}' (normalized: '{pmd_filename_normalized}')")
-                print(
-                    f"    Reason: No corresponding Joern FILE node (after path transformation) matched this PMD path.")
-
-        if unmatched_pmd_files_count == 0 and pmd_file_count > 0:
-            print("  All files listed in PMD report were matched/accounted for in Joern FILE nodes!")
-        elif pmd_file_count == 0:
-            print("  No files in PMD report to match.")
-        else:
-            print(f"  Total {unmatched_pmd_files_count} PMD file path(s) could not be matched to a Joern FILE node.")
+    print_merge_summary(stats, pmd_index)
 
     # --- Save Merged Graph ---
     data_to_save = None
@@ -232,8 +347,11 @@ def merge_reports(pmd_report_path, joern_export_path, merged_output_path):
         output_dir = os.path.dirname(merged_output_path)
         if output_dir:
             os.makedirs(output_dir, exist_ok=True)
-        with open(merged_output_path, 'w', encoding='utf-8') as f:
-            json.dump(data_to_save, f, indent=2)
+        if output_format == OUTPUT_FORMAT_COMPACT:
+            graph_codec.write_compact(data_to_save, merged_output_path)
+        else:
+            with open(merged_output_path, 'w', encoding='utf-8') as f:
+                json.dump(data_to_save, f, indent=2)
         print(f"\nSuccessfully merged data saved to: {merged_output_path}")
         return True
     except IOError as e:
@@ -244,14 +362,199 @@ def merge_reports(pmd_report_path, joern_export_path, merged_output_path):
         return False
 
 
+def print_joern_snippet(joern_export_path):
+    try:
+        with open(joern_export_path, 'r', encoding='utf-8') as f_err:
+            print(f"--- Start of Joern file content (first 500 chars) ---")
+            print(f_err.read(500))
+            print(f"--- End of Joern file content snippet ---")
+    except Exception as read_err:
+        print(f"Could not read Joern file for debugging: {read_err}")
+
+
+class GraphSONStreamWriter:
+    """Writes merged GraphSON text while the export is being read.
+
+    Has the same interface as graph_codec.CompactGraphWriter, so the streaming engine can emit either format.
+    """
+
+    def __init__(self, f):
+        self._write = f.write
+        # One flag per open container: whether a member has already been written into it
+        self._has_members = []
+
+    def _member(self):
+        if self._has_members[-1]:
+            self._write(",")
+        self._has_members[-1] = True
+
+    def begin_object(self):
+        self._write("{")
+        self._has_members.append(False)
+
+    def end_object(self):
+        self._has_members.pop()
+        self._write("}")
+
+    def key(self, key):
+        self._member()
+        self._write(json.dumps(key) + ":")
+
+    def value(self, value):
+        self._write(json.dumps(value, separators=(",", ":")))
+
+    def begin_records(self):
+        self._write("[")
+        self._has_members.append(False)
+
+    def record(self, value):
+        self._member()
+        self._write(json.dumps(value, separators=(",", ":")))
+
+    def end_records(self):
+        self._has_members.pop()
+        self._write("]")
+
+    def copy_value(self, reader):
+        reader.copy_value(self._write)
+
+    def copy_records(self, reader):
+        reader.copy_value(self._write)
+
+    def close(self):
+        pass
+
+
+def _create_stream_writer(f_out, output_format):
+    if output_format == OUTPUT_FORMAT_COMPACT:
+        return graph_codec.CompactGraphWriter(f_out)
+    return GraphSONStreamWriter(f_out)
+
+
+def _stream_object(reader, writer, on_vertex, in_graph):
+    """Copies a JSON object, descending into the graph wrapper and streaming its 'vertices' array.
+
+    Returns True if a 'vertices' array was streamed.
+    """
+    reader.expect("{")
+    writer.begin_object()
+    vertices_found = False
+    first = True
+    while reader.peek() != "}":
+        if not first:
+            reader.expect(",")
+        key = reader.read_value()
+        if not isinstance(key, str):
+            raise ValueError(f"Expected an object key in JSON stream but found {key!r}")
+        reader.expect(":")
+        writer.key(key)
+
+        if in_graph and key == "vertices" and reader.peek() == "[":
+            writer.begin_records()
+            for vertex in reader.iter_array():
+                on_vertex(vertex)
+                writer.record(vertex)
+            writer.end_records()
+            vertices_found = True
+        elif in_graph and key in graph_codec.RECORD_ARRAYS and reader.peek() == "[":
+            writer.copy_records(reader)
+        elif not in_graph and key in ("@value", "graph") and reader.peek() == "{":
+            print(f"INFO: Streaming graph components from top-level '{key}' key.")
+            vertices_found = _stream_object(reader, writer, on_vertex, in_graph=True) or vertices_found
+        else:
+            writer.copy_value(reader)
+        first = False
+    reader.expect("}")
+    writer.end_object()
+    return vertices_found
+
+
+def merge_reports_streaming(pmd_report_path, joern_export_path, merged_output_path,
+                            source_roots=DEFAULT_SOURCE_ROOTS, output_format=OUTPUT_FORMAT_GRAPHSON,
+                            pmd_index=None):
+    """Merges without loading the Joern export: vertices are parsed and written one at a time."""
+    print(f"Starting streaming merge process...")
+
+    if pmd_index is None:
+        pmd_index = build_pmd_index(pmd_report_path, source_roots)
+        if pmd_index is None:
+            return False
+
+    stats = MergeStats()
+
+    output_dir = os.path.dirname(merged_output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    partial_output_path = merged_output_path + ".part"
+
+    print(f"Streaming Joern GraphSON export from: {joern_export_path}")
+    try:
+        output_mode = 'wb' if output_format == OUTPUT_FORMAT_COMPACT else 'w'
+        output_encoding = None if output_format == OUTPUT_FORMAT_COMPACT else 'utf-8'
+        with open(joern_export_path, 'r', encoding='utf-8') as f_in, \
+                open(partial_output_path, output_mode, encoding=output_encoding,
+                     buffering=DEFAULT_STREAM_CHUNK_SIZE) as f_out:
+            reader = JsonStreamReader(f_in)
+            if reader.peek() != "{":
+                print(f"ERROR: Joern data from {joern_export_path} is not in a recognized GraphSON format.")
+                vertices_found = False
+            else:
+                writer = _create_stream_writer(f_out, output_format)
+                vertices_found = _stream_object(
+                    reader, writer,
+                    lambda vertex: attach_pmd_violations(vertex, pmd_index, stats),
+                    in_graph=False)
+                writer.close()
+                if vertices_found and reader.peek() != "":
+                    raise ValueError("Unexpected data after the end of the JSON document")
+    except FileNotFoundError:
+        print(f"ERROR: Joern export file not found at {joern_export_path}")
+        vertices_found = False
+    except (ValueError, json.JSONDecodeError) as e:
+        print(f"ERROR: Could not decode JSON from Joern export at {joern_export_path}: {e}")
+        print_joern_snippet(joern_export_path)
+        vertices_found = False
+    except IOError as e:
+        print(f"ERROR: Could not write merged data to {merged_output_path}: {e}")
+        vertices_found = False
+
+    if not vertices_found:
+        if os.path.exists(partial_output_path):
+            os.remove(partial_output_path)
+        print("ERROR: Joern graph data is missing 'vertices' list or it could not be streamed.")
+        return False
+
+    print_merge_summary(stats, pmd_index)
+
+    os.replace(partial_output_path, merged_output_path)
+    print(f"\nSuccessfully merged data saved to: {merged_output_path}")
+    return True
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Merge PMD JSON report into Joern GraphSON.")
     parser.add_argument("--pmd-input", required=True, help="Path to the PMD JSON report file.")
     parser.add_argument("--joern-input", required=True, help="Path to the Joern GraphSON export file.")
     parser.add_argument("--output", required=True, help="Path for the merged GraphSON output file.")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default=OUTPUT_FORMAT_GRAPHSON,
+                        help="'graphson' writes JSON, 'compact' writes the smaller CPGZ format of graph_codec.py "
+                             f"(default: {OUTPUT_FORMAT_GRAPHSON}).")
+    stream_group = parser.add_mutually_exclusive_group()
+    stream_group.add_argument("--stream", dest="stream", action="store_true", default=None,
+                              help="Always use the streaming merge engine (bounded memory).")
+    stream_group.add_argument("--no-stream", dest="stream", action="store_false",
+                              help="Always load the whole Joern export into memory.")
+    parser.add_argument("--source-root", dest="source_roots", action="append",
+                        help=f"Source root (as seen in PMD report paths) that Java package paths are relative to. "
+                             f"Can be given multiple times (default: {', '.join(DEFAULT_SOURCE_ROOTS)}).")
+    parser.add_argument("--stream-threshold-mb", type=int, default=DEFAULT_STREAM_THRESHOLD_MB,
+                        help=f"Joern export size from which streaming is used by default "
+                             f"(default: {DEFAULT_STREAM_THRESHOLD_MB}).")
     args = parser.parse_args()
 
-    if merge_reports(args.pmd_input, args.joern_input, args.output):
+    if merge_reports(args.pmd_input, args.joern_input, args.output,
+                     stream=args.stream, stream_threshold_mb=args.stream_threshold_mb,
+                     source_roots=args.source_roots or DEFAULT_SOURCE_ROOTS, output_format=args.output_format):
         print("Merge script finished successfully.")
         sys.exit(0)
     else:
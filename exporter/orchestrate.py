@@ -2,16 +2,28 @@ import os
 import sys
 import subprocess
 import argparse
+import importlib.util
 import time
 import requests
 
+import chunked_upload
+import graph_codec
+from analysis_cache import AnalysisCache, collect_tool_versions
+from pipeline import (STATUS_SKIPPED, ChildProcess, ContainerMemorySampler, PipelineScheduler, Stage, StageOutcome,
+                      run_measured_command)
+
 DEFAULT_EXPORT_BASE_DIR = "./export"
 DEFAULT_PMD_REPORT_REL = "lint/pmd_report.json"
 DEFAULT_JOERN_EXPORT_REL = "cpg_all/export.json"
 DEFAULT_MERGED_OUTPUT_REL = "merged_graph.json"
+DEFAULT_MERGED_COMPACT_OUTPUT_REL = "merged_graph" + graph_codec.FILE_EXTENSION
 DEFAULT_MERGE_SCRIPT = "./merge_tool.py"
 DEFAULT_TARGET_URL = "http://localhost:5001/api/upload-graph"
 DEFAULT_COMPOSE_FILE = "./docker-compose.yml"
+DEFAULT_RUN_REPORT_NAME = "run_report.json"
+DEFAULT_JOERN_TIMEOUT = 3600
+DEFAULT_LINT_TIMEOUT = 1800
+DEFAULT_MERGE_TIMEOUT = 3600
 
 
 def run_command(command_list, cwd=None, check=True, capture=True, env=None, stream_output=False):
@@ -75,6 +87,23 @@ def verify_step(success, step_name, repair_func=None, repair_args=None, exit_on_
     return False
 
 
+def print_workflow_summary(summary):
+    """Prints (step, result) pairs and appends them to the GitHub Actions job summary when running in CI."""
+    print("\n--- Workflow Summary ---")
+    for step_name, result in summary:
+        print(f"  {step_name}: {result}")
+
+    github_summary_path = os.environ.get("GITHUB_STEP_SUMMARY")
+    if github_summary_path:
+        try:
+            with open(github_summary_path, "a", encoding="utf-8") as f:
+                f.write("### Analysis Workflow\n\n| Step | Result |\n| --- | --- |\n")
+                for step_name, result in summary:
+                    f.write(f"| {step_name} | {result} |\n")
+        except IOError as e:
+            print(f"Warning: Could not write GitHub step summary to {github_summary_path}: {e}")
+
+
 class MockReceiverManager:
     def __init__(self, compose_file_name, script_dir):
         self.compose_file_name = compose_file_name
@@ -126,66 +155,144 @@ DEFAULT_EXPORT_BASE_DIR = "./export"
 DEFAULT_COMPOSE_FILE = "./docker-compose.yml"
 
 
-def run_analysis_containers(compose_file_name, script_dir, pmd_report_path, joern_export_path, export_base_dir):
-    """Runs Joern and Linters using Docker Compose. Assumes CWD is script_dir."""
-    print("\n--- Running Joern and Linter services ---")
+def analysis_container_name(service):
+    return f"exporter-{service}-{os.getpid()}"
+
+
+def run_analysis_container(service, compose_file_name, script_dir, expected_output_path, timeout=None):
+    """Runs one analysis service (joern or lint) in its own container, so it has its own exit status.
+
+    Peak RSS is sampled from the container via `docker stats`; if no sample could be taken,
+    the RSS of the docker-compose client is reported instead.
+    """
+    print(f"\n--- Running '{service}' service ---")
+    container_name = analysis_container_name(service)
     command = [
-        "docker-compose", "-f", compose_file_name, "up",
-        "--build",
-        "--abort-on-container-exit",
-        "--exit-code-from", "lint",
-        "joern", "lint"
+        "docker-compose", "-f", compose_file_name, "run",
+        "--rm",
+        "--no-deps",
+        "--name", container_name,
+        service
     ]
-    success, process = run_command(command, check=False, capture=False, stream_output=True, cwd=script_dir)
-    if not success and process is None:
-        print("ERROR: Failed to execute docker-compose command (e.g., not found).")
-        return False
+    with ContainerMemorySampler(container_name) as sampler:
+        exit_code, client_rss_kb = run_measured_command(command, cwd=script_dir, timeout=timeout)
+
+    if sampler.peak_kb is not None:
+        peak_rss_kb, rss_source = sampler.peak_kb, "container (docker stats)"
+    else:
+        peak_rss_kb, rss_source = client_rss_kb, "docker-compose client"
 
-    exit_code = process.returncode if hasattr(process, 'returncode') else 1
+    if exit_code is None:
+        print(f"ERROR: Docker Compose (for {service}) could not be run or was killed.")
+        return StageOutcome(False, None, peak_rss_kb, rss_source, "docker-compose failed to run or was killed")
     if exit_code != 0:
-        print(f"ERROR: Docker Compose (for joern/lint) exited with non-zero status code: {exit_code}")
-        return False
+        print(f"ERROR: Docker Compose (for {service}) exited with non-zero status code: {exit_code}")
+        return StageOutcome(False, exit_code, peak_rss_kb, rss_source, "container exited with an error")
 
-    if not os.path.exists(pmd_report_path) or os.path.getsize(pmd_report_path) == 0:
-        print(f"ERROR: Expected PMD report file not found or is empty after docker-compose run: {pmd_report_path}")
-        return False
-    if not os.path.exists(joern_export_path) or os.path.getsize(joern_export_path) == 0:
-        print(f"ERROR: Expected Joern export file not found or is empty after docker-compose run: {joern_export_path}")
-        return False
-    return True
+    if not os.path.exists(expected_output_path) or os.path.getsize(expected_output_path) == 0:
+        print(f"ERROR: Expected {service} output not found or is empty after docker-compose run: {expected_output_path}")
+        return StageOutcome(False, exit_code, peak_rss_kb, rss_source, "output file missing or empty")
+    return StageOutcome(True, exit_code, peak_rss_kb, rss_source)
 
 
-def run_merge_script(script_path, pmd_input, joern_input, output_path):
-    command = [
-        sys.executable,
-        script_path,
-        "--pmd-input", pmd_input,
-        "--joern-input", joern_input,
-        "--output", output_path
-    ]
-    success, _ = run_command(command)
+def build_analysis_images(services, compose_file_name, script_dir):
+    """Rebuilds the images of the analysis services, so edits to their Dockerfiles take effect.
+    `docker-compose run` only builds an image that does not exist yet."""
+    print(f"\n--- Building images for {', '.join(services)} ---")
+    exit_code, peak_rss_kb = run_measured_command(
+        ["docker-compose", "-f", compose_file_name, "build"] + list(services), cwd=script_dir)
+    if exit_code != 0:
+        print(f"ERROR: Docker Compose build exited with status code: {exit_code}")
+        return StageOutcome(False, exit_code, peak_rss_kb, "docker-compose client", "image build failed")
+    return StageOutcome(True, exit_code, peak_rss_kb, "docker-compose client")
+
+
+def stop_analysis_container(service):
+    container_name = analysis_container_name(service)
+    print(f"Removing container '{container_name}'...")
+    run_command(["docker", "rm", "-f", container_name], check=False)
+
+
+def load_merge_module(script_path):
+    """Imports merge_tool.py from `script_path`, so the merge can reuse the PMD index built in this process."""
+    script_dir = os.path.dirname(os.path.abspath(script_path))
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
+    spec = importlib.util.spec_from_file_location("merge_tool", script_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_merge(merge_module, pmd_index, pmd_input, joern_input, output_path, output_format="graphson"):
+    success = merge_module.merge_reports(pmd_input, joern_input, output_path,
+                                         output_format=output_format, pmd_index=pmd_index)
     if success and (not os.path.exists(output_path) or os.path.getsize(output_path) == 0):
-        print(f"ERROR: Merge script reported success, but output file not found or is empty: {output_path}")
+        print(f"ERROR: Merge reported success, but output file not found or is empty: {output_path}")
         return False
     return success
 
 
-def send_data(file_path, target_url):
+def iter_file_blocks(file_path, block_size=1024 * 1024):
+    with open(file_path, 'rb') as f:
+        yield from iter(lambda: f.read(block_size), b'')
+
+
+def send_data_single_request(file_path, target_url, encoding=chunked_upload.ENCODING_GZIP):
+    """Streams the whole file, compressed with `encoding`, in one request; used for receivers without
+    the chunked upload endpoints.
+
+    Those receivers (e.g. the analyzer's /project/graph) only read GraphSON, so a CPGZ file is
+    converted to GraphSON on the fly.
+    """
+    encoding = chunked_upload.resolve_encoding(encoding)
+    if graph_codec.is_compact_file(file_path):
+        print("Converting the CPGZ file to GraphSON for the single request.")
+        blocks = graph_codec.iter_graphson(file_path)
+    else:
+        blocks = iter_file_blocks(file_path)
+    headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+    if encoding != chunked_upload.ENCODING_IDENTITY:
+        headers['Content-Encoding'] = encoding
+    timeout_seconds = 120
+    try:
+        response = requests.post(target_url, data=chunked_upload.iter_compressed(blocks, encoding), headers=headers,
+                                 timeout=timeout_seconds)
+        response.raise_for_status()
+        return response
+    except requests.exceptions.Timeout:
+        print(f"ERROR: Request timed out after {timeout_seconds} seconds.")
+    return None
+
+
+def send_data(file_path, target_url, chunked=True, encoding=chunked_upload.ENCODING_GZIP,
+              part_size=chunked_upload.DEFAULT_PART_SIZE, workers=chunked_upload.DEFAULT_WORKERS):
     print(f"\nSending file '{file_path}' to {target_url}...")
     if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
         print(f"ERROR: File to send not found or is empty: {file_path}")
         return False
-    headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
-    timeout_seconds = 120
+    content_type = graph_codec.CONTENT_TYPE if graph_codec.is_compact_file(file_path) else 'application/json'
     try:
-        with open(file_path, 'rb') as f:
-            response = requests.post(target_url, data=f, headers=headers, timeout=timeout_seconds)
-        response.raise_for_status()
+        if chunked:
+            try:
+                with chunked_upload.ChunkedUploader(target_url, workers=workers, part_size=part_size,
+                                                    encoding=encoding) as uploader:
+                    result = uploader.upload(file_path, content_type)
+                print("Data sent successfully.")
+                print("Server response:", result)
+                return True
+            except chunked_upload.ChunkedUploadsUnsupported:
+                print("Receiver does not support chunked uploads. Falling back to a single request.")
+
+        response = send_data_single_request(file_path, target_url, encoding)
+        if response is None:
+            return False
         print(f"Data sent successfully. Status: {response.status_code}")
         print("Server response:", response.json())
         return True
-    except requests.exceptions.Timeout:
-        print(f"ERROR: Request timed out after {timeout_seconds} seconds.")
+    except chunked_upload.UploadError as e:
+        print(f"ERROR: Chunked upload failed: {e}")
+        print("Progress is kept; re-running the upload resumes with the missing parts.")
     except requests.exceptions.ConnectionError as e:
         print(f"ERROR: Could not connect to the server at {target_url}. Is it running? Details: {e}")
     except requests.exceptions.RequestException as e:
@@ -215,13 +322,35 @@ if __name__ == "__main__":
                         help=f"Relative path to Joern GraphSON export within export-dir (default: {DEFAULT_JOERN_EXPORT_REL}).")
     parser.add_argument("--merged-output",
                         help=f"Relative path for the merged output file within export-dir (default: {DEFAULT_MERGED_OUTPUT_REL}).")
+    parser.add_argument("--output-format", choices=["graphson", "compact"], default="graphson",
+                        help="Format of the merged output: GraphSON JSON or the compact CPGZ format (default: graphson).")
     parser.add_argument("--merge-script", default=os.path.join(script_dir, DEFAULT_MERGE_SCRIPT),
                         help="Path to the merge_tool.py script.")
     parser.add_argument("--target-url", default=DEFAULT_TARGET_URL, help="URL to send the merged results to.")
+    parser.add_argument("--upload-compression", choices=chunked_upload.ENCODINGS, default=chunked_upload.ENCODING_GZIP,
+                        help="Compression applied on the fly during the chunked upload (default: gzip).")
+    parser.add_argument("--upload-part-size-mb", type=int, default=chunked_upload.DEFAULT_PART_SIZE // (1024 * 1024),
+                        help="Size of each uploaded part in MB (default: %(default)s).")
+    parser.add_argument("--upload-workers", type=int, default=chunked_upload.DEFAULT_WORKERS,
+                        help="Number of parts uploaded in parallel (default: %(default)s).")
+    parser.add_argument("--single-request-upload", action="store_true",
+                        help="Upload the merged output in one streamed POST, compressed with --upload-compression, "
+                             "instead of in parts. A CPGZ file is sent as GraphSON.")
     parser.add_argument("--skip-docker", action="store_true", help="Skip the docker-compose step for joern/lint.")
     parser.add_argument("--skip-upload", action="store_true", help="Skip the final upload step.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always run Joern/PMD and the merge, ignoring the analysis cache in export-dir.")
     parser.add_argument("--compose-file", default=os.path.join(script_dir, DEFAULT_COMPOSE_FILE),
                         help="Path to the docker-compose file.")
+    parser.add_argument("--joern-timeout", type=int, default=DEFAULT_JOERN_TIMEOUT,
+                        help=f"Seconds before the Joern container is killed (default: {DEFAULT_JOERN_TIMEOUT}).")
+    parser.add_argument("--lint-timeout", type=int, default=DEFAULT_LINT_TIMEOUT,
+                        help=f"Seconds before the PMD container is killed (default: {DEFAULT_LINT_TIMEOUT}).")
+    parser.add_argument("--merge-timeout", type=int, default=DEFAULT_MERGE_TIMEOUT,
+                        help=f"Seconds before the merge process is killed (default: {DEFAULT_MERGE_TIMEOUT}).")
+    parser.add_argument("--run-report",
+                        help=f"Path of the JSON run report with per-stage timing "
+                             f"(default: {DEFAULT_RUN_REPORT_NAME} next to export-dir).")
     parser.add_argument("--java-project-dir", default=os.path.abspath(os.path.join(script_dir, "..", "project")),
                         help="Path to the Java project directory to be analyzed.")
     args = parser.parse_args()
@@ -229,7 +358,11 @@ if __name__ == "__main__":
     export_base_dir = os.path.abspath(args.export_dir)
     pmd_report_path = os.path.join(export_base_dir, args.pmd_report or DEFAULT_PMD_REPORT_REL)
     joern_export_path = os.path.join(export_base_dir, args.joern_export or DEFAULT_JOERN_EXPORT_REL)
-    merged_output_path = os.path.join(export_base_dir, args.merged_output or DEFAULT_MERGED_OUTPUT_REL)
+    default_merged_output_rel = \
+        DEFAULT_MERGED_COMPACT_OUTPUT_REL if args.output_format == "compact" else DEFAULT_MERGED_OUTPUT_REL
+    merged_output_path = os.path.join(export_base_dir, args.merged_output or default_merged_output_rel)
+    run_report_path = os.path.abspath(args.run_report) if args.run_report else \
+        os.path.join(os.path.dirname(export_base_dir), DEFAULT_RUN_REPORT_NAME)
 
     print("--- Starting Analysis Workflow ---")
     print(f"Script Directory: {script_dir}")
@@ -246,6 +379,13 @@ if __name__ == "__main__":
     print("Ensured local export directories exist.")
 
 
+    workflow_summary = []
+    artifact_paths = {
+        "pmd_report": pmd_report_path,
+        "joern_export": joern_export_path,
+        "merged_graph": merged_output_path,
+    }
+
     def perform_core_workflow():
         original_cwd = os.getcwd()
         if original_cwd != script_dir:
@@ -253,41 +393,118 @@ if __name__ == "__main__":
             print(f"Changed CWD to: {script_dir} for docker-compose context.")
 
         try:
-            # Step 1: Run Docker Compose Analysis (joern & lint)
-            if not args.skip_docker:
-                docker_success = run_analysis_containers(
-                    os.path.basename(args.compose_file),
-                    script_dir,
-                    pmd_report_path,
-                    joern_export_path,
-                    export_base_dir
+            # Step 0: Look up the analysis cache (only meaningful when the reports are produced from the project)
+            cache = None
+            cache_lookup = None
+            if not args.skip_docker and not args.no_cache:
+                cache = AnalysisCache(
+                    export_base_dir,
+                    args.java_project_dir,
+                    collect_tool_versions(args.compose_file, args.merge_script, args.output_format)
                 )
-                verify_step(docker_success, "Docker Compose Analysis (Joern/Lint)",
-                            repair_func=attempt_joern_repair,
-                            repair_args={'export_dir': export_base_dir})
+                cache_lookup = cache.lookup(artifact_paths)
+                print(f"Analysis cache: {cache_lookup.describe()}")
+                cache.record_changes(cache_lookup)
+                workflow_summary.append(("Analysis cache", cache_lookup.describe()))
+            else:
+                workflow_summary.append(("Analysis cache", "disabled"))
+
+            stages = []
+            shared = {}
+            cache_hit = cache_lookup is not None and cache_lookup.is_hit
+            if cache_hit:
+                print("--- Project unchanged: reusing cached PMD report, Joern export and merged graph. ---")
+                workflow_summary.append(("Analysis (Joern/Lint) and Merge", "skipped (cache hit)"))
             else:
-                print("--- Skipping Docker Compose (Joern/Lint) step as requested. ---")
-                if not os.path.exists(pmd_report_path) or os.path.getsize(pmd_report_path) == 0:
-                    print(f"ERROR: --skip-docker specified, but PMD report not found or empty at {pmd_report_path}")
-                    sys.exit(1)
-                if not os.path.exists(joern_export_path) or os.path.getsize(joern_export_path) == 0:
-                    print(f"ERROR: --skip-docker specified, but Joern export not found or empty at {joern_export_path}")
-                    sys.exit(1)
-
-            # Step 2: Run Merge Script
-            merge_success = run_merge_script(
-                args.merge_script,
-                pmd_report_path,
-                joern_export_path,
-                merged_output_path
-            )
-            verify_step(merge_success, "Merge Reports")
-
-            # Step 3: Send Data (only if not skipped and if receiver is managed)
-            # The actual call to send_data will happen here if the 'with' block for receiver is active
+                if cache is not None:
+                    cache.invalidate()
+
+                # Step 1: Joern and PMD run as independent containers in parallel
+                analysis_stages = []
+                if not args.skip_docker:
+                    compose_file_name = os.path.basename(args.compose_file)
+                    stages.append(Stage("build_images",
+                                        lambda: build_analysis_images(("joern", "lint"), compose_file_name,
+                                                                      script_dir)))
+                    for service, expected_output, timeout in (("joern", joern_export_path, args.joern_timeout),
+                                                              ("lint", pmd_report_path, args.lint_timeout)):
+                        stages.append(Stage(
+                            service,
+                            lambda service=service, expected_output=expected_output, timeout=timeout:
+                                run_analysis_container(service, compose_file_name, script_dir, expected_output,
+                                                       timeout),
+                            depends_on=["build_images"],
+                            timeout=timeout,
+                            on_timeout=lambda service=service: stop_analysis_container(service)
+                        ))
+                    analysis_stages = ["joern", "lint"]
+                else:
+                    print("--- Skipping Docker Compose (Joern/Lint) step as requested. ---")
+                    if not os.path.exists(pmd_report_path) or os.path.getsize(pmd_report_path) == 0:
+                        print(f"ERROR: --skip-docker specified, but PMD report not found or empty at {pmd_report_path}")
+                        sys.exit(1)
+                    if not os.path.exists(joern_export_path) or os.path.getsize(joern_export_path) == 0:
+                        print(f"ERROR: --skip-docker specified, but Joern export not found or empty at {joern_export_path}")
+                        sys.exit(1)
+                    workflow_summary.append(("Docker Compose Analysis (Joern/Lint)", "skipped (--skip-docker)"))
+
+                # Step 2: Index the PMD report as soon as it exists, while Joern may still be running
+                merge_module = load_merge_module(args.merge_script)
+
+                def build_index():
+                    shared["pmd_index"] = merge_module.build_pmd_index(pmd_report_path)
+                    return shared["pmd_index"] is not None
+
+                stages.append(Stage("pmd_index", build_index,
+                                    depends_on=["lint"] if "lint" in analysis_stages else []))
+
+                # Step 3: Merge once both inputs are ready, in a child process that is killed on timeout
+                merge_process = ChildProcess("merge")
+                stages.append(Stage(
+                    "merge",
+                    lambda: merge_process.run(
+                        lambda: run_merge(merge_module, shared["pmd_index"], pmd_report_path, joern_export_path,
+                                          merged_output_path, args.output_format)),
+                    depends_on=["pmd_index"] + (["joern"] if "joern" in analysis_stages else []),
+                    timeout=args.merge_timeout,
+                    on_timeout=merge_process.kill
+                ))
+
+            # Step 4: Send Data (only if not skipped and if receiver is managed)
             if not args.skip_upload:
-                upload_success = send_data(merged_output_path, args.target_url)
-                verify_step(upload_success, "Send Data")
+                stages.append(Stage("upload",
+                                    lambda: send_data(merged_output_path, args.target_url,
+                                                      chunked=not args.single_request_upload,
+                                                      encoding=args.upload_compression,
+                                                      part_size=args.upload_part_size_mb * 1024 * 1024,
+                                                      workers=args.upload_workers),
+                                    depends_on=[] if cache_hit else ["merge"]))
+
+            scheduler = PipelineScheduler(stages)
+            results = scheduler.run()
+            for name, result in results.items():
+                workflow_summary.append((f"Stage '{name}'", result.describe()))
+
+            if cache is not None and not cache_hit and results["merge"].succeeded:
+                cache.store(artifact_paths)
+
+            scheduler.write_report(run_report_path, extra={
+                "analysis_cache": cache_lookup.describe() if cache_lookup is not None else "disabled",
+                "export_dir": export_base_dir,
+                "output_format": args.output_format,
+            })
+
+            if not scheduler.all_succeeded():
+                for name, result in results.items():
+                    if result.succeeded or result.status == STATUS_SKIPPED:
+                        continue
+                    repair_func, repair_args = None, None
+                    if name == "joern":
+                        repair_func, repair_args = attempt_joern_repair, {'export_dir': export_base_dir}
+                    verify_step(False, f"Stage '{name}'", repair_func=repair_func, repair_args=repair_args,
+                                exit_on_fail=False)
+                print_workflow_summary(workflow_summary)
+                sys.exit(1)
 
         finally:
             if original_cwd != script_dir and os.getcwd() == script_dir:
@@ -303,4 +520,5 @@ if __name__ == "__main__":
         print("--- Skipping Upload, mock_receiver will not be started. ---")
         perform_core_workflow()
 
+    print_workflow_summary(workflow_summary)
     print("\n--- Workflow Completed Successfully ---")
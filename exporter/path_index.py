@@ -0,0 +1,169 @@
+import os
+
+# PMD reports paths as seen inside the lint container, where the Java project is mounted at /sources
+DEFAULT_SOURCE_ROOTS = ("/sources/src/main/java", "/sources/src/test/java")
+# Maven/Gradle source directories, recognized in Joern paths wherever the project is mounted
+SOURCE_DIRS = ("src/main/java", "src/test/java")
+
+
+def normalize_path(path_str):
+    """Normalize file paths to use forward slashes and OS-normalized separators."""
+    if path_str is None:
+        return None
+    path_str = path_str.replace("\\", "/")
+    return os.path.normpath(path_str)
+
+
+def to_source_path(path_str):
+    """Maps a compiled class path (e.g. jimple2cpg output) onto the path of its Java source file."""
+    if not path_str.endswith(".class"):
+        return path_str
+    directory, class_file = os.path.split(path_str)
+    # Inner and anonymous classes (Outer$Inner.class) live in the outer class's source file
+    class_name = class_file[:-len(".class")].split("$", 1)[0]
+    return os.path.join(directory, class_name + ".java") if directory else class_name + ".java"
+
+
+class PmdFileEntry:
+    __slots__ = ("filename", "normalized", "relative", "violations", "matched")
+
+    def __init__(self, filename, normalized, relative):
+        self.filename = filename
+        self.normalized = normalized
+        self.relative = relative
+        self.violations = []
+        self.matched = False
+
+
+class _TrieNode:
+    __slots__ = ("children", "entry", "count")
+
+    def __init__(self):
+        self.children = {}
+        self.entry = None
+        # Entries at this node and below it
+        self.count = 0
+
+
+class PmdPathIndex:
+    """Resolves Joern file paths to PMD report entries.
+
+    Entries are indexed by their normalized path and, when they live under one of the source roots,
+    by their package-relative path in a trie of reversed path components.
+
+    A Joern path below a source root or a known source directory (src/main/java, ...) matches only
+    the entry with the same package-relative path. Otherwise the package root is unknown (e.g. inside
+    a jimple2cpg temp directory): its components are walked from the file name upwards, which is
+    linear in path length, and the longest match wins unless other entries share it as their suffix.
+    So `com/a/Runner.java` is never taken for the default-package `Runner.java`.
+    """
+
+    def __init__(self, source_roots=DEFAULT_SOURCE_ROOTS):
+        # Longest roots first, so nested roots win over their parents
+        self.source_roots = sorted((normalize_path(root) for root in source_roots), key=len, reverse=True)
+        self._by_path = {}
+        self._by_relative = {}
+        self._suffix_trie = _TrieNode()
+        # Number of PMD file entries the index was built from (duplicates included)
+        self.file_count = 0
+
+    @classmethod
+    def from_pmd_report(cls, pmd_data, source_roots=DEFAULT_SOURCE_ROOTS):
+        """Builds the index from a parsed PMD JSON report."""
+        index = cls(source_roots)
+        pmd_file_count = 0
+        if "files" in pmd_data and isinstance(pmd_data.get("files"), list):
+            for file_report in pmd_data.get("files", []):
+                original_filename = file_report.get("filename")
+                if not original_filename:
+                    print(f"Warning: PMD file report found without a 'filename' field. Skipping.")
+                    continue
+
+                entry = index.add(original_filename)
+                violations = file_report.get("violations", [])
+                if isinstance(violations, list):
+                    entry.violations.extend(violations)
+                else:
+                    print(
+                        f"Warning: PMD violations for '{original_filename}' is not a list. Skipping violations for this file.")
+
+                pmd_file_count += 1
+            print(f"Processed {pmd_file_count} file entries from PMD report.")
+        else:
+            print("Warning: 'files' key not found or not a list in PMD report. No PMD violations to merge.")
+        index.file_count = pmd_file_count
+        return index
+
+    def __len__(self):
+        return len(self._by_path)
+
+    def entries(self):
+        return self._by_path.values()
+
+    def relative_path(self, normalized_path):
+        for root in self.source_roots:
+            if normalized_path.startswith(root + "/"):
+                return normalized_path[len(root) + 1:]
+        return None
+
+    def add(self, filename):
+        """Returns the entry for `filename`, creating and indexing it on first use."""
+        normalized = normalize_path(filename)
+        entry = self._by_path.get(normalized)
+        if entry is not None:
+            return entry
+
+        entry = PmdFileEntry(filename, normalized, self.relative_path(normalized))
+        self._by_path[normalized] = entry
+
+        if entry.relative is not None:
+            first = self._by_relative.setdefault(entry.relative, entry)
+            if first is not entry:
+                print(f"Warning: PMD files '{first.filename}' and '{filename}' share the package-relative path "
+                      f"'{entry.relative}'. Joern paths will be matched to the first one.")
+                return entry
+            node = self._suffix_trie
+            for component in reversed(entry.relative.split("/")):
+                node.count += 1
+                node = node.children.setdefault(component, _TrieNode())
+            node.count += 1
+            node.entry = entry
+        return entry
+
+    def _package_relative(self, normalized_path):
+        relative = self.relative_path(normalized_path)
+        if relative is not None:
+            return relative
+        for source_dir in SOURCE_DIRS:
+            start = normalized_path.find("/" + source_dir + "/")
+            if start != -1:
+                return normalized_path[start + len(source_dir) + 2:]
+        return None
+
+    def resolve(self, joern_path):
+        """Returns the PMD entry for a Joern file path, or None if nothing matches."""
+        normalized = normalize_path(to_source_path(joern_path))
+        entry = self._by_path.get(normalized)
+        if entry is not None:
+            return entry
+
+        relative = self._package_relative(normalized)
+        if relative is not None:
+            return self._by_relative.get(relative)
+
+        node = self._suffix_trie
+        best = None
+        for component in reversed(normalized.split("/")):
+            node = node.children.get(component)
+            if node is None:
+                break
+            if node.entry is not None:
+                best = node
+        # Other entries below the match share its path as their suffix, e.g. `Runner.java` and
+        # `com/b/Runner.java` for `com/a/Runner.java`; which one the Joern path means is unknown
+        if best is None or best.count > 1:
+            return None
+        return best.entry
+
+    def unmatched(self):
+        return [entry for entry in self._by_path.values() if not entry.matched]
@@ -0,0 +1,332 @@
+import json
+import multiprocessing
+import os
+import re
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+STATUS_TIMED_OUT = "timed_out"
+STATUS_SKIPPED = "skipped"
+
+_MEMORY_UNITS = {"b": 1, "kib": 1024, "kb": 1000, "mib": 1024 ** 2, "mb": 1000 ** 2, "gib": 1024 ** 3, "gb": 1000 ** 3}
+_MEMORY_RE = re.compile(r"([\d.]+)\s*([a-zA-Z]+)")
+
+
+class StageOutcome:
+    """What a stage function reports back. Returning a plain bool is also accepted."""
+
+    def __init__(self, success, exit_code=None, peak_rss_kb=None, rss_source=None, detail=None):
+        self.success = success
+        self.exit_code = exit_code
+        self.peak_rss_kb = peak_rss_kb
+        self.rss_source = rss_source
+        self.detail = detail
+
+
+class Stage:
+    def __init__(self, name, func, depends_on=(), timeout=None, on_timeout=None):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.timeout = timeout
+        # Called when the stage exceeds its timeout, e.g. to kill the container it started
+        self.on_timeout = on_timeout
+
+
+class StageResult:
+    def __init__(self, name, status, started_at=None, wall_time_s=None, exit_code=None,
+                 peak_rss_kb=None, rss_source=None, detail=None):
+        self.name = name
+        self.status = status
+        self.started_at = started_at
+        self.wall_time_s = wall_time_s
+        self.exit_code = exit_code
+        self.peak_rss_kb = peak_rss_kb
+        self.rss_source = rss_source
+        self.detail = detail
+
+    @property
+    def succeeded(self):
+        return self.status == STATUS_SUCCEEDED
+
+    def describe(self):
+        if self.status == STATUS_SKIPPED:
+            return f"skipped ({self.detail})" if self.detail else "skipped"
+        text = f"{self.status} in {self.wall_time_s:.1f}s"
+        if self.peak_rss_kb is not None:
+            text += f", peak RSS {self.peak_rss_kb / 1024:.0f} MiB ({self.rss_source})"
+        if self.exit_code is not None and self.status != STATUS_SUCCEEDED:
+            text += f", exit code {self.exit_code}"
+        if self.detail and self.status != STATUS_SUCCEEDED:
+            text += f": {self.detail}"
+        return text
+
+    def to_dict(self):
+        return {
+            "status": self.status,
+            "started_at": self.started_at,
+            "wall_time_s": None if self.wall_time_s is None else round(self.wall_time_s, 3),
+            "exit_code": self.exit_code,
+            "peak_rss_kb": self.peak_rss_kb,
+            "rss_source": self.rss_source,
+            "detail": self.detail,
+        }
+
+
+def _process_peak_rss_kb():
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class PipelineScheduler:
+    """Runs stages in parallel as soon as all of their dependencies succeeded.
+
+    Dependents of a failed or timed out stage are skipped. Every stage records its wall time and
+    peak RSS: stages that run a command report their own measurement, in-process stages report
+    the high-water mark of this process when they finish.
+    """
+
+    def __init__(self, stages, max_workers=None):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            for dependency in stage.depends_on:
+                if dependency not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dependency}'")
+        # At least one worker, so a run without stages (e.g. cache hit, no upload) still completes
+        self.max_workers = max_workers or max(1, len(stages))
+        self.results = {}
+
+    def _run_stage(self, stage):
+        started = time.perf_counter()
+        try:
+            outcome = stage.func()
+        except Exception as e:
+            print(f"ERROR: Stage '{stage.name}' raised an unexpected error: {e}")
+            outcome = StageOutcome(False, detail=str(e))
+        if not isinstance(outcome, StageOutcome):
+            outcome = StageOutcome(bool(outcome))
+        if outcome.peak_rss_kb is None:
+            outcome.peak_rss_kb = _process_peak_rss_kb()
+            outcome.rss_source = "orchestrator process"
+        return outcome, time.perf_counter() - started
+
+    def _ready(self, stage):
+        return all(dep in self.results and self.results[dep].succeeded for dep in stage.depends_on)
+
+    def _blocked_by(self, stage):
+        for dep in stage.depends_on:
+            if dep in self.results and not self.results[dep].succeeded:
+                return dep
+        return None
+
+    def run(self):
+        pending = list(self.stages.values())
+        running = {}
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage")
+        try:
+            while pending or running:
+                for stage in list(pending):
+                    blocker = self._blocked_by(stage)
+                    if blocker is not None:
+                        pending.remove(stage)
+                        self.results[stage.name] = StageResult(stage.name, STATUS_SKIPPED,
+                                                               detail=f"'{blocker}' did not succeed")
+                        print(f"--- Stage '{stage.name}' skipped: dependency '{blocker}' did not succeed. ---")
+                    elif self._ready(stage):
+                        pending.remove(stage)
+                        print(f"\n--- Stage '{stage.name}' started. ---")
+                        started_at = datetime.now(timezone.utc).isoformat()
+                        deadline = time.monotonic() + stage.timeout if stage.timeout else None
+                        running[executor.submit(self._run_stage, stage)] = (stage, started_at, deadline)
+
+                if not running:
+                    if pending:
+                        # Only reachable with a dependency cycle
+                        for stage in pending:
+                            self.results[stage.name] = StageResult(stage.name, STATUS_SKIPPED,
+                                                                   detail="unresolvable dependencies")
+                        pending = []
+                    continue
+
+                deadlines = [deadline for _, _, deadline in running.values() if deadline is not None]
+                wait_timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                done, _ = wait(running, timeout=wait_timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    stage, started_at, _ = running.pop(future)
+                    outcome, wall_time = future.result()
+                    status = STATUS_SUCCEEDED if outcome.success else STATUS_FAILED
+                    self.results[stage.name] = StageResult(stage.name, status, started_at, wall_time,
+                                                           outcome.exit_code, outcome.peak_rss_kb,
+                                                           outcome.rss_source, outcome.detail)
+                    print(f"--- Stage '{stage.name}' {self.results[stage.name].describe()}. ---")
+
+                now = time.monotonic()
+                for future, (stage, started_at, deadline) in list(running.items()):
+                    if deadline is not None and now >= deadline:
+                        running.pop(future)
+                        print(f"ERROR: Stage '{stage.name}' exceeded its timeout of {stage.timeout}s.")
+                        if stage.on_timeout:
+                            stage.on_timeout()
+                        self.results[stage.name] = StageResult(stage.name, STATUS_TIMED_OUT, started_at,
+                                                               float(stage.timeout),
+                                                               detail=f"timeout of {stage.timeout}s exceeded")
+        finally:
+            # A stage without `on_timeout` cannot be interrupted, so do not wait for timed out ones
+            executor.shutdown(wait=False, cancel_futures=True)
+        return self.results
+
+    def all_succeeded(self):
+        return all(result.succeeded for result in self.results.values())
+
+    def write_report(self, report_path, extra=None):
+        report = {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "succeeded": self.all_succeeded(),
+            "stages": {name: self.results[name].to_dict() for name in self.stages if name in self.results},
+        }
+        if extra:
+            report.update(extra)
+        report_dir = os.path.dirname(report_path)
+        if report_dir:
+            os.makedirs(report_dir, exist_ok=True)
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Run report written to: {report_path}")
+
+
+def _call_in_child(func, sender):
+    try:
+        success = bool(func())
+    except Exception as e:
+        print(f"ERROR: Child process raised an unexpected error: {e}")
+        success = False
+    sender.send(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    sender.close()
+    sys.exit(0 if success else 1)
+
+
+class ChildProcess:
+    """Runs a function in a forked child process, so an in-process stage can be killed on timeout
+    like one that runs a command. The child shares the memory of this process at the time of the
+    fork, e.g. an index built by an earlier stage, without copying or pickling it.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._process = None
+        self._killed = False
+        self._lock = threading.Lock()
+
+    def run(self, func):
+        """Calls `func` in the child and returns a StageOutcome; `func` returns whether it succeeded."""
+        context = multiprocessing.get_context("fork")
+        receiver, sender = context.Pipe(duplex=False)
+        with self._lock:
+            if self._killed:
+                return StageOutcome(False, detail="killed before it started")
+            # Output still buffered here would be written again by the child
+            sys.stdout.flush()
+            sys.stderr.flush()
+            self._process = context.Process(target=_call_in_child, args=(func, sender), name=self.name, daemon=True)
+            self._process.start()
+        sender.close()
+        self._process.join()
+        try:
+            peak_rss_kb = receiver.recv() if receiver.poll() else None
+        except EOFError:
+            # Killed before it could report
+            peak_rss_kb = None
+        receiver.close()
+
+        exit_code = self._process.exitcode
+        if exit_code is None or exit_code < 0:
+            return StageOutcome(False, None, peak_rss_kb, "child process", "child process was killed")
+        return StageOutcome(exit_code == 0, exit_code, peak_rss_kb, "child process")
+
+    def kill(self):
+        with self._lock:
+            self._killed = True
+            if self._process is not None and self._process.is_alive():
+                print(f"Killing child process '{self.name}' (pid {self._process.pid})...")
+                self._process.kill()
+
+
+def parse_memory_kb(text):
+    """Parses docker stats memory values like '1.5GiB' or '300MB' into KiB."""
+    match = _MEMORY_RE.match(text.strip())
+    if not match:
+        return None
+    unit = _MEMORY_UNITS.get(match.group(2).lower())
+    if unit is None:
+        return None
+    return int(float(match.group(1)) * unit / 1024)
+
+
+class ContainerMemorySampler:
+    """Polls `docker stats` for a named container and keeps the highest memory usage seen."""
+
+    def __init__(self, container_name, interval=1.0):
+        self.container_name = container_name
+        self.interval = interval
+        self.peak_kb = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name=f"stats-{container_name}", daemon=True)
+
+    def _sample(self):
+        while not self._stop.is_set():
+            try:
+                process = subprocess.run(
+                    ["docker", "stats", "--no-stream", "--format", "{{.MemUsage}}", self.container_name],
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=30)
+                usage_kb = parse_memory_kb(process.stdout.split("/")[0]) if process.stdout else None
+                if usage_kb is not None and (self.peak_kb is None or usage_kb > self.peak_kb):
+                    self.peak_kb = usage_kb
+            except (subprocess.SubprocessError, FileNotFoundError):
+                pass
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 30)
+
+
+def run_measured_command(command_list, cwd=None, timeout=None):
+    """Runs a command with inherited stdout/stderr. Returns its exit code and peak RSS in KiB.
+
+    The exit code is None if the command could not be started or was killed after `timeout`.
+    """
+    print(f"\nRunning command: {' '.join(command_list)}")
+    try:
+        process = subprocess.Popen(command_list, cwd=cwd)
+    except FileNotFoundError:
+        print(f"ERROR: Command not found: '{command_list[0]}'. Is it installed and in PATH?")
+        return None, None
+
+    timer = None
+    if timeout:
+        timer = threading.Timer(timeout, process.kill)
+        timer.daemon = True
+        timer.start()
+    try:
+        # wait4 reports the resource usage of exactly this child
+        _, wait_status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(wait_status)
+    finally:
+        if timer:
+            timer.cancel()
+
+    if process.returncode < 0:
+        return None, rusage.ru_maxrss
+    return process.returncode, rusage.ru_maxrss
@@ -1,38 +1,358 @@
+import hashlib
+import json
 import os
+import re
+import shutil
+import tempfile
+import uuid
+import zlib
+from datetime import datetime, timezone
+
 from flask import Flask, request, jsonify
 
+from upload_metrics import UploadMetrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 app = Flask(__name__)
-UPLOAD_FOLDER = '/uploads'
+UPLOAD_FOLDER = os.environ.get('RECEIVER_UPLOAD_FOLDER', '/uploads')
+SESSIONS_FOLDER = os.path.join(UPLOAD_FOLDER, '.sessions')
+# Per-container, so counters of workers from a previous container are never picked up
+METRICS_FOLDER = os.environ.get('RECEIVER_METRICS_FOLDER', os.path.join(tempfile.gettempdir(), 'receiver_metrics'))
+STREAM_BLOCK_SIZE = 1024 * 1024
 
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(SESSIONS_FOLDER, exist_ok=True)
 
+metrics = UploadMetrics(METRICS_FOLDER)
+
+
+# Content types accepted for merged graphs and the file name they are saved under
+GRAPH_CONTENT_TYPES = {
+    'application/json': 'received_graph.json',
+    'application/x-cpg-graph': 'received_graph.cpgz',
+}
+
+CONTENT_ENCODINGS = ('gzip', 'zstd', 'identity')
+DECODE_ERRORS = (zlib.error,) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+UPLOAD_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+SESSION_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+UPLOAD_INFO_NAME = 'upload.json'
+
+
+class UploadRejected(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _error(message, status_code, **extra):
+    return jsonify({"status": "error", "message": message, **extra}), status_code
+
+
+def _decompressor(content_encoding):
+    """The decompress and flush functions for an encoding, and one that tells whether the end of
+    the compressed stream was reached. A truncated body decompresses without an error otherwise."""
+    if content_encoding == 'gzip':
+        decompressor = zlib.decompressobj(31)
+        return decompressor.decompress, decompressor.flush, lambda: decompressor.eof
+    if content_encoding == 'zstd':
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        return decompressor.decompress, decompressor.flush, lambda: decompressor.eof
+    return (lambda data: data), (lambda: b''), (lambda: True)
+
+
+def _check_encoding(content_encoding):
+    if content_encoding not in CONTENT_ENCODINGS or (content_encoding == 'zstd' and zstandard is None):
+        raise UploadRejected(f"Unsupported content encoding: {content_encoding}", 415)
+
+
+def _iter_request_body():
+    """Yields the request body in blocks straight from the WSGI input, counting them for the metrics."""
+    for block in iter(lambda: request.stream.read(STREAM_BLOCK_SIZE), b''):
+        metrics.bytes_received(len(block))
+        yield block
 
-@app.route('/api/upload-graph', methods=['POST'])
-def upload_graph():
-    if 'application/json' not in request.content_type:
-        return jsonify({"status": "error", "message": "Content-Type must be application/json"}), 415
 
-    if not request.data:
-        return jsonify({"status": "error", "message": "No data received"}), 400
+def _upload_dir(upload_id):
+    return os.path.join(UPLOAD_FOLDER, upload_id)
 
-    file_size = len(request.data)
-    print(f"Received file. Content-Type: {request.content_type}, Size: {file_size} bytes")
 
+def _load_upload_info(upload_id):
     try:
-        save_path = os.path.join(UPLOAD_FOLDER, 'received_graph.json')
-        with open(save_path, 'wb') as f:
-            f.write(request.data)
-        print(f"Saved received file to {save_path}")
-    except IOError as e:
-        print(f"Error saving received file: {e}")
-        return jsonify({"status": "error", "message": f"Could not save file on server: {e}"}), 500
+        with open(os.path.join(_upload_dir(upload_id), UPLOAD_INFO_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def store_upload(upload_id, content_type, content_encoding, blocks, verify=None):
+    """Decompresses `blocks` into a temp file next to the final one and renames it into place.
+
+    `verify` is called once all blocks are written and may raise UploadRejected to keep the
+    previous file.
 
+    Returns the upload info that is also saved as `<upload_id>/upload.json`. A concurrent upload
+    with another ID never touches this one's files, and readers never see a partially written graph.
+    """
+    upload_dir = _upload_dir(upload_id)
+    os.makedirs(upload_dir, exist_ok=True)
+    save_path = os.path.join(upload_dir, GRAPH_CONTENT_TYPES[content_type])
+    decompress, flush, complete = _decompressor(content_encoding)
+    received_bytes = 0
+    stored_bytes = 0
+    fd, temp_path = tempfile.mkstemp(dir=upload_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for block in blocks:
+                received_bytes += len(block)
+                data = decompress(block)
+                stored_bytes += len(data)
+                out.write(data)
+            data = flush()
+            stored_bytes += len(data)
+            out.write(data)
+        if not complete():
+            raise UploadRejected(f"Truncated {content_encoding} body", 400)
+        if stored_bytes == 0:
+            raise UploadRejected("No data received", 400)
+        if verify is not None:
+            verify()
+        os.replace(temp_path, save_path)
+    except DECODE_ERRORS as e:
+        raise UploadRejected(f"Could not decode {content_encoding} body: {e}", 400)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+            # Do not leave an empty directory behind for a new ID whose first upload failed
+            if not os.listdir(upload_dir):
+                os.rmdir(upload_dir)
+
+    info = {
+        "upload_id": upload_id,
+        "content_type": content_type,
+        "content_encoding": content_encoding,
+        "file": os.path.basename(save_path),
+        "size": stored_bytes,
+        "received_bytes": received_bytes,
+        "received_at": datetime.now(timezone.utc).isoformat(),
+    }
+    with open(os.path.join(upload_dir, UPLOAD_INFO_NAME), 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    print(f"Saved received file to {save_path} ({received_bytes} bytes received, {stored_bytes} bytes stored)")
+    return info
+
+
+def _received_response(info):
     return jsonify({
         "status": "received",
-        "size": file_size,
+        "upload_id": info["upload_id"],
+        "size": info["size"],
+        "received_bytes": info["received_bytes"],
         "message": "Graph data received successfully."
     }), 200
 
 
+@app.route('/api/upload-graph', methods=['POST'])
+def upload_graph():
+    content_type = (request.content_type or '').split(';')[0].strip()
+    if content_type not in GRAPH_CONTENT_TYPES:
+        return _error(f"Content-Type must be one of {', '.join(GRAPH_CONTENT_TYPES)}", 415)
+
+    # Clients may choose the ID, so a retried upload replaces its earlier attempt instead of adding a new one
+    upload_id = request.headers.get('X-Upload-Id') or uuid.uuid4().hex
+    if not UPLOAD_ID_RE.match(upload_id):
+        return _error("X-Upload-Id may only contain letters, digits, '-' and '_' (max. 64)", 400)
+    content_encoding = (request.headers.get('Content-Encoding') or 'identity').strip().lower()
+
+    print(f"Receiving upload {upload_id}. Content-Type: {request.content_type}, "
+          f"Content-Encoding: {content_encoding}, Content-Length: {request.content_length}")
+    metrics.transfer_started()
+    info = None
+    try:
+        _check_encoding(content_encoding)
+        info = store_upload(upload_id, content_type, content_encoding, _iter_request_body())
+    except UploadRejected as e:
+        return _error(str(e), e.status_code)
+    except IOError as e:
+        print(f"Error saving received file: {e}")
+        return _error(f"Could not save file on server: {e}", 500)
+    finally:
+        metrics.transfer_finished()
+        metrics.upload_finished(info is not None, info["size"] if info else 0)
+
+    return _received_response(info)
+
+
+@app.route('/api/uploads', methods=['GET'])
+def list_uploads():
+    uploads = []
+    for name in os.listdir(UPLOAD_FOLDER):
+        if UPLOAD_ID_RE.match(name):
+            info = _load_upload_info(name)
+            if info is not None:
+                uploads.append(info)
+    uploads.sort(key=lambda info: info["received_at"], reverse=True)
+    return jsonify({"uploads": uploads}), 200
+
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    info = _load_upload_info(upload_id) if UPLOAD_ID_RE.match(upload_id) else None
+    if info is None:
+        return _error("Unknown upload", 404)
+    return jsonify(info), 200
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify(metrics.snapshot()), 200
+
+
+# Chunked upload protocol used by orchestrate.py (see exporter/chunked_upload.py)
+
+def _session_dir(session_id):
+    if not SESSION_ID_RE.match(session_id):
+        return None
+    path = os.path.join(SESSIONS_FOLDER, session_id)
+    return path if os.path.isdir(path) else None
+
+
+def _load_session(session_dir):
+    with open(os.path.join(session_dir, 'session.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _part_path(session_dir, part_number):
+    return os.path.join(session_dir, f'{part_number:06d}.part')
+
+
+def _received_parts(session_dir):
+    parts = {}
+    for name in os.listdir(session_dir):
+        if name.endswith('.part.sha256'):
+            with open(os.path.join(session_dir, name), 'r') as f:
+                parts[str(int(name.split('.', 1)[0]))] = f.read().strip()
+    return parts
+
+
+@app.route('/api/upload-graph/sessions', methods=['POST'])
+def create_upload_session():
+    params = request.get_json(silent=True) or {}
+    content_type = params.get('content_type')
+    content_encoding = params.get('content_encoding', 'identity')
+    if content_type not in GRAPH_CONTENT_TYPES:
+        return _error(f"content_type must be one of {', '.join(GRAPH_CONTENT_TYPES)}", 415)
+    try:
+        _check_encoding(content_encoding)
+    except UploadRejected as e:
+        return _error(str(e), e.status_code)
+
+    session_id = uuid.uuid4().hex
+    session_dir = os.path.join(SESSIONS_FOLDER, session_id)
+    os.makedirs(session_dir)
+    with open(os.path.join(session_dir, 'session.json'), 'w', encoding='utf-8') as f:
+        json.dump({"content_type": content_type, "content_encoding": content_encoding}, f)
+    print(f"Created upload session {session_id} ({content_type}, {content_encoding})")
+    return jsonify({"session_id": session_id}), 201
+
+
+@app.route('/api/upload-graph/sessions/<session_id>', methods=['GET'])
+def get_upload_session(session_id):
+    session_dir = _session_dir(session_id)
+    if session_dir is None:
+        return _error("Unknown upload session", 404)
+    return jsonify({"session_id": session_id, **_load_session(session_dir),
+                    "parts": _received_parts(session_dir)}), 200
+
+
+@app.route('/api/upload-graph/sessions/<session_id>/parts/<int:part_number>', methods=['PUT'])
+def upload_part(session_id, part_number):
+    session_dir = _session_dir(session_id)
+    if session_dir is None:
+        return _error("Unknown upload session", 404)
+    if part_number < 1:
+        return _error("Part numbers start at 1", 400)
+    expected_checksum = (request.headers.get('X-Part-SHA256') or '').lower()
+
+    # The body is written to disk as it arrives instead of being buffered by Flask
+    part_path = _part_path(session_dir, part_number)
+    temp_path = f'{part_path}.{uuid.uuid4().hex}.tmp'
+    digest = hashlib.sha256()
+    size = 0
+    metrics.transfer_started()
+    try:
+        with open(temp_path, 'wb') as f:
+            for block in _iter_request_body():
+                digest.update(block)
+                f.write(block)
+                size += len(block)
+        checksum = digest.hexdigest()
+        if expected_checksum and checksum != expected_checksum:
+            os.remove(temp_path)
+            return _error("Part checksum mismatch", 422, sha256=checksum)
+        os.replace(temp_path, part_path)
+        with open(part_path + '.sha256', 'w') as f:
+            f.write(checksum)
+    except IOError as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        print(f"Error saving part {part_number} of session {session_id}: {e}")
+        return _error(f"Could not save part on server: {e}", 500)
+    finally:
+        metrics.transfer_finished()
+
+    return jsonify({"part": part_number, "size": size, "sha256": checksum}), 200
+
+
+def _iter_parts(session_dir, part_count, digest):
+    for n in range(1, part_count + 1):
+        with open(_part_path(session_dir, n), 'rb') as part:
+            for block in iter(lambda: part.read(STREAM_BLOCK_SIZE), b''):
+                digest.update(block)
+                yield block
+
+
+@app.route('/api/upload-graph/sessions/<session_id>/complete', methods=['POST'])
+def complete_upload_session(session_id):
+    session_dir = _session_dir(session_id)
+    if session_dir is None:
+        return _error("Unknown upload session", 404)
+    params = request.get_json(silent=True) or {}
+    session = _load_session(session_dir)
+    part_count = params.get('parts')
+    if not isinstance(part_count, int) or part_count < 1:
+        return _error("'parts' must be a positive integer", 400)
+
+    missing = [n for n in range(1, part_count + 1) if not os.path.exists(_part_path(session_dir, n))]
+    if missing:
+        return _error("Missing parts", 409, missing=missing)
+
+    digest = hashlib.sha256()
+
+    def verify_checksum():
+        if params.get('sha256') and params['sha256'] != digest.hexdigest():
+            raise UploadRejected("Upload checksum mismatch", 422)
+
+    info = None
+    try:
+        info = store_upload(session_id, session['content_type'], session['content_encoding'],
+                            _iter_parts(session_dir, part_count, digest), verify=verify_checksum)
+    except UploadRejected as e:
+        return _error(str(e), e.status_code)
+    except IOError as e:
+        print(f"Error assembling upload session {session_id}: {e}")
+        return _error(f"Could not assemble upload: {e}", 500)
+    finally:
+        metrics.upload_finished(info is not None, info["size"] if info else 0)
+
+    shutil.rmtree(session_dir, ignore_errors=True)
+    return _received_response(info)
+
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Development server only; the container serves the app with gunicorn (see Dockerfile.receiver)
+    app.run(debug=os.environ.get('RECEIVER_DEBUG') == '1', host='0.0.0.0', port=5000, threaded=True)
@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+import time
+
+# Seconds of history used for the bytes/s figures
+DEFAULT_WINDOW_SECONDS = 60
+
+
+class UploadMetrics:
+    """Throughput and in-flight counters shared by all worker processes of the receiver.
+
+    Every process keeps its own counters, with received bytes bucketed per second, and writes them
+    to `<metrics_dir>/<pid>.json` at most once per second. `snapshot` sums the files of all live
+    workers, so the figures are correct no matter which worker serves the metrics request.
+    """
+
+    def __init__(self, metrics_dir, window_seconds=DEFAULT_WINDOW_SECONDS):
+        self.metrics_dir = metrics_dir
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._in_flight = 0
+        self._uploads_total = 0
+        self._uploads_failed = 0
+        self._bytes_received_total = 0
+        self._bytes_stored_total = 0
+        self._buckets = {}
+        self._last_flush = 0.0
+        os.makedirs(metrics_dir, exist_ok=True)
+
+    def _check_fork(self):
+        # Counters inherited from the gunicorn master belong to another process
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._in_flight = self._uploads_total = self._uploads_failed = 0
+            self._bytes_received_total = self._bytes_stored_total = 0
+            self._buckets = {}
+
+    def transfer_started(self):
+        """A request body (a whole upload or one part of it) started streaming in."""
+        with self._lock:
+            self._check_fork()
+            self._in_flight += 1
+            self._flush(force=True)
+
+    def transfer_finished(self):
+        with self._lock:
+            self._check_fork()
+            self._in_flight -= 1
+            self._flush(force=True)
+
+    def bytes_received(self, size):
+        now = int(time.time())
+        with self._lock:
+            self._check_fork()
+            self._bytes_received_total += size
+            self._buckets[now] = self._buckets.get(now, 0) + size
+            self._flush()
+
+    def upload_finished(self, success, stored_bytes=0):
+        with self._lock:
+            self._check_fork()
+            if success:
+                self._uploads_total += 1
+                self._bytes_stored_total += stored_bytes
+            else:
+                self._uploads_failed += 1
+            self._flush(force=True)
+
+    def _flush(self, force=False):
+        now = time.time()
+        if not force and now - self._last_flush < 1.0:
+            return
+        self._last_flush = now
+        oldest = int(now) - self.window_seconds
+        self._buckets = {second: size for second, size in self._buckets.items() if second > oldest}
+        state = {
+            "in_flight": self._in_flight,
+            "uploads_total": self._uploads_total,
+            "uploads_failed": self._uploads_failed,
+            "bytes_received_total": self._bytes_received_total,
+            "bytes_stored_total": self._bytes_stored_total,
+            "buckets": self._buckets,
+        }
+        path = os.path.join(self.metrics_dir, f"{self._pid}.json")
+        temp_path = f"{path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(temp_path, path)
+        except IOError as e:
+            print(f"Warning: Could not write upload metrics to {path}: {e}")
+
+    def snapshot(self):
+        with self._lock:
+            self._check_fork()
+            self._flush(force=True)
+
+        now = int(time.time())
+        totals = {"workers": 0, "in_flight": 0, "uploads_total": 0, "uploads_failed": 0,
+                  "bytes_received_total": 0, "bytes_stored_total": 0}
+        window_bytes = 0
+        last_second_bytes = 0
+        for name in os.listdir(self.metrics_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.metrics_dir, name)
+            if not _process_alive(int(name[:-len(".json")])):
+                os.remove(path)
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except (IOError, ValueError):
+                continue
+            totals["workers"] += 1
+            for key in ("in_flight", "uploads_total", "uploads_failed", "bytes_received_total", "bytes_stored_total"):
+                totals[key] += state.get(key, 0)
+            for second, size in state.get("buckets", {}).items():
+                age = now - int(second)
+                if 0 <= age < self.window_seconds:
+                    window_bytes += size
+                if age == 1:
+                    last_second_bytes += size
+
+        totals["window_seconds"] = self.window_seconds
+        totals["bytes_per_second"] = round(window_bytes / self.window_seconds, 1)
+        totals["bytes_per_second_last_second"] = last_second_bytes
+        return totals
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
@@ -0,0 +1,22 @@
+from analysis_cache import collect_tool_versions
+
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_custom_merge_script_is_part_of_the_tool_versions(tmp_path):
+    compose_file = write(tmp_path / "docker-compose.yml", "services:\n  mock_receiver:\n    build: receiver\n")
+    custom = tmp_path / "custom"
+    custom.mkdir()
+    merge_script = write(custom / "my_merge.py", "VERSION = 1\n")
+    write(custom / "path_index.py", "INDEX = 1\n")
+
+    before = collect_tool_versions(compose_file, merge_script, "graphson")
+    write(custom / "my_merge.py", "VERSION = 2\n")
+    after_script = collect_tool_versions(compose_file, merge_script, "graphson")
+    write(custom / "path_index.py", "INDEX = 2\n")
+    after_helper = collect_tool_versions(compose_file, merge_script, "graphson")
+
+    assert before != after_script != after_helper
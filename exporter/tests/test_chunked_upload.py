@@ -0,0 +1,93 @@
+import gzip
+import json
+
+import pytest
+
+import chunked_upload
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body or {}
+        self.text = json.dumps(self.body)
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise AssertionError(f"unexpected status {self.status_code}")
+
+
+class FakeReceiver:
+    """Stands in for the HTTP session of a ChunkedUploader and serves the session protocol in memory."""
+
+    def __init__(self, sessions=True, drop_session_after_parts=None):
+        self.sessions_supported = sessions
+        self.drop_session_after_parts = drop_session_after_parts
+        self.sessions = {}
+        self.created = 0
+        self.part_puts = 0
+
+    def request(self, method, url, timeout=None, json=None, data=None, headers=None):
+        path = url.split("/sessions", 1)[1].strip("/").split("/") if "/sessions" in url else None
+        if not self.sessions_supported or path is None:
+            return FakeResponse(404)
+        if method == "POST" and path == [""]:
+            self.created += 1
+            session_id = f"s{self.created}"
+            self.sessions[session_id] = {}
+            return FakeResponse(201, {"session_id": session_id})
+        session = self.sessions.get(path[0])
+        if session is None:
+            return FakeResponse(404)
+        if method == "PUT":
+            self.part_puts += 1
+            session[path[2]] = data
+            if self.part_puts == self.drop_session_after_parts:
+                del self.sessions[path[0]]
+            return FakeResponse(200)
+        if method == "POST" and path[1] == "complete":
+            return FakeResponse(200, {"status": "received", "parts": len(session), "session_id": path[0]})
+        return FakeResponse(200, {"parts": {}})
+
+    def close(self):
+        pass
+
+
+def uploader_for(receiver):
+    uploader = chunked_upload.ChunkedUploader("http://receiver/api/upload-graph", workers=1, part_size=64,
+                                              encoding=chunked_upload.ENCODING_IDENTITY, retries=1)
+    uploader.session = receiver
+    return uploader
+
+
+@pytest.fixture
+def graph_file(tmp_path):
+    path = tmp_path / "merged_graph.json"
+    path.write_bytes(b'{"vertices": [' + b'{"id": 1},' * 40 + b'{}]}')
+    return str(path)
+
+
+def test_missing_sessions_endpoint_means_chunked_uploads_are_unsupported(graph_file):
+    with pytest.raises(chunked_upload.ChunkedUploadsUnsupported):
+        uploader_for(FakeReceiver(sessions=False)).upload(graph_file, "application/json")
+
+
+def test_session_dropped_mid_upload_is_restarted(graph_file):
+    receiver = FakeReceiver(drop_session_after_parts=2)
+
+    result = uploader_for(receiver).upload(graph_file, "application/json")
+
+    parts = len(list(chunked_upload.iter_compressed_parts(graph_file, chunked_upload.ENCODING_IDENTITY, 64)))
+    assert receiver.created == 2
+    assert result == {"status": "received", "parts": parts, "session_id": "s2"}
+
+
+def test_compressed_blocks_form_one_stream():
+    blocks = [b'{"vertices": [', b'{"id": 1},' * 100, b'{}]}']
+
+    compressed = b"".join(chunked_upload.iter_compressed(blocks, chunked_upload.ENCODING_GZIP))
+
+    assert gzip.decompress(compressed) == b"".join(blocks)
@@ -0,0 +1,37 @@
+import json
+
+import graph_codec
+
+GRAPH = {
+    "@type": "tinker:graph",
+    "@value": {
+        "vertices": [
+            {"id": {"@type": "g:Int64", "@value": 1}, "label": "FILE",
+             "properties": {"NAME": [{"id": 7, "value": "src/main/java/Café.java"}],
+                            "pmd_violations": [{"rule": "UnusedImport", "beginline": 3}]}},
+            {"id": {"@type": "g:Int64", "@value": 2}, "label": "METHOD", "properties": {}},
+        ],
+        "edges": [{"id": 3, "label": "AST", "outV": 1, "inV": 2}],
+        "meta": {"nested": [1, 2.5, None, True, "x"]},
+    },
+}
+
+
+def test_compact_file_round_trips(tmp_path):
+    path = str(tmp_path / "graph.cpgz")
+    graph_codec.write_compact(GRAPH, path)
+
+    assert graph_codec.is_compact_file(path)
+    assert graph_codec.read_compact(path) == GRAPH
+    assert list(graph_codec.iter_vertices(path)) == GRAPH["@value"]["vertices"]
+    assert list(graph_codec.iter_edges(path)) == GRAPH["@value"]["edges"]
+
+
+def test_compact_file_streams_as_graphson(tmp_path):
+    path = str(tmp_path / "graph.cpgz")
+    graph_codec.write_compact(GRAPH, path)
+
+    blocks = list(graph_codec.iter_graphson(path, block_size=64))
+
+    assert len(blocks) > 1
+    assert json.loads(b"".join(blocks)) == GRAPH
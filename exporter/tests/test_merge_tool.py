@@ -0,0 +1,66 @@
+import json
+import os
+
+import graph_codec
+import merge_tool
+
+PMD_REPORT = {"files": [{"filename": "/sources/src/main/java/org/example/Runner.java",
+                         "violations": [{"rule": "UnusedImport", "beginline": 3, "endline": 3}]}]}
+JOERN_EXPORT = {
+    "@type": "tinker:graph",
+    "@value": {
+        "vertices": [
+            {"id": {"@type": "g:Int64", "@value": 1}, "label": "FILE",
+             "properties": {"NAME": {"@type": "g:List",
+                                     "@value": ["/workspace/src/main/java/org/example/Runner.java"]}}},
+            {"id": {"@type": "g:Int64", "@value": 2}, "label": "METHOD", "properties": {"NAME": "main"}},
+        ],
+        "edges": [{"id": 3, "label": "AST", "outV": 1, "inV": 2}],
+    },
+}
+
+
+def write_inputs(tmp_path, joern_text=None):
+    pmd_path, joern_path = str(tmp_path / "pmd.json"), str(tmp_path / "joern.json")
+    with open(pmd_path, "w", encoding="utf-8") as f:
+        json.dump(PMD_REPORT, f)
+    with open(joern_path, "w", encoding="utf-8") as f:
+        f.write(joern_text if joern_text is not None else json.dumps(JOERN_EXPORT, indent=2))
+    return pmd_path, joern_path
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_streaming_merge_writes_the_same_graph_as_the_in_memory_merge(tmp_path):
+    pmd_path, joern_path = write_inputs(tmp_path)
+    streamed, loaded = str(tmp_path / "streamed.json"), str(tmp_path / "loaded.json")
+
+    assert merge_tool.merge_reports(pmd_path, joern_path, streamed, stream=True)
+    assert merge_tool.merge_reports(pmd_path, joern_path, loaded, stream=False)
+
+    assert load(streamed) == load(loaded)
+    file_vertex = load(streamed)["@value"]["vertices"][0]
+    assert file_vertex["properties"]["pmd_violations"] == PMD_REPORT["files"][0]["violations"]
+
+
+def test_streaming_merge_writes_compact_output(tmp_path):
+    pmd_path, joern_path = write_inputs(tmp_path)
+    graphson, compact = str(tmp_path / "merged.json"), str(tmp_path / "merged.cpgz")
+
+    assert merge_tool.merge_reports(pmd_path, joern_path, graphson, stream=True)
+    assert merge_tool.merge_reports(pmd_path, joern_path, compact, stream=True,
+                                    output_format=merge_tool.OUTPUT_FORMAT_COMPACT)
+
+    assert graph_codec.read_compact(compact) == load(graphson)
+
+
+def test_truncated_export_leaves_no_output(tmp_path):
+    pmd_path, joern_path = write_inputs(tmp_path, json.dumps(JOERN_EXPORT)[:-20])
+    output = str(tmp_path / "merged.json")
+
+    assert not merge_tool.merge_reports(pmd_path, joern_path, output, stream=True)
+    assert not os.path.exists(output)
+    assert not os.path.exists(output + ".part")
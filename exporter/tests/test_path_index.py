@@ -0,0 +1,31 @@
+from path_index import PmdPathIndex
+
+DEFAULT_PACKAGE_RUNNER = "/sources/src/main/java/Runner.java"
+EXAMPLE_RUNNER = "/sources/src/main/java/org/example/Runner.java"
+
+
+def index_of(*filenames):
+    return PmdPathIndex.from_pmd_report({"files": [{"filename": name, "violations": []} for name in filenames]})
+
+
+def test_same_named_classes_resolve_to_their_own_package():
+    index = index_of(DEFAULT_PACKAGE_RUNNER, EXAMPLE_RUNNER)
+
+    assert index.resolve("/sources/src/main/java/Runner.java").filename == DEFAULT_PACKAGE_RUNNER
+    assert index.resolve("/tmp/jimple2cpg-1/org/example/Runner$Inner.class").filename == EXAMPLE_RUNNER
+    assert index.resolve("/workspace/src/main/java/org/example/Runner.java").filename == EXAMPLE_RUNNER
+
+
+def test_file_name_alone_does_not_match_another_package():
+    index = index_of(DEFAULT_PACKAGE_RUNNER, EXAMPLE_RUNNER)
+
+    # Below a source directory, the whole package-relative path has to match
+    assert index.resolve("/workspace/src/main/java/org/other/Runner.java") is None
+    # Without one, `Runner.java` and `org/example/Runner.java` both end the path; neither is taken
+    assert index.resolve("/tmp/jimple2cpg-1/org/other/Runner.class") is None
+
+
+def test_unique_suffix_resolves_without_source_root():
+    index = index_of(EXAMPLE_RUNNER)
+
+    assert index.resolve("/tmp/jimple2cpg-1/org/example/Runner.class").filename == EXAMPLE_RUNNER
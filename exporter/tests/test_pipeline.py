@@ -0,0 +1,50 @@
+import time
+
+from pipeline import STATUS_SKIPPED, STATUS_TIMED_OUT, ChildProcess, PipelineScheduler, Stage
+
+
+def test_run_without_stages_completes():
+    scheduler = PipelineScheduler([])
+
+    assert scheduler.run() == {}
+    assert scheduler.all_succeeded()
+
+
+def test_dependents_of_failed_stage_are_skipped():
+    ran = []
+    scheduler = PipelineScheduler([
+        Stage("lint", lambda: False),
+        Stage("pmd_index", lambda: ran.append("pmd_index") or True, depends_on=["lint"]),
+        Stage("joern", lambda: ran.append("joern") or True),
+    ])
+
+    results = scheduler.run()
+
+    assert ran == ["joern"]
+    assert results["pmd_index"].status == STATUS_SKIPPED
+    assert results["joern"].succeeded
+
+
+def test_child_process_sees_the_parent_memory():
+    shared = {"index": {"Runner.java": ["UnusedImport"]}}
+    child = ChildProcess("merge")
+
+    outcome = child.run(lambda: shared["index"]["Runner.java"] == ["UnusedImport"])
+
+    assert outcome.success
+    assert outcome.exit_code == 0
+    assert outcome.peak_rss_kb
+
+
+def test_timed_out_child_process_is_killed():
+    child = ChildProcess("merge")
+    scheduler = PipelineScheduler([Stage("merge", lambda: child.run(lambda: time.sleep(60)),
+                                         timeout=0.5, on_timeout=child.kill)])
+
+    started = time.monotonic()
+    results = scheduler.run()
+    child._process.join(timeout=5)
+
+    assert results["merge"].status == STATUS_TIMED_OUT
+    assert not child._process.is_alive()
+    assert time.monotonic() - started < 10